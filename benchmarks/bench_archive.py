@@ -0,0 +1,180 @@
+"""
+過去の予約のアーカイブのベンチマーク
+過去の予約（履歴）の件数ごとに、全件をreservationsに残したままの場合と、アーカイブへ移した後で、
+起動時のインデックス構築・重複チェック・予約の作成・リマインダーの取得・確認の一覧にかかる時間を比較する。
+アーカイブ中に並行して予約を作成し、書き込みが待たされる時間も測る
+
+    python benchmarks/bench_archive.py --history 10000,100000,1000000 --future 2000 --pause 0.01
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-archive-"), "reservations.db")
+
+import archiver  # noqa: E402
+import database  # noqa: E402
+from epoch import to_epoch  # noqa: E402
+
+# 1日あたりの過去の予約数
+PER_DAY = 200
+
+
+def open_database(history: int):
+    """履歴の件数ごとに新しいDBファイルに切り替える"""
+    database.DATABASE_PATH = os.path.join(os.path.dirname(os.environ["DATABASE_PATH"]), f"history-{history}.db")
+    database.close_connections()
+    database.init_db()
+
+
+def seed(history: int, future: int, today: datetime) -> datetime:
+    """終了済みの予約をhistory件（1日PER_DAY件、アーカイブの対象日以前）、未来の予約をfuture件作成し、履歴の最初の日を返す"""
+    rng = random.Random(0)
+    last_day = archiver.archive_cutoff(today) - timedelta(days=1)
+    first_day = last_day - timedelta(days=history // PER_DAY)
+
+    def rows():
+        for i in range(history):
+            s = first_day + timedelta(days=i // PER_DAY, minutes=7 * 60 + 5 * (i % PER_DAY))
+            yield f"U{i % 500}", f"past {i}", s, s + timedelta(minutes=30), True
+        for i in range(future):
+            s = today + timedelta(days=1 + rng.randrange(365), hours=7, minutes=30 * rng.randrange(20))
+            yield f"U{i % 500}", f"future {i}", s, s + timedelta(minutes=30), False
+
+    conn = database.get_connection()
+    # 大量の投入は変更履歴に残さない（投入後にトリガーを作り直し、init_dbで読み直す）
+    trigger = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'reservations_log_insert'").fetchone()[0]
+    with conn:
+        conn.execute("DROP TRIGGER reservations_log_insert")
+        conn.executemany("""
+            INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes, reminder_sent, remind_at)
+            VALUES (?, 'user', 'C1', ?, ?, ?, 15, ?, ?)
+        """, (
+            (user_id, name, to_epoch(s), to_epoch(e), sent, to_epoch(s - timedelta(minutes=15)))
+            for user_id, name, s, e, sent in rows()
+        ))
+        conn.execute(trigger)
+    return first_day
+
+
+def percentiles(latencies: list[float]) -> tuple[float, float]:
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return cuts[49], cuts[98]
+
+
+def measure(call, iterations: int) -> tuple[float, float]:
+    latencies = []
+    for _ in range(iterations):
+        t = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - t) * 1000)
+    return percentiles(latencies)
+
+
+def hot_path(today: datetime, past_day: datetime, iterations: int) -> dict[str, tuple[float, float]]:
+    """よく使う処理のp50・p99（ms）"""
+    rng = random.Random(1)
+    days = [today + timedelta(days=1 + rng.randrange(365)) for _ in range(iterations * 2)]
+    it = iter(days)
+
+    def reserve_and_cancel():
+        day = next(it).replace(hour=22)
+        reservation_id, _ = database.reserve_if_free("UB", "bench", "C1", "bench", day, day + timedelta(minutes=30))
+        database.delete_reservation(reservation_id, "UB")
+
+    t = time.perf_counter()
+    database.load_interval_index()
+    results = {"load_interval_index": ((time.perf_counter() - t) * 1000,) * 2}
+    results["check_conflict"] = measure(
+        lambda: database.check_conflict(days[0].replace(hour=22), days[0].replace(hour=22, minute=30)), iterations
+    )
+    results["reserve_if_free + delete"] = measure(reserve_and_cancel, iterations)
+    results["get_pending_reminders"] = measure(database.get_pending_reminders, iterations)
+    results["by_date (future, uncached)"] = measure(
+        lambda: database._load_reservations_by_date(days[0].date().isoformat()), iterations
+    )
+    results["by_date (past, uncached)"] = measure(
+        lambda: database._load_reservations_by_date(past_day.date().isoformat()), iterations
+    )
+    return results
+
+
+def archive_with_writer(batch: int, pause: float) -> tuple[int, float, tuple[float, float]]:
+    """全件をアーカイブする間に別スレッドで予約を作成し続け、(移した件数, かかった秒数, 作成のp50・p99) を返す"""
+    before = archiver.archive_cutoff()
+    done = threading.Event()
+    latencies = []
+
+    def writer():
+        day = datetime.now().replace(hour=21, minute=0, second=0, microsecond=0) + timedelta(days=400)
+        while not done.is_set():
+            t = time.perf_counter()
+            reservation_id, _ = database.reserve_if_free("UW", "writer", "C1", "writer", day, day + timedelta(minutes=30))
+            latencies.append((time.perf_counter() - t) * 1000)
+            database.delete_reservation(reservation_id, "UW")
+            time.sleep(0.005)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    t = time.perf_counter()
+    moved = 0
+    try:
+        while True:
+            count = database.archive_reservations(before, batch)
+            moved += count
+            if count < batch:
+                break
+            time.sleep(pause)
+    finally:
+        done.set()
+        thread.join()
+    elapsed = time.perf_counter() - t
+    database.checkpoint_wal()
+    database.sync_changes(database.get_connection())
+    return moved, elapsed, percentiles(latencies) if len(latencies) > 1 else (0.0, 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", default="10000,100000,1000000", help="過去の予約数（カンマ区切りで複数）")
+    parser.add_argument("--future", type=int, default=2000, help="未来の予約数")
+    parser.add_argument("--batch", type=int, default=500, help="1回のトランザクションで移す件数")
+    parser.add_argument("--pause", type=float, default=archiver.ARCHIVE_PAUSE_SECONDS, help="バッチの間に空ける秒数")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    table: dict[str, dict[str, tuple]] = {}
+    for history in [int(h) for h in args.history.split(",")]:
+        open_database(history)
+        t = time.perf_counter()
+        first_day = seed(history, args.future, today)
+        database.init_db()
+        print(f"\nhistory {history}: seeded in {time.perf_counter() - t:.1f}s")
+        past_day = first_day + timedelta(days=history // PER_DAY // 2)
+
+        before = hot_path(today, past_day, args.iterations)
+        moved, elapsed, writer = archive_with_writer(args.batch, args.pause)
+        print(f"  archived {moved} rows in {elapsed:.1f}s "
+              f"(concurrent reserve_if_free p50 {writer[0]:.3f}ms  p99 {writer[1]:.3f}ms)")
+        after = hot_path(today, past_day, args.iterations)
+        for name in before:
+            table.setdefault(name, {})[history] = (before[name], after[name])
+
+    histories = [int(h) for h in args.history.split(",")]
+    print("\np99 (ms)  no archive -> archived")
+    print(f"  {'':<28}" + "".join(f"{h:>24}" for h in histories))
+    for name, by_history in table.items():
+        cells = "".join(f"{by_history[h][0][1]:>10.3f} -> {by_history[h][1][1]:>10.3f}" for h in histories)
+        print(f"  {name:<28}{cells}")
+
+
+if __name__ == "__main__":
+    main()
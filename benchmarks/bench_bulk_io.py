@@ -0,0 +1,101 @@
+"""
+予約の一括読み込み・書き出しのベンチマーク
+生成したCSVの予約を、1件ずつreserve_if_free（重複チェック＋1件のトランザクション）で入れる方法と、
+bulk_ioの検証（重なりの走査）＋まとめての挿入で入れる方法の件数/秒を比べ、CSV・iCalendarの書き出し・読み込みの往復も測る
+
+    python benchmarks/bench_bulk_io.py --rows 1000000 --baseline 20000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+WORKDIR = tempfile.mkdtemp(prefix="bench-bulk-io-")
+os.environ["DATABASE_PATH"] = os.path.join(WORKDIR, "reservations.db")
+
+import bulk_io  # noqa: E402
+import database  # noqa: E402
+
+EVENT_NAMES = ["定例", "1on1", "レビュー", "採用面接", "顧客MTG", "勉強会"]
+DEFAULTS = {"user_id": None, "user_name": None, "channel_id": None, "reminder_minutes": 15}
+
+
+def generate_csv(path: str, rows: int, start: datetime):
+    """1日20枠（30分刻み）の予約をrows件書いたCSV"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("user_id,user_name,channel_id,event_name,start_time,end_time,reminder_minutes\n")
+        for i in range(rows):
+            s = start + timedelta(days=i // 20, minutes=30 * (i % 20))
+            e = s + timedelta(minutes=30)
+            f.write(f"U{i % 500},user{i % 500},C{i % 20},{EVENT_NAMES[i % len(EVENT_NAMES)]} {i},{s:%Y-%m-%d %H:%M},{e:%Y-%m-%d %H:%M},15\n")
+
+
+def timed(name: str, rows: int, run):
+    started = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - started
+    print(f"  {name:<36} {rows:>9} rows  {elapsed:>7.1f}s  {rows / elapsed:>10,.0f} rows/s")
+    return result
+
+
+def clear_reservations():
+    conn = database.get_connection()
+    with conn:
+        conn.execute("DELETE FROM reservations")
+        conn.execute("DELETE FROM reservation_changes")
+    database.load_interval_index()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000, help="一括で読み込む予約数")
+    parser.add_argument("--baseline", type=int, default=20000, help="1件ずつ入れる予約数")
+    parser.add_argument("--chunk", type=int, default=bulk_io.DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_db()
+
+    source = os.path.join(WORKDIR, "source.csv")
+    generate_csv(source, args.rows, datetime(2030, 1, 1, 7, 0))
+    print(f"Generated {args.rows} rows ({os.path.getsize(source) / 1e6:.0f}MB CSV)\n")
+
+    def one_by_one():
+        for line, row in bulk_io._records(source, "csv", DEFAULTS):
+            if line > args.baseline + 1:
+                break
+            user_id, user_name, channel_id, event_name, start, end, minutes, _ = row
+            database.reserve_if_free(
+                user_id, user_name, channel_id, event_name,
+                database.from_epoch(start), database.from_epoch(end), minutes
+            )
+
+    print("before:")
+    timed("reserve_if_free per row", args.baseline, one_by_one)
+    clear_reservations()
+
+    print("after:")
+    timed("validate CSV (sweep)", args.rows, lambda: bulk_io.validate_file(source, "csv", DEFAULTS))
+    timed("import CSV (validate + insert)", args.rows, lambda: bulk_io.import_file(source, "csv", DEFAULTS, args.chunk))
+
+    exported_csv = os.path.join(WORKDIR, "export.csv")
+    exported_ics = os.path.join(WORKDIR, "export.ics")
+    timed("export CSV", args.rows, lambda: bulk_io.export_file(exported_csv, "csv"))
+    timed("export iCalendar", args.rows, lambda: bulk_io.export_file(exported_ics, "ics"))
+
+    clear_reservations()
+    timed("import iCalendar (validate + insert)", args.rows,
+          lambda: bulk_io.import_file(exported_ics, "ics", DEFAULTS, args.chunk))
+
+    conn = database.get_connection()
+    count = conn.execute("SELECT COUNT(*) FROM reservations").fetchone()[0]
+    print(f"\nRound trip kept {count} of {args.rows} reservations")
+
+
+if __name__ == "__main__":
+    main()
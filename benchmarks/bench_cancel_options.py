@@ -0,0 +1,142 @@
+"""
+キャンセルモーダルの予約の選択肢のベンチマーク
+未来の予約を大量に持つユーザーについて、従来の全件取得＋全件の選択肢作成と、
+(user_id, start_time, id) インデックスのkeyset方式で1ページ分だけ読んで作る方法を比較する
+
+    python benchmarks/bench_cancel_options.py --heavy-users 3 --bookings 5000 --background 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-cancel-options-"), "reservations.db")
+
+import database  # noqa: E402
+from epoch import to_epoch  # noqa: E402
+from views import (  # noqa: E402
+    CANCEL_OPTIONS_PAGE,
+    build_cancel_options,
+    parse_cancel_options_request,
+)
+
+EVENT_NAMES = ["定例", "1on1", "レビュー", "採用面接", "顧客MTG", "勉強会"]
+
+
+def seed(heavy_users: int, bookings: int, background: int):
+    """heavy_users人に未来の予約をbookings件ずつ、他のユーザーにbackground件を作成"""
+    database.init_db()
+    start = (datetime.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+    rng = random.Random(0)
+
+    def rows():
+        for u in range(heavy_users):
+            for i in range(bookings):
+                slot = start + timedelta(days=i // 10, minutes=30 * (i % 10))
+                yield (f"H{u}", f"heavy{u}", "C1", f"{EVENT_NAMES[i % len(EVENT_NAMES)]} {i}", slot, slot + timedelta(minutes=30))
+        for i in range(background):
+            slot = start + timedelta(days=rng.randrange(-365, 365), minutes=30 * rng.randrange(20))
+            yield (f"U{i % 500}", "user", "C1", f"meeting {i}", slot, slot + timedelta(minutes=30))
+
+    conn = database.get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes, remind_at)
+            VALUES (?, ?, ?, ?, ?, ?, 15, ?)
+        """, (
+            (user_id, user_name, channel_id, event_name, to_epoch(s), to_epoch(e), to_epoch(s - timedelta(minutes=15)))
+            for user_id, user_name, channel_id, event_name, s, e in rows()
+        ))
+    database.init_db()
+    return start
+
+
+def build_all_options(reservations: list) -> list[dict]:
+    """従来のキャンセルモーダルと同じく全件を選択肢にする"""
+    options = []
+    for r in reservations:
+        label = f"{r.start_time.strftime('%m/%d %H:%M')} - {r.event_name}"
+        if len(label) > 75:
+            label = label[:72] + "..."
+        options.append({"text": {"type": "plain_text", "text": label}, "value": str(r.id)})
+    return options
+
+
+def page_options(user_id: str, body: dict) -> list[dict]:
+    """handle_cancel_optionsと同じ処理（1ページ分だけ読んで選択肢にする）"""
+    day, name, after = parse_cancel_options_request(body)
+    return build_cancel_options(database.get_reservations_page_by_user(user_id, CANCEL_OPTIONS_PAGE + 1, after, day, name))
+
+
+def options_request(value: str = "", selected: str = None) -> dict:
+    values = {}
+    if selected:
+        values = {"reservation_block": {"reservation_select": {"selected_option": {"value": selected}}}}
+    return {"type": "block_suggestion", "value": value, "view": {"state": {"values": values}}}
+
+
+def measure(name: str, call, iterations: int) -> list:
+    latencies = []
+    result = None
+    for _ in range(iterations):
+        t = time.perf_counter()
+        result = call()
+        latencies.append((time.perf_counter() - t) * 1000)
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    count = len(result) if isinstance(result, list) else result
+    print(f"  {name:<36} p50 {cuts[49]:>8.3f}ms  p95 {cuts[94]:>8.3f}ms  p99 {cuts[98]:>8.3f}ms  ({count} results)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heavy-users", type=int, default=3, help="未来の予約を大量に持つユーザー数")
+    parser.add_argument("--bookings", type=int, default=5000, help="1人あたりの未来の予約数")
+    parser.add_argument("--background", type=int, default=100000, help="他のユーザーの予約数")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    first_day = seed(args.heavy_users, args.bookings, args.background)
+    print(f"Seeded {args.heavy_users * args.bookings + args.background} reservations in {time.perf_counter() - started:.1f}s")
+
+    user_id = "H0"
+    middle_day = first_day + timedelta(days=args.bookings // 20)
+
+    # 選択肢のページを最後までたどって、途中のページの位置を得る
+    cursors = []
+    options = page_options(user_id, options_request())
+    while options[-1]["value"].startswith("next:"):
+        cursors.append(options[-1]["value"])
+        options = page_options(user_id, options_request(selected=cursors[-1]))
+    middle_cursor = cursors[len(cursors) // 2]
+    print(f"{user_id}: {len(cursors) + 1} pages of {CANCEL_OPTIONS_PAGE}")
+
+    print("\nbefore (全件取得・全件の選択肢)")
+    measure(
+        "get_reservations_by_user + options",
+        lambda: build_all_options(database.get_reservations_by_user(user_id)), args.iterations
+    )
+
+    print("\nafter (1ページ分のみ)")
+    measure("has_upcoming_reservations", lambda: int(database.has_upcoming_reservations(user_id)), args.iterations)
+    measure("options: first page", lambda: page_options(user_id, options_request()), args.iterations)
+    measure(
+        "options: middle page (keyset)",
+        lambda: page_options(user_id, options_request(selected=middle_cursor)), args.iterations
+    )
+    measure(
+        f"options: date {middle_day.strftime('%m/%d')}",
+        lambda: page_options(user_id, options_request(middle_day.strftime("%Y/%m/%d"))), args.iterations
+    )
+    measure("options: name '採用'", lambda: page_options(user_id, options_request("採用")), args.iterations)
+    measure("options: name (no match)", lambda: page_options(user_id, options_request("該当なし")), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+期間の確認のベンチマーク
+予約の多いテーブルで1か月分の確認を、日ごとのクエリ（_load_reservations_by_date）を日数分くり返して日ごとのテキストにする方法と、
+iter_reservations_betweenの1回の範囲クエリから日ごとにまとめたBlock Kitのメッセージを生成する方法で比較する
+
+    python benchmarks/bench_check_range.py --rows 100000 --per-day 50 --days 31
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-check-range-"), "reservations.db")
+
+import database  # noqa: E402
+from epoch import to_epoch  # noqa: E402
+from views import render_day_schedule, render_range_schedule  # noqa: E402
+
+EVENT_NAMES = ["定例", "1on1", "レビュー", "採用面接", "顧客MTG", "勉強会"]
+
+
+def seed(rows: int, per_day: int, first_day: date):
+    """first_dayから1日per_day件（07:00から10分刻み）の予約をrows件作成"""
+    database.init_db()
+    start = datetime.combine(first_day, datetime.min.time()) + timedelta(hours=7)
+
+    def values():
+        for i in range(rows):
+            s = start + timedelta(days=i // per_day, minutes=10 * (i % per_day))
+            yield (
+                f"U{i % 500}", f"user{i % 500}", f"C{i % 20}", f"{EVENT_NAMES[i % len(EVENT_NAMES)]} {i}",
+                to_epoch(s), to_epoch(s + timedelta(minutes=10)), to_epoch(s - timedelta(minutes=15)),
+            )
+
+    conn = database.get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes, remind_at)
+            VALUES (?, ?, ?, ?, ?, ?, 15, ?)
+        """, values())
+        conn.execute("ANALYZE")
+
+
+def per_day(first: date, last: date) -> list:
+    """変更前: 日数分の確認（1日ずつクエリしてテキストにする）"""
+    messages = []
+    day = first
+    while day <= last:
+        messages.append(render_day_schedule(day, database._load_reservations_by_date(day.isoformat())))
+        day += timedelta(days=1)
+    return messages
+
+
+def ranged(first: date, last: date) -> list:
+    """変更後: 1回の範囲クエリから日ごとにまとめたメッセージ"""
+    return list(render_range_schedule(first, last, database.iter_reservations_between(first, last)))
+
+
+def measure(name: str, check, repeat: int) -> list:
+    """repeat回の最小の時間と、1回分のメモリのピーク"""
+    elapsed = []
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        messages = check()
+        elapsed.append(time.perf_counter() - t)
+
+    gc.collect()
+    tracemalloc.start()
+    check()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:<28} {min(elapsed) * 1000:>8.1f}ms  peak {peak / 1e6:>6.1f}MB  messages {len(messages):>3}")
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000, help="予約数")
+    parser.add_argument("--per-day", type=int, default=50, help="1日の予約数")
+    parser.add_argument("--days", type=int, default=31, help="確認する日数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    first_day = date.today() + timedelta(days=1)
+    started = time.perf_counter()
+    seed(args.rows, args.per_day, first_day)
+    print(f"Seeded {args.rows} reservations ({args.per_day}/day) in {time.perf_counter() - started:.1f}s\n")
+
+    # 予約のある期間の中ほどの1か月
+    first = first_day + timedelta(days=args.rows // args.per_day // 2)
+    last = first + timedelta(days=args.days - 1)
+    print(f"{first} - {last} ({args.days} days, {args.days * args.per_day} reservations)")
+    measure("before: per-day queries", lambda: per_day(first, last), args.repeat)
+    messages = measure("after: one range query", lambda: ranged(first, last), args.repeat)
+    blocks = [len(m["blocks"]) for m in messages]
+    print(f"  {'':<28} blocks per message {blocks}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+"""
+ハンドラー・DB関数ごとのレイテンシベンチマーク
+一時ファイルのSQLiteに大量の予約履歴を作り、実際の bot.app にイベント・モーダル送信の
+リクエストボディを流して、ハンドラーごと・database.pyの関数ごとの処理件数/秒と
+p50/p95/p99レイテンシを計測する。結果はJSONに保存し、--compareで前回の結果と比較できる
+
+    python benchmarks/bench_handlers.py --rows 100000 --iterations 500
+    python benchmarks/bench_handlers.py --rows 100000 --compare bench-handlers-20250101-120000.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-handlers-"), "reservations.db")
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-bench")
+os.environ.setdefault("SLACK_SIGNING_SECRET", "bench")
+
+from slack_bolt.request import BoltRequest  # noqa: E402
+
+from slack_stub import (  # noqa: E402
+    StubSlackApi,
+    block_action,
+    block_suggestion,
+    cancel_values,
+    mention_event,
+    reservation_values,
+    view_submission,
+)
+
+# 30分刻みの予約枠（09:00-18:00）
+SLOTS = [f"{h:02d}:{m:02d}" for h in range(9, 18) for m in (0, 30)] + ["18:00"]
+SLOT_PAIRS = list(zip(SLOTS, SLOTS[1:]))
+
+# 履歴は今日からこの日数先までを埋める（それ以降の日付は新規予約用に空けておく）
+HISTORY_FUTURE_DAYS = 30
+
+USERS = [f"U{i:04d}" for i in range(200)]
+CHANNELS = [f"C{i:03d}" for i in range(50)]
+
+
+# ====================
+# データ生成
+# ====================
+
+def seed_history(rows: int, due_reminders: int) -> dict:
+    """予約履歴を生成（1日あたり3枠に2枠を埋め、今日+HISTORY_FUTURE_DAYSから過去に向かって作る）"""
+    import database
+    from epoch import date_of, to_epoch
+
+    database.init_db()
+    now = datetime.now()
+    last_day = (now + timedelta(days=HISTORY_FUTURE_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+    rng = random.Random(0)
+
+    def generate():
+        made = 0
+        day = last_day
+        while made < rows:
+            for i, (start, end) in enumerate(SLOT_PAIRS):
+                if i % 3 == 2 or made >= rows:
+                    continue
+                start_time = datetime.combine(day.date(), datetime.strptime(start, "%H:%M").time())
+                end_time = datetime.combine(day.date(), datetime.strptime(end, "%H:%M").time())
+                user_id = rng.choice(USERS)
+                yield (
+                    user_id, f"User {user_id}", rng.choice(CHANNELS), f"meeting {made}",
+                    to_epoch(start_time), to_epoch(end_time), 15,
+                    to_epoch(start_time - timedelta(minutes=15)), start_time - timedelta(minutes=15) <= now
+                )
+                made += 1
+            day -= timedelta(days=1)
+
+    # 送信時刻を過ぎた未送信のリマインダー（同じ時間帯に多数並ぶため、長さ0の予約にする）
+    def due():
+        for i in range(due_reminders):
+            start_time = to_epoch(now + timedelta(minutes=10))
+            yield (
+                USERS[i % len(USERS)], "due", CHANNELS[i % len(CHANNELS)], f"due {i}",
+                start_time, start_time, 15,
+                to_epoch(now - timedelta(minutes=1)), False
+            )
+
+    conn = database.get_connection()
+    with conn:
+        conn.execute("DELETE FROM reservations")
+        for source in (generate(), due()):
+            conn.executemany("""
+                INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes, remind_at, reminder_sent)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, source)
+    database.init_db()
+
+    due_ids = [row["id"] for row in conn.execute("SELECT id FROM reservations WHERE user_name = 'due'")]
+    first_day = date_of(conn.execute("SELECT MIN(start_time) FROM reservations").fetchone()[0]).isoformat()
+    return {"first_day": first_day, "last_day": last_day.date().isoformat(), "due_ids": due_ids}
+
+
+# ====================
+# 計測
+# ====================
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    """レイテンシ（秒）の一覧から統計を作る（ミリ秒）"""
+    ms = sorted(x * 1000 for x in latencies)
+    if len(ms) > 1:
+        cuts = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ms[0]
+    return {
+        "count": len(ms),
+        "throughput": round(len(ms) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(p95, 3),
+        "p99_ms": round(p99, 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def measure(calls) -> dict:
+    """callsの各要素（引数なしの関数）を順に実行して計測"""
+    latencies = []
+    started = time.perf_counter()
+    for call in calls:
+        t = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+class Replayer:
+    """bot.appにリクエストを流し、応答（chat.postMessage / views.open）が出るまでを計測する"""
+
+    def __init__(self, app, stub: StubSlackApi):
+        self.app = app
+        self.stub = stub
+
+    def dispatch(self, body: dict, responses: int = 1) -> float:
+        """1件流して、ackとresponses件の応答が出るまで待ち、かかった秒数を返す"""
+        expected = self.stub.responses + responses
+        started = time.perf_counter()
+        response = self.app.dispatch(BoltRequest(body=body, mode="socket_mode"))
+        if response.status != 200:
+            raise RuntimeError(f"dispatch failed: {response.status} {response.body}")
+        if responses and not self.stub.wait_for_responses(expected, timeout=30):
+            raise RuntimeError(f"no response for {body.get('type')}")
+        return time.perf_counter() - started
+
+    def ack(self, body: dict) -> tuple[float, str]:
+        """1件流して、ackが返るまでの秒数とレスポンスボディを返す"""
+        started = time.perf_counter()
+        response = self.app.dispatch(BoltRequest(body=body, mode="socket_mode"))
+        return time.perf_counter() - started, response.body
+
+    def measure(self, bodies, responses: int = 1) -> dict:
+        latencies = []
+        started = time.perf_counter()
+        for body in bodies:
+            latencies.append(self.dispatch(body, responses))
+        return summarize(latencies, time.perf_counter() - started)
+
+
+def bench_handlers(iterations: int, history: dict, stub: StubSlackApi) -> dict:
+    """各ハンドラーを実際のリクエストボディで計測"""
+    import bot
+    import database
+
+    rng = random.Random(1)
+    replay = Replayer(bot.app, stub)
+    first = datetime.fromisoformat(history["first_day"])
+    span_days = (datetime.fromisoformat(history["last_day"]) - first).days
+    results = {}
+
+    def random_day() -> datetime:
+        return first + timedelta(days=rng.randrange(span_days + 1))
+
+    results["app_mention:予約"] = replay.measure(
+        mention_event(rng.choice(USERS), "予約") for _ in range(iterations)
+    )
+    results["app_mention:キャンセル"] = replay.measure(
+        mention_event(rng.choice(USERS), "キャンセル") for _ in range(iterations)
+    )
+    results["app_mention:確認"] = replay.measure(
+        mention_event(rng.choice(USERS), f"確認 {random_day().strftime('%Y/%m/%d')}") for _ in range(iterations)
+    )
+    results["app_mention:空き"] = replay.measure(
+        mention_event(rng.choice(USERS), f"空き {random_day().strftime('%Y/%m/%d')}") for _ in range(iterations)
+    )
+    results["app_mention:空き (N時間・1か月)"] = replay.measure(
+        mention_event(rng.choice(USERS), f"空き {day:%Y/%m/%d}-{day + timedelta(days=30):%Y/%m/%d} 8時間")
+        for day in (random_day() for _ in range(iterations))
+    )
+    results["action:open_reservation_modal"] = replay.measure(
+        block_action("open_reservation_modal", rng.choice(USERS)) for _ in range(iterations)
+    )
+    results["action:open_cancel_modal"] = replay.measure(
+        block_action("open_cancel_modal", rng.choice(USERS)) for _ in range(iterations)
+    )
+
+    # 予約モーダルの開始・終了時刻の選択肢（未来の予約がある日を選択中として要求する）
+    future_days = [
+        (datetime.fromisoformat(history["last_day"]) - timedelta(days=rng.randrange(HISTORY_FUTURE_DAYS))).date().isoformat()
+        for _ in range(iterations)
+    ]
+
+    def options_request(day: str, action_id: str, block_id: str, start: str = None) -> dict:
+        values = {"date_block": {"date_select": {"selected_date": day}}}
+        if start:
+            values["start_time_block"] = {"start_time_select": {"selected_option": {"value": start}}}
+        return block_suggestion(action_id, block_id, values, rng.choice(USERS))
+
+    def measure_options(handler, bodies, cold: bool) -> dict:
+        # app.dispatch経由ではBoltのack待ち（約10ms）に埋もれるため、ハンドラーを直接呼んでackまでを測る
+        latencies = []
+        started = time.perf_counter()
+        for day, body in bodies:
+            if cold:
+                database.day_cache.invalidate(day)
+            acked = []
+            t = time.perf_counter()
+            handler(ack=lambda **kwargs: acked.append(kwargs), body=body)
+            latencies.append(time.perf_counter() - t)
+            if not acked or "options" not in acked[0]:
+                raise RuntimeError(f"unexpected options response: {acked}")
+        return summarize(latencies, time.perf_counter() - started)
+
+    start_requests = [(d, options_request(d, "start_time_select", "start_time_block")) for d in future_days]
+    results["options:start_time_select (cold)"] = measure_options(
+        bot.handle_start_time_options, start_requests, cold=True
+    )
+    # 同じ日を繰り返し要求してキャッシュから返す
+    results["options:start_time_select (cached)"] = measure_options(
+        bot.handle_start_time_options, [start_requests[i % 10] for i in range(iterations)], cold=False
+    )
+    results["options:end_time_select"] = measure_options(
+        bot.handle_end_time_options,
+        [(d, options_request(d, "end_time_select", "end_time_block", rng.choice(SLOTS[:-1]))) for d in future_days],
+        cold=False
+    )
+
+    # 予約モーダル送信（新規予約は履歴の後ろの空いている日に入れる）
+    new_day = datetime.fromisoformat(history["last_day"]) + timedelta(days=1)
+    submissions = []
+    for i in range(iterations):
+        day = (new_day + timedelta(days=i // len(SLOT_PAIRS))).date().isoformat()
+        start, end = SLOT_PAIRS[i % len(SLOT_PAIRS)]
+        user_id = rng.choice(USERS)
+        submissions.append((user_id, view_submission(
+            "reservation_modal", reservation_values(day, start, end, f"bench {i}"), user_id
+        )))
+
+    ack_latencies = []
+    started = time.perf_counter()
+    done_latencies = []
+    for _, body in submissions:
+        expected = stub.responses + 1
+        t = time.perf_counter()
+        ack_latency, ack_body = replay.ack(body)
+        if ack_body:
+            raise RuntimeError(f"unexpected validation error: {ack_body}")
+        stub.wait_for_responses(expected, timeout=30)
+        done_latencies.append(time.perf_counter() - t)
+        ack_latencies.append(ack_latency)
+    elapsed = time.perf_counter() - started
+    results["view:reservation_modal (ack)"] = summarize(ack_latencies, elapsed)
+    results["view:reservation_modal (completed)"] = summarize(done_latencies, elapsed)
+
+    # 既存の予約と重なる送信（入力エラーで返す）
+    conflicts = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        day = (datetime.fromisoformat(history["last_day"]) - timedelta(days=rng.randrange(HISTORY_FUTURE_DAYS))).date()
+        start, end = SLOT_PAIRS[0]
+        user_id = rng.choice(USERS)
+        latency, ack_body = replay.ack(view_submission(
+            "reservation_modal", reservation_values(day.isoformat(), start, end, "conflict"), user_id
+        ))
+        if "errors" not in ack_body:
+            raise RuntimeError("conflicting submission was accepted")
+        conflicts.append(latency)
+    results["view:reservation_modal (conflict)"] = summarize(conflicts, time.perf_counter() - started)
+
+    # キャンセルモーダル送信（上で作った予約を作成者がキャンセルする）
+    created = database.get_connection().execute(
+        "SELECT id, user_id FROM reservations WHERE event_name LIKE 'bench %' ORDER BY id"
+    ).fetchall()
+    results["view:cancel_modal (completed)"] = replay.measure(
+        view_submission("cancel_modal", cancel_values(row["id"]), row["user_id"]) for row in created
+    )
+
+    return results
+
+
+def bench_reminders(history: dict, rounds: int, stub: StubSlackApi) -> dict:
+    """send_remindersで期限を過ぎたリマインダーをoutboxに積み、送り切るまでの時間を計測"""
+    import bot
+    import database
+
+    ids = history["due_ids"]
+    conn = database.get_connection()
+
+    def reset():
+        with conn:
+            conn.executemany("UPDATE reservations SET reminder_sent = FALSE WHERE id = ?", ((i,) for i in ids))
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        reset()
+        t = time.perf_counter()
+        expected = stub.responses + len(ids)
+        bot.send_reminders()
+        stub.wait_for_responses(expected, timeout=60)
+        latencies.append(time.perf_counter() - t)
+    result = summarize(latencies, time.perf_counter() - started)
+    result["reminders_per_call"] = len(ids)
+    return {"send_reminders": result}
+
+
+def bench_database(iterations: int, history: dict) -> dict:
+    """database.pyの関数を直接呼んで計測"""
+    import database
+
+    rng = random.Random(2)
+    conn = database.get_connection()
+    max_id = conn.execute("SELECT MAX(id) FROM reservations").fetchone()[0]
+    first = datetime.fromisoformat(history["first_day"])
+    span_days = (datetime.fromisoformat(history["last_day"]) - first).days
+    days = [(first + timedelta(days=rng.randrange(span_days + 1))).date().isoformat() for _ in range(iterations)]
+    results = {}
+
+    def slot(day: datetime, i: int) -> tuple[datetime, datetime]:
+        start, end = SLOT_PAIRS[i % len(SLOT_PAIRS)]
+        return (
+            datetime.combine(day.date(), datetime.strptime(start, "%H:%M").time()),
+            datetime.combine(day.date(), datetime.strptime(end, "%H:%M").time()),
+        )
+
+    results["get_reservation"] = measure(
+        (lambda i=rng.randint(1, max_id): database.get_reservation(i)) for _ in range(iterations)
+    )
+
+    def cold_by_date(day: str):
+        database.day_cache.clear()
+        database.get_reservations_by_date(day)
+
+    results["get_reservations_by_date (cold)"] = measure((lambda d=d: cold_by_date(d)) for d in days)
+    # キャッシュに収まる日数だけを繰り返し引く
+    hot_days = days[:10]
+    results["get_reservations_by_date (cached)"] = measure(
+        (lambda d=hot_days[i % len(hot_days)]: database.get_reservations_by_date(d)) for i in range(iterations)
+    )
+    results["get_reservations_by_user"] = measure(
+        (lambda u=rng.choice(USERS): database.get_reservations_by_user(u)) for _ in range(iterations)
+    )
+    results["check_conflict"] = measure(
+        (lambda s=slot(first + timedelta(days=rng.randrange(span_days + 1)), i): database.check_conflict(*s))
+        for i in range(iterations)
+    )
+
+    results["get_busy_slots (1 day)"] = measure(
+        (lambda d=date.fromisoformat(d): database.get_busy_slots(d, d)) for d in days
+    )
+    results["get_busy_slots (90 days)"] = measure(
+        (lambda d=date.fromisoformat(d): database.get_busy_slots(d, d + timedelta(days=89))) for d in days
+    )
+
+    # 空いている日に作成して、同じ予約を削除する
+    new_day = datetime.fromisoformat(history["last_day"]) + timedelta(days=400)
+    created = []
+
+    def reserve(i: int):
+        user_id = USERS[i % len(USERS)]
+        start, end = slot(new_day + timedelta(days=i // len(SLOT_PAIRS)), i)
+        reservation_id, conflict = database.reserve_if_free(user_id, "bench", "C1", "bench", start, end, 15)
+        if conflict:
+            raise RuntimeError(f"unexpected conflict: {conflict['id']}")
+        created.append((reservation_id, user_id))
+
+    results["reserve_if_free"] = measure((lambda i=i: reserve(i)) for i in range(iterations))
+    results["delete_reservation"] = measure(
+        (lambda r=r: database.delete_reservation(*r)) for r in created
+    )
+
+    results["get_pending_reminders"] = measure(database.get_pending_reminders for _ in range(iterations))
+    results["get_upcoming_reminders"] = measure(database.get_upcoming_reminders for _ in range(max(1, iterations // 10)))
+    return results
+
+
+# ====================
+# 結果の保存・比較
+# ====================
+
+def print_table(title: str, results: dict, baseline: dict):
+    print(f"\n{title}")
+    print(f"  {'name':<40} {'ops/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}  vs baseline p99")
+    for name, r in results.items():
+        line = f"  {name:<40} {r['throughput'] or 0:>9.1f} {r['p50_ms']:>8.2f}ms {r['p95_ms']:>7.2f}ms {r['p99_ms']:>7.2f}ms"
+        before = baseline.get(name)
+        if before and before["p99_ms"]:
+            change = (r["p99_ms"] - before["p99_ms"]) / before["p99_ms"] * 100
+            line += f"  {change:+.0f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="生成する予約履歴の件数")
+    parser.add_argument("--iterations", type=int, default=300, help="ハンドラー・DB関数ごとの実行回数")
+    parser.add_argument("--due-reminders", type=int, default=500, help="送信時刻を過ぎたリマインダーの件数")
+    parser.add_argument("--reminder-rounds", type=int, default=5, help="send_remindersの実行回数")
+    parser.add_argument("--latency", type=float, default=0.0, help="スタブのAPI応答時間（秒）")
+    parser.add_argument("--output", help="結果のJSONの保存先（省略時は bench-handlers-<日時>.json）")
+    parser.add_argument("--compare", help="比較する前回の結果のJSON")
+    parser.add_argument("--verbose", action="store_true", help="Botのログを表示する")
+    args = parser.parse_args()
+
+    stub = StubSlackApi(args.latency)
+    stub.install()
+
+    # チャンネルごとのレート制限の待ち時間ではなく処理そのものを計測するため、制限を外す
+    import bot
+    import outbox
+    from rate_limit import ChannelRateLimiter
+    outbox.channel_limiter = ChannelRateLimiter(1e9, 1e9)
+    print(f"Seeding {args.rows} reservations...")
+    started = time.perf_counter()
+    history = seed_history(args.rows, args.due_reminders)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s ({history['first_day']} - {history['last_day']})")
+
+    # 通知はoutboxのワーカーが送る
+    threading.Thread(target=bot.outbox_worker.run, daemon=True).start()
+
+    # Botのprintは計測の邪魔になるので捨てる
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        handlers = bench_handlers(args.iterations, history, stub)
+        handlers.update(bench_reminders(history, args.reminder_rounds, stub))
+        db_results = bench_database(args.iterations, history)
+
+    result = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "params": vars(args),
+        "python": sys.version.split()[0],
+        "handlers": handlers,
+        "database": db_results,
+        "slack_api_calls": stub.calls,
+    }
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_table("Handlers", handlers, baseline.get("handlers", {}))
+    print_table("database.py", db_results, baseline.get("database", {}))
+
+    output = args.output or f"bench-handlers-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved: {output}")
+
+
+if __name__ == "__main__":
+    main()
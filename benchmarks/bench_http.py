@@ -0,0 +1,270 @@
+"""
+HTTPモード（BOT_RUNTIME=http）の複数ワーカーのベンチマーク
+スタブのSlack Web APIを立て、bot.pyをHTTPモードで起動して、署名付きのEvents API・
+モーダル送信のリクエストを同時に送り、ワーカー数ごとの処理件数/秒とレイテンシを計測する。
+同じ時間帯への予約を別々のワーカーに同時に送り、二重予約が起きないことも確認する
+
+    python benchmarks/bench_http.py --workers 1 2 4 --requests 4000 --concurrency 64
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+import aiohttp
+from aiohttp import web
+
+from slack_stub import mention_event, reservation_values, view_submission
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+SIGNING_SECRET = "bench-signing-secret"
+
+# 30分刻みの予約枠（09:00-18:00）
+SLOTS = [f"{h:02d}:{m:02d}" for h in range(9, 18) for m in (0, 30)] + ["18:00"]
+SLOT_PAIRS = list(zip(SLOTS, SLOTS[1:]))
+FIRST_DAY = date.today() + timedelta(days=30)
+
+
+# ====================
+# スタブのSlack Web API（別プロセスで動かす）
+# ====================
+
+def run_stub_server(port: int, latency: float):
+    counts: dict[str, int] = {}
+
+    async def api(request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if latency:
+            await asyncio.sleep(latency)
+        counts[method] = counts.get(method, 0) + 1
+
+        if method == "auth.test":
+            return web.json_response({"ok": True, "user_id": "UBOT", "bot_id": "BBOT", "team_id": "T1"})
+        if method == "users.info":
+            user_id = request.query.get("user") or (await request.post()).get("user", "U0")
+            return web.json_response({"ok": True, "user": {"id": user_id, "name": user_id.lower(), "real_name": f"User {user_id}"}})
+        return web.json_response({"ok": True})
+
+    async def stats(_: web.Request) -> web.Response:
+        return web.json_response(counts)
+
+    app = web.Application()
+    app.router.add_route("*", "/api/{method}", api)
+    app.router.add_get("/stats", stats)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+# ====================
+# 署名付きリクエスト
+# ====================
+
+def signed_request(body: dict) -> tuple[bytes, dict]:
+    """Slackと同じ形式（イベントはJSON、インタラクションはpayload=）で署名したリクエスト"""
+    if body["type"] == "event_callback":
+        raw = json.dumps(body).encode()
+        content_type = "application/json"
+    else:
+        raw = urlencode({"payload": json.dumps(body)}).encode()
+        content_type = "application/x-www-form-urlencoded"
+
+    timestamp = str(int(time.time()))
+    signature = "v0=" + hmac.new(
+        SIGNING_SECRET.encode(), f"v0:{timestamp}:".encode() + raw, hashlib.sha256
+    ).hexdigest()
+    return raw, {
+        "Content-Type": content_type,
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": signature,
+    }
+
+
+def build_requests(count: int, duplicate_ratio: float) -> list[dict]:
+    """「確認」メンションと予約モーダル送信を半分ずつ（予約の一部は同じ時間帯への重複）"""
+    rng = random.Random(0)
+    bodies = []
+    taken = []
+    for i in range(count):
+        user_id = f"U{i % 50}"
+        if i % 2:
+            day = FIRST_DAY + timedelta(days=rng.randrange(30))
+            bodies.append(mention_event(user_id, f"確認 {day.strftime('%Y/%m/%d')}"))
+            continue
+
+        if taken and rng.random() < duplicate_ratio:
+            day, start, end = rng.choice(taken)
+        else:
+            n = len(taken)
+            day = (FIRST_DAY + timedelta(days=n // len(SLOT_PAIRS))).isoformat()
+            start, end = SLOT_PAIRS[n % len(SLOT_PAIRS)]
+            taken.append((day, start, end))
+        bodies.append(view_submission("reservation_modal", reservation_values(day, start, end, f"meeting {i}"), user_id))
+    return bodies
+
+
+async def drive(url: str, bodies: list[dict], concurrency: int) -> tuple[list[float], float, int]:
+    """リクエストを同時実行数concurrencyで送り、(レイテンシ一覧, 経過秒, 失敗数) を返す"""
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def send(session: aiohttp.ClientSession, body: dict) -> float:
+        nonlocal failures
+        raw, headers = signed_request(body)
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.post(url, data=raw, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    failures += 1
+            return time.perf_counter() - started
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(send(session, body) for body in bodies))
+        return latencies, time.perf_counter() - started, failures
+
+
+# ====================
+# 実行
+# ====================
+
+def wait_until(check, timeout: float, interval: float = 0.1) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return True
+        except OSError:
+            pass
+        time.sleep(interval)
+    return False
+
+
+def http_get(url: str) -> tuple[int, bytes]:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+    try:
+        with urlopen(url, timeout=2) as response:
+            return response.status, response.read()
+    except HTTPError as e:
+        return e.code, e.read()
+
+
+def count_overlaps(database_path: str) -> tuple[int, int]:
+    conn = sqlite3.connect(database_path)
+    rows = conn.execute("SELECT COUNT(*) FROM reservations").fetchone()[0]
+    overlaps = conn.execute("""
+        SELECT COUNT(*) FROM reservations a JOIN reservations b
+        ON a.id < b.id AND a.start_time < b.end_time AND b.start_time < a.end_time
+    """).fetchone()[0]
+    conn.close()
+    return rows, overlaps
+
+
+def run(workers: int, args, stub_base: str) -> dict:
+    database_path = os.path.join(tempfile.mkdtemp(prefix="bench-http-"), "reservations.db")
+    env = dict(
+        os.environ,
+        BOT_RUNTIME="http",
+        HTTP_WORKERS=str(workers),
+        HOST="127.0.0.1",
+        PORT=str(args.port),
+        DATABASE_PATH=database_path,
+        SLACK_API_URL=f"{stub_base}/api/",
+        SLACK_BOT_TOKEN="xoxb-bench",
+        SLACK_SIGNING_SECRET=SIGNING_SECRET,
+        # チャンネルごとのレート制限の待ち時間ではなく処理そのものを計測するため、制限を外す
+        SLACK_CHANNEL_RATE="1e9",
+        SLACK_CHANNEL_BURST="1e9",
+    )
+    log = open(os.path.join(os.path.dirname(database_path), "bot.log"), "w")
+    bot = subprocess.Popen([sys.executable, "bot.py"], cwd=SRC_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        if not wait_until(lambda: http_get(f"{base}/healthz")[0] == 200, 30):
+            raise RuntimeError(f"bot did not start (see {log.name})")
+        # 全ワーカーが起動するまで少し待つ
+        time.sleep(1 + workers * 0.2)
+
+        posts_before = json.loads(http_get(f"{stub_base}/stats")[1]).get("chat.postMessage", 0)
+        bodies = build_requests(args.requests, args.duplicate_ratio)
+        latencies, elapsed, failures = asyncio.run(drive(f"{base}/slack/events", bodies, args.concurrency))
+
+        # ack後の処理（予約作成・通知）が落ち着くまで待つ
+        last = -1
+        while True:
+            posts = json.loads(http_get(f"{stub_base}/stats")[1]).get("chat.postMessage", 0)
+            if posts == last:
+                break
+            last = posts
+            time.sleep(0.5)
+    finally:
+        bot.terminate()
+        bot.wait(timeout=30)
+        log.close()
+
+    rows, overlaps = count_overlaps(database_path)
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        "workers": workers,
+        "requests": len(bodies),
+        "failures": failures,
+        "rps": len(bodies) / elapsed,
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "posts": last - posts_before,
+        "reservations": rows,
+        "overlaps": overlaps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="計測するワーカー数")
+    parser.add_argument("--requests", type=int, default=4000, help="送るリクエスト数（半分が予約、半分が確認）")
+    parser.add_argument("--concurrency", type=int, default=64, help="同時に送るリクエスト数")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2, help="予約のうち既に送った時間帯への重複の割合")
+    parser.add_argument("--latency", type=float, default=0.02, help="スタブのAPI応答時間（秒）")
+    parser.add_argument("--port", type=int, default=3100, help="Botが待ち受けるポート")
+    parser.add_argument("--stub-port", type=int, default=3199, help="スタブのSlack APIのポート")
+    parser.add_argument("--stub-server", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stub_server:
+        run_stub_server(args.stub_port, args.latency)
+        return
+
+    stub = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__), "--stub-server",
+        "--stub-port", str(args.stub_port), "--latency", str(args.latency)
+    ])
+    stub_base = f"http://127.0.0.1:{args.stub_port}"
+    try:
+        if not wait_until(lambda: http_get(f"{stub_base}/stats")[0] == 200, 10):
+            raise RuntimeError("stub Slack API did not start")
+        for workers in args.workers:
+            r = run(workers, args, stub_base)
+            print(
+                f"{r['workers']} workers: {r['requests']} requests, {r['rps']:.0f} req/s, "
+                f"p50 {r['p50_ms']:.1f}ms p95 {r['p95_ms']:.1f}ms p99 {r['p99_ms']:.1f}ms, "
+                f"{r['failures']} failed, {r['posts']} posts, {r['reservations']} reservations, {r['overlaps']} overlaps"
+            )
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+混雑時のリスナーのベンチマーク
+確認のメンションが大量に届いている最中に予約モーダルの送信を流し、送信のackまでの時間とackの期限（3秒）切れの件数を、
+Boltの既定のリスナー用スレッドプール（5スレッド・上限なし・到着順）と、優先度付き・上限付きのlistener_executorで比較する
+
+    python benchmarks/bench_listener_load.py --mentions 300 --submissions 40 --latency 0.3
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-listener-load-"), "reservations.db")
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-bench")
+os.environ.setdefault("SLACK_SIGNING_SECRET", "bench")
+
+from slack_bolt.request import BoltRequest  # noqa: E402
+
+from slack_stub import StubSlackApi, mention_event, reservation_values, view_submission  # noqa: E402
+
+# 30分刻みの予約枠（09:00-18:00）
+SLOTS = [f"{h:02d}:{m:02d}" for h in range(9, 18) for m in (0, 30)] + ["18:00"]
+SLOT_PAIRS = list(zip(SLOTS, SLOTS[1:]))
+
+
+class UnboundedExecutor(ThreadPoolExecutor):
+    """変更前と同じBoltの既定のプール（断らない）"""
+
+    def accepts(self, priority: int) -> bool:
+        return True
+
+    def shed(self, priority: int, reason: str = "busy"):
+        pass
+
+
+def requests(mentions: int, submissions: int, first_day: date) -> list[dict]:
+    """メンションの間にモーダルの送信を均等に混ぜたリクエストの列"""
+    bodies = []
+    every = max(1, mentions // max(1, submissions))
+    sent = 0
+    for i in range(mentions):
+        bodies.append(mention_event(f"U{i % 200}", f"確認 {(first_day + timedelta(days=i % 5)).strftime('%Y/%m/%d')}"))
+        if i % every == every - 1 and sent < submissions:
+            day = first_day + timedelta(days=sent // len(SLOT_PAIRS))
+            start, end = SLOT_PAIRS[sent % len(SLOT_PAIRS)]
+            bodies.append(view_submission("reservation_modal", reservation_values(day.isoformat(), start, end, f"bench {sent}"), "U1"))
+            sent += 1
+    return bodies
+
+
+def run(app, bodies: list[dict], dispatchers: int, interval: float) -> dict:
+    """Socket Modeの受信スレッド（dispatchers個）と同じ並列度で流し、モーダルの送信のackまでの時間を集める"""
+    pool = ThreadPoolExecutor(max_workers=dispatchers)
+
+    def dispatch(body: dict) -> tuple[str, float, int]:
+        started = time.perf_counter()
+        response = app.dispatch(BoltRequest(body=body, mode="socket_mode"))
+        return body["type"], time.perf_counter() - started, response.status
+
+    started = time.perf_counter()
+    futures = []
+    for body in bodies:
+        futures.append(pool.submit(dispatch, body))
+        time.sleep(interval)
+    results = [f.result() for f in futures]
+    pool.shutdown()
+
+    acks = [elapsed for kind, elapsed, status in results if kind == "view_submission" and status == 200 and elapsed < 3]
+    missed = sum(1 for kind, elapsed, status in results if kind == "view_submission" and (status != 200 or elapsed >= 3))
+    return {"acks": acks, "missed": missed, "elapsed": time.perf_counter() - started}
+
+
+def report(name: str, result: dict, stub: StubSlackApi, shed: float):
+    acks = sorted(result["acks"])
+    if len(acks) >= 2:
+        q = statistics.quantiles(acks, n=100)
+        latency = f"p50 {q[49] * 1000:8.1f}ms  p99 {q[98] * 1000:8.1f}ms  max {acks[-1] * 1000:8.1f}ms"
+    else:
+        latency = "(ackなし)"
+    print(f"  {name:<10} submissions acked {len(acks):>4}  missed {result['missed']:>4}  {latency}")
+    print(f"  {'':<10} mentions answered {stub.calls.get('chat.postMessage', 0):>4}  shed {shed:>5.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mentions", type=int, default=300, help="確認のメンションの件数")
+    parser.add_argument("--submissions", type=int, default=40, help="予約モーダルの送信の件数")
+    parser.add_argument("--latency", type=float, default=0.3, help="スタブのAPI応答時間（秒）")
+    parser.add_argument("--dispatchers", type=int, default=10, help="Socket Modeの受信スレッド数")
+    parser.add_argument("--interval", type=float, default=0.002, help="リクエストの到着間隔（秒）")
+    args = parser.parse_args()
+
+    stub = StubSlackApi(args.latency)
+    stub.install()
+
+    import bot
+    import database
+    from metrics import EXECUTOR_SHED
+
+    # ackの期限切れのたびに出るBoltの警告を抑える
+    logging.disable(logging.WARNING)
+
+    database.init_db()
+    first_day = date.today() + timedelta(days=1)
+
+    def shed_total() -> float:
+        return sum(child.value() for child in EXECUTOR_SHED._children.values())
+
+    executor = bot.listener_executor
+    with contextlib.redirect_stdout(io.StringIO()):
+        # 変更前: Boltの既定のプール（5スレッド・到着順・上限なし）
+        baseline = UnboundedExecutor(max_workers=5)
+        bot.listener_executor = bot.app._listener_runner.listener_executor = baseline
+        before = run(bot.app, requests(args.mentions, args.submissions, first_day), args.dispatchers, args.interval)
+        baseline.shutdown()
+        before_calls = dict(stub.calls)
+
+        stub.calls.clear()
+        bot.listener_executor = bot.app._listener_runner.listener_executor = executor
+        shed_before = shed_total()
+        after = run(bot.app, requests(args.mentions, args.submissions, first_day + timedelta(days=60)), args.dispatchers, args.interval)
+        while executor.depth():
+            time.sleep(0.1)
+        time.sleep(args.latency * 2)
+
+    print(f"{args.mentions} mentions + {args.submissions} submissions (API latency {args.latency}s)\n")
+    after_calls = dict(stub.calls)
+    stub.calls = before_calls
+    report("before", before, stub, 0)
+    stub.calls = after_calls
+    report("after", after, stub, shed_total() - shed_before)
+
+
+if __name__ == "__main__":
+    main()
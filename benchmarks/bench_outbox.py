@@ -0,0 +1,177 @@
+"""
+複数プロセスでのoutbox経由の通知送信の確認・ベンチマーク
+1つのSQLiteファイルに送信時刻を過ぎたリマインダーを用意し、bot.send_reminders（outboxに積む）と
+outboxのワーカーを別々のプロセスで同時に動かして、各リマインダーが1回ずつ送られるかを確認する。
+--crash-afterを指定すると1プロセスを送信の途中で落とし、その確保が期限切れになった後に
+他のプロセスが引き継いで送り切ることも確認する（落ちたプロセスが送信済みで未記録の分だけは再送される）
+
+    python benchmarks/bench_outbox.py --processes 4 --count 2000
+    python benchmarks/bench_outbox.py --processes 4 --count 2000 --crash-after 150
+    python benchmarks/bench_outbox.py --processes 4 --count 2000 --baseline
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+EVENT_NAME = re.compile(r"reminder-(\d+)")
+
+
+def seed(count: int, channels: int):
+    """送信時刻を過ぎた未送信のリマインダーを作成"""
+    import database
+    from epoch import to_epoch
+
+    database.init_db()
+    start = datetime.now() + timedelta(minutes=30)
+    remind_at = to_epoch(datetime.now() - timedelta(minutes=1))
+    conn = database.get_connection()
+    with conn:
+        for i in range(count):
+            slot = start + timedelta(minutes=i)
+            conn.execute("""
+                INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes, remind_at)
+                VALUES (?, ?, ?, ?, ?, ?, 15, ?)
+            """, ("U1", "user", f"C{i % channels}", f"reminder-{i}", to_epoch(slot),
+                  to_epoch(slot + timedelta(minutes=1)), remind_at))
+
+
+# ====================
+# 各プロセス
+# ====================
+
+def run_worker(log_path: str, latency: float, crash_after: int, baseline: bool, timeout: float):
+    """送信したリマインダーをlog_pathに1行ずつ書きながら、未送信がなくなるまで送信を繰り返す"""
+    from slack_stub import StubSlackApi
+
+    stub = StubSlackApi(latency)
+    stub.install()
+    import bot
+    import database
+    import outbox
+    from rate_limit import ChannelRateLimiter
+    from slack_sdk.web.client import WebClient
+    from views import format_reminder_message
+
+    # レート制限の待ち時間ではなく処理そのものを計測するため、制限を外す
+    outbox.channel_limiter = ChannelRateLimiter(1e9, 1e9)
+
+    log = open(log_path, "w", buffering=1)
+    posted = 0
+    api_call = WebClient.api_call
+
+    def record(client, api_method, **kwargs):
+        nonlocal posted
+        response = api_call(client, api_method, **kwargs)
+        if api_method == "chat.postMessage":
+            log.write(EVENT_NAME.search(str(kwargs)).group(1) + "\n")
+            posted += 1
+            if crash_after and posted >= crash_after:
+                # 送信済み・未記録のメッセージと確保を残したまま落ちる
+                os._exit(1)
+        return response
+
+    WebClient.api_call = record
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if baseline:
+            # outboxを通さずに取得・送信・記録する（変更前の動作）
+            reminders = [
+                {"id": r.id, "channel_id": r.channel_id, "text": format_reminder_message(r)}
+                for r in database.get_pending_reminders()
+            ]
+            sent_ids = [i for i, error in outbox.dispatch_messages(bot.app.client, reminders) if not error]
+            with database.get_connection() as conn:
+                conn.executemany("UPDATE reservations SET reminder_sent = TRUE WHERE id = ?", ((i,) for i in sent_ids))
+        else:
+            bot.send_reminders()
+            bot.outbox_worker.drain()
+        if not database.get_pending_reminders() and not database.get_outbox_stats()["pending"]:
+            break
+        time.sleep(0.05)
+    log.close()
+
+
+# ====================
+# 実行
+# ====================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4, help="同時に動かすプロセス数")
+    parser.add_argument("--count", type=int, default=2000, help="リマインダー数")
+    parser.add_argument("--channels", type=int, default=200, help="通知先チャンネル数")
+    parser.add_argument("--latency", type=float, default=0.005, help="スタブのchat.postMessageの応答時間（秒）")
+    parser.add_argument("--claim-seconds", type=float, default=3, help="OUTBOX_CLAIM_SECONDS")
+    parser.add_argument("--crash-after", type=int, default=0, help="1つ目のプロセスをこの件数を送信した時点で落とす")
+    parser.add_argument("--baseline", action="store_true", help="outboxを通さずに送信する（比較用）")
+    parser.add_argument("--timeout", type=float, default=120, help="各プロセスの最大実行秒数")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.latency, args.crash_after, args.baseline, args.timeout)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="bench-outbox-")
+    env = dict(
+        os.environ,
+        DATABASE_PATH=os.path.join(workdir, "reservations.db"),
+        SLACK_BOT_TOKEN="xoxb-bench",
+        SLACK_SIGNING_SECRET="bench",
+        OUTBOX_CLAIM_SECONDS=str(args.claim_seconds),
+    )
+    os.environ.update(env)
+    seed(args.count, args.channels)
+
+    logs = [os.path.join(workdir, f"worker-{i}.log") for i in range(args.processes)]
+    started = time.perf_counter()
+    workers = []
+    for i, log_path in enumerate(logs):
+        command = [
+            sys.executable, os.path.abspath(__file__), "--worker", log_path,
+            "--latency", str(args.latency), "--timeout", str(args.timeout)
+        ]
+        if args.baseline:
+            command.append("--baseline")
+        if i == 0 and args.crash_after:
+            command += ["--crash-after", str(args.crash_after)]
+        workers.append(subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL))
+    exit_codes = [w.wait() for w in workers]
+    elapsed = time.perf_counter() - started
+
+    sends = [Counter(open(log_path).read().split()) for log_path in logs]
+    total = sum(sends, Counter())
+    duplicates = {i for i, n in total.items() if n > 1}
+    missing = args.count - len(total)
+
+    print(
+        f"{args.processes} processes{' (baseline)' if args.baseline else ''}: "
+        f"{args.count} reminders in {elapsed:.2f}s, {sum(total.values())} posts, "
+        f"{len(duplicates)} sent more than once, {missing} never sent, exit codes {exit_codes}"
+    )
+    for i, counts in enumerate(sends):
+        print(f"  worker {i}: {sum(counts.values())} posts")
+
+    if args.crash_after:
+        # 再送されてよいのは、落ちたプロセスが送信済み・未記録のまま残した分だけ
+        unexpected = duplicates - set(sends[0])
+        print(f"  resent after crash: {len(duplicates)}, unexpected duplicates: {len(unexpected)}")
+        failed = bool(unexpected) or missing > 0
+    else:
+        failed = bool(duplicates) or missing > 0
+    if failed and not args.baseline:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+予約の行の読み込みのベンチマーク
+大量の予約を読み込み、従来の行ごとのdict（SELECT * + dict(row)、呼び出し側で日時をdatetimeに変換）と、
+reservation_factoryで必要な列だけを__slots__のReservationにする方法の時間・メモリを比較する
+
+    python benchmarks/bench_records.py --rows 1000000
+"""
+import argparse
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-records-"), "reservations.db")
+
+import database  # noqa: E402
+from epoch import from_epoch, to_epoch  # noqa: E402
+from reservation import COLUMNS, SUMMARY_COLUMNS, reservation_factory  # noqa: E402
+
+EVENT_NAMES = ["定例", "1on1", "レビュー", "採用面接", "顧客MTG", "勉強会"]
+
+
+def seed(rows: int):
+    """1日20枠（30分刻み）の予約をrows件作成"""
+    database.init_db()
+    start = datetime(2024, 1, 1, 7, 0)
+
+    def values():
+        for i in range(rows):
+            s = start + timedelta(days=i // 20, minutes=30 * (i % 20))
+            yield (
+                f"U{i % 500}", f"user{i % 500}", f"C{i % 20}", f"{EVENT_NAMES[i % len(EVENT_NAMES)]} {i}",
+                to_epoch(s), to_epoch(s + timedelta(minutes=30)), to_epoch(s - timedelta(minutes=15)),
+            )
+
+    conn = database.get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes, remind_at)
+            VALUES (?, ?, ?, ?, ?, ?, 15, ?)
+        """, values())
+
+
+def load_dicts(conn: sqlite3.Connection) -> list:
+    """変更前: 全列を読んでdictにし、呼び出し側で日時を変換する"""
+    rows = [dict(row) for row in conn.execute("SELECT * FROM reservations")]
+    for r in rows:
+        r["start_time"] = from_epoch(r["start_time"])
+        r["end_time"] = from_epoch(r["end_time"])
+        r["remind_at"] = from_epoch(r["remind_at"]) if r["remind_at"] is not None else None
+    return rows
+
+
+def load_records(conn: sqlite3.Connection, columns: str) -> list:
+    """変更後: 必要な列だけをReservationにする"""
+    cursor = conn.cursor()
+    cursor.row_factory = reservation_factory
+    return cursor.execute(f"SELECT {columns} FROM reservations").fetchall()
+
+
+def measure(name: str, load, repeat: int):
+    """読み込みの時間（repeat回の最小）と、読み込んだ一覧が保持するメモリ"""
+    elapsed = []
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        rows = load()
+        elapsed.append(time.perf_counter() - t)
+        del rows
+
+    gc.collect()
+    tracemalloc.start()
+    rows = load()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:<36} {min(elapsed):>7.2f}s  retained {retained / 1e6:>8.1f}MB  peak {peak / 1e6:>8.1f}MB"
+          f"  ({retained / len(rows):.0f} B/row)")
+    del rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000, help="予約数")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    seed(args.rows)
+    print(f"Seeded {args.rows} reservations in {time.perf_counter() - started:.1f}s\n")
+
+    conn = database.get_connection()
+    measure("before: SELECT * + dict(row)", lambda: load_dicts(conn), args.repeat)
+    measure("after: Reservation (COLUMNS)", lambda: load_records(conn, COLUMNS), args.repeat)
+    measure("after: Reservation (SUMMARY_COLUMNS)", lambda: load_records(conn, SUMMARY_COLUMNS), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
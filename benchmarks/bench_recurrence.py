@@ -0,0 +1,129 @@
+"""
+繰り返し予約のベンチマーク
+毎週・毎日の予約を1回ずつ行として作る方法と、シリーズ1行から各回を生成する方法で、
+作成・重複チェック・日付ごとの一覧・空き枠の取得にかかる時間を比較する
+
+    python benchmarks/bench_recurrence.py --series 100 --weeks 520 --background 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-recurrence-"), "reservations.db")
+
+import database  # noqa: E402
+from epoch import to_epoch  # noqa: E402
+
+def seed_background(first_day: datetime, count: int):
+    """単発の予約をcount件（各日07:00-09:00の枠内、繰り返し予約とは重ならない）"""
+    rng = random.Random(0)
+    conn = database.get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes, remind_at)
+            VALUES (?, 'user', 'C1', ?, ?, ?, 15, ?)
+        """, (
+            (f"U{i % 500}", f"meeting {i}", to_epoch(s), to_epoch(s + timedelta(minutes=30)),
+             to_epoch(s - timedelta(minutes=15)))
+            for i in range(count)
+            for s in [first_day.replace(hour=7) + timedelta(days=rng.randrange(3650), minutes=30 * rng.randrange(4))]
+        ))
+    database.init_db()
+
+
+def series_slots(first_day: datetime, count: int) -> list[tuple[str, datetime]]:
+    """互いに重ならない繰り返し予約の (種類, 初回の開始) をcount件
+
+    09:00-19:00の30分枠のうち、先頭の枠を毎日の予約に、残りの (曜日, 枠) を毎週の予約1件か、
+    1週ずらした隔週の予約2件に割り当てる（countが100なら115件分の枠に収まる）。
+    """
+    daily = max(1, count // 20)
+    slots = [("daily", first_day.replace(hour=9) + timedelta(minutes=30 * i)) for i in range(daily)]
+    combos = [(day, slot) for slot in range(daily, 20) for day in range(7)]
+    for k, (day, slot) in enumerate(combos):
+        start = first_day.replace(hour=9) + timedelta(days=day, minutes=30 * slot)
+        if k % 2 == 0:
+            slots.append(("weekly", start))
+        else:
+            slots.extend([("biweekly", start), ("biweekly", start + timedelta(weeks=1))])
+    return slots[:count]
+
+
+def measure(name: str, call, iterations: int):
+    latencies = []
+    result = None
+    for _ in range(iterations):
+        t = time.perf_counter()
+        result = call()
+        latencies.append((time.perf_counter() - t) * 1000)
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    print(f"  {name:<40} p50 {cuts[49]:>8.3f}ms  p95 {cuts[94]:>8.3f}ms  p99 {cuts[98]:>8.3f}ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=100, help="繰り返し予約の数（100程度まで）")
+    parser.add_argument("--weeks", type=int, default=520, help="1回ずつ行として作る場合の週数")
+    parser.add_argument("--background", type=int, default=100000, help="単発の予約数")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    database.init_db()
+    first_day = (datetime.now() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+    seed_background(first_day, args.background)
+    print(f"Seeded {args.background} single reservations")
+
+    # 作成: 毎週の予約をweeks回分の行として作る場合と、シリーズ1行の場合
+    print(f"\ncreate one weekly meeting ({args.weeks} weeks)")
+    start = first_day.replace(hour=22)
+    t = time.perf_counter()
+    for week in range(args.weeks):
+        s = start + timedelta(weeks=week)
+        database.reserve_if_free("UR", "rows", "C1", "rows", s, s + timedelta(minutes=30))
+    print(f"  {'rows (reserve_if_free x weeks)':<40} {(time.perf_counter() - t) * 1000:>10.1f}ms")
+
+    t = time.perf_counter()
+    database.reserve_series_if_free("US", "series", "C1", "series", start + timedelta(hours=1), start + timedelta(hours=1, minutes=30), "weekly")
+    print(f"  {'series (reserve_series_if_free)':<40} {(time.perf_counter() - t) * 1000:>10.1f}ms")
+
+    t = time.perf_counter()
+    created = 0
+    for frequency, s in series_slots(first_day, args.series):
+        series, conflict = database.reserve_series_if_free("U1", "user", "C1", f"{frequency} {s:%H:%M}", s, s + timedelta(minutes=30), frequency)
+        created += series is not None
+    print(f"  {f'{args.series} more series (one pass each)':<40} {(time.perf_counter() - t) * 1000:>10.1f}ms  ({created} created)")
+
+    rng = random.Random(1)
+    days = [first_day + timedelta(days=rng.randrange(3650)) for _ in range(args.iterations)]
+    it = iter(days * 4)
+
+    def check_single():
+        day = next(it)
+        return database.check_conflict(day.replace(hour=20), day.replace(hour=20, minute=30))
+
+    print(f"\nreads with {created + 1} series")
+    measure("check_conflict (single, free)", check_single, args.iterations)
+    measure(
+        "check_series_conflict (weekly, free)",
+        lambda: database.check_series_conflict(first_day.replace(hour=21), first_day.replace(hour=21, minute=30), "weekly"),
+        args.iterations,
+    )
+    database.day_cache.clear()
+    measure("get_reservations_by_date (uncached)", lambda: database._load_reservations_by_date(next(it).date().isoformat()), args.iterations)
+    measure("get_busy_slots (31 days)", lambda: database.get_busy_slots(first_day.date(), first_day.date() + timedelta(days=30)), args.iterations)
+    measure("get_reservations_page_by_user", lambda: database.get_reservations_page_by_user("U1", 100), args.iterations)
+
+    conn = database.get_connection()
+    print(f"\nrows: reservations {conn.execute('SELECT COUNT(*) FROM reservations').fetchone()[0]}, "
+          f"reservation_series {conn.execute('SELECT COUNT(*) FROM reservation_series').fetchone()[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+リマインダー送信のベンチマーク
+期限を過ぎたリマインダーを大量に用意し、スタブのSlackクライアントで送信し切るまでの時間を計測する
+
+    python benchmarks/bench_reminder_dispatch.py --count 10000 --channels 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-reminders-"), "reservations.db")
+
+from slack_sdk.errors import SlackApiError  # noqa: E402
+from slack_sdk.web.slack_response import SlackResponse  # noqa: E402
+
+import database  # noqa: E402
+from epoch import to_epoch  # noqa: E402
+from rate_limit import ChannelRateLimiter  # noqa: E402
+from outbox import dispatch_messages  # noqa: E402
+from views import format_reminder_message  # noqa: E402
+
+
+class StubClient:
+    """chat_postMessageだけを持つスタブ（一定の遅延と、指定した割合で429を返す）"""
+
+    def __init__(self, latency: float, rate_limited_ratio: float, retry_after: float):
+        self.latency = latency
+        self.rate_limited_ratio = rate_limited_ratio
+        self.retry_after = retry_after
+        self.calls = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    def chat_postMessage(self, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            limited = self.rate_limited_ratio and self.calls % int(1 / self.rate_limited_ratio) == 0
+            if limited:
+                self.rate_limited += 1
+        if limited:
+            response = SlackResponse(
+                client=self, http_verb="POST", api_url="chat.postMessage", req_args={},
+                data={"ok": False, "error": "ratelimited"},
+                headers={"Retry-After": str(self.retry_after)}, status_code=429
+            )
+            raise SlackApiError("ratelimited", response)
+        return {"ok": True}
+
+
+def seed(count: int, channels: int):
+    """送信時刻を過ぎた未送信のリマインダーを作成"""
+    database.init_db()
+    start = datetime.now() + timedelta(minutes=10)
+    remind_at = to_epoch(datetime.now() - timedelta(minutes=1))
+    conn = database.get_connection()
+    with conn:
+        conn.execute("DELETE FROM reservations")
+        conn.executemany("""
+            INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes, remind_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            (f"U{i % 50}", f"user{i % 50}", f"C{i % channels}", f"meeting {i}",
+             to_epoch(start + timedelta(seconds=i)), to_epoch(start + timedelta(minutes=30)), 15, remind_at)
+            for i in range(count)
+        ))
+
+
+def mark_sent(reservation_ids: list[int]):
+    """変更前の送信済みの記録（outboxを通さずに予約へ直接書く）"""
+    conn = database.get_connection()
+    with conn:
+        conn.executemany("UPDATE reservations SET reminder_sent = TRUE WHERE id = ?", ((i,) for i in reservation_ids))
+
+
+def drain_serial(client) -> int:
+    """従来の送信方法（1件ずつ送信し、1件ずつ送信済みにする）"""
+    sent = 0
+    for r in database.get_pending_reminders():
+        try:
+            client.chat_postMessage(channel=r.channel_id, text=format_reminder_message(r))
+        except SlackApiError:
+            continue
+        database.mark_reminder_sent(r.id)
+        sent += 1
+    return sent
+
+
+def drain_pooled(client, workers: int, rate: float, burst: float, batch: int) -> int:
+    """ワーカープール + チャンネルごとのレート制限 + まとめて送信済みにする"""
+    executor = ThreadPoolExecutor(max_workers=workers)
+    limiter = ChannelRateLimiter(rate, burst)
+    messages = [
+        {"id": r.id, "channel_id": r.channel_id, "text": format_reminder_message(r)}
+        for r in database.get_pending_reminders()
+    ]
+    sent_ids = []
+    sent = 0
+    for reservation_id, error in dispatch_messages(client, messages, executor, limiter):
+        if error:
+            continue
+        sent_ids.append(reservation_id)
+        sent += 1
+        if len(sent_ids) >= batch:
+            mark_sent(sent_ids)
+            sent_ids = []
+    mark_sent(sent_ids)
+    executor.shutdown()
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10000, help="期限を過ぎたリマインダーの件数")
+    parser.add_argument("--channels", type=int, default=1000, help="送信先チャンネル数")
+    parser.add_argument("--latency", type=float, default=0.01, help="スタブのAPI応答時間（秒）")
+    parser.add_argument("--rate-limited", type=float, default=0.001, help="429を返す割合")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429のRetry-After（秒）")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=1.0, help="チャンネルごとの送信レート（件/秒）")
+    parser.add_argument("--burst", type=float, default=3)
+    parser.add_argument("--batch", type=int, default=100, help="送信済みマークの書き込み単位")
+    parser.add_argument("--serial", action="store_true", help="従来の逐次送信も計測する")
+    args = parser.parse_args()
+
+    runs = [("pooled", lambda client: drain_pooled(client, args.workers, args.rate, args.burst, args.batch))]
+    if args.serial:
+        runs.insert(0, ("serial", drain_serial))
+
+    for name, drain in runs:
+        seed(args.count, args.channels)
+        client = StubClient(args.latency, args.rate_limited, args.retry_after)
+        started = time.perf_counter()
+        sent = drain(client)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{name:>6}: {sent}/{args.count} sent in {elapsed:.2f}s "
+            f"({sent / elapsed:.0f} msg/s, {client.calls} API calls, {client.rate_limited} rate limited)"
+        )
+
+
+if __name__ == "__main__":
+    main()
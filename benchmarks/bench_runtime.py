@@ -0,0 +1,143 @@
+"""
+Botランタイムの負荷ベンチマーク（スレッド版 bot.py と asyncio版 async_bot.py の比較）
+Slack APIをスタブ（一定の遅延）に差し替え、予約モーダルの送信と「確認」メンションを
+同時に大量に流して、処理件数/秒とackまでのレイテンシ（p50/p99）を計測する
+
+    python benchmarks/bench_runtime.py --events 2000 --concurrency 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-runtime-"), "reservations.db")
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-bench")
+os.environ.setdefault("SLACK_SIGNING_SECRET", "bench")
+
+from slack_bolt.request import BoltRequest  # noqa: E402
+from slack_bolt.request.async_request import AsyncBoltRequest  # noqa: E402
+
+from slack_stub import StubSlackApi, mention_event, reservation_values, view_submission  # noqa: E402
+
+# 30分刻みの予約枠（09:00-18:00）
+SLOTS = [f"{h:02d}:{m:02d}" for h in range(9, 18) for m in (0, 30)] + ["18:00"]
+FIRST_DAY = date.today() + timedelta(days=30)
+
+
+def build_events(count: int) -> list[dict]:
+    """予約モーダルの送信と「確認」メンションを交互に並べたリクエストボディ"""
+    events = []
+    slot_pairs = list(zip(SLOTS, SLOTS[1:]))
+    for i in range(count):
+        day = FIRST_DAY + timedelta(days=(i // 2) // len(slot_pairs))
+        user_id = f"U{i % 20}"
+        if i % 2 == 0:
+            start, end = slot_pairs[(i // 2) % len(slot_pairs)]
+            values = reservation_values(day.isoformat(), start, end, f"meeting {i}")
+            events.append(view_submission("reservation_modal", values, user_id))
+        else:
+            events.append(mention_event(user_id, f"確認 {day.strftime('%Y/%m/%d')}"))
+    return events
+
+
+def reset_database():
+    import database
+    database.init_db()
+    conn = database.get_connection()
+    with conn:
+        conn.execute("DELETE FROM reservations")
+    database.init_db()
+
+
+def run_threaded(events: list[dict], concurrency: int, until: Callable[[], bool]) -> list[float]:
+    """bot.py のAppに、Socket Modeと同じくスレッドプールからdispatchする"""
+    import bot
+
+    # 通知はoutboxのワーカーが送る
+    threading.Thread(target=bot.outbox_worker.run, daemon=True).start()
+
+    def dispatch(body: dict) -> float:
+        started = time.perf_counter()
+        response = bot.app.dispatch(BoltRequest(body=body, mode="socket_mode"))
+        assert response.status == 200, response.body
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(dispatch, events))
+    while not until():
+        time.sleep(0.01)
+    return latencies
+
+
+def run_async(events: list[dict], concurrency: int, until: Callable[[], bool]) -> list[float]:
+    """async_bot.py のAsyncAppに、同時実行数を制限してdispatchする"""
+    import async_bot
+
+    async def dispatch_all() -> list[float]:
+        semaphore = asyncio.Semaphore(concurrency)
+        outbox_task = asyncio.create_task(async_bot.outbox_worker.run())
+
+        async def dispatch(body: dict) -> float:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await async_bot.app.async_dispatch(AsyncBoltRequest(body=body, mode="socket_mode"))
+                assert response.status == 200, response.body
+                return time.perf_counter() - started
+
+        latencies = await asyncio.gather(*(dispatch(body) for body in events))
+        # ack後のタスク（予約作成・通知）が終わるまで待つ
+        while async_bot._deferred_tasks:
+            await asyncio.gather(*list(async_bot._deferred_tasks))
+        # outboxに積まれた通知が送られるまで待つ
+        while not until():
+            await asyncio.sleep(0.01)
+        outbox_task.cancel()
+        return latencies
+
+    return asyncio.run(dispatch_all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000, help="流すリクエスト数（半分が予約、半分が確認）")
+    parser.add_argument("--concurrency", type=int, default=50, help="同時に処理中のリクエスト数")
+    parser.add_argument("--latency", type=float, default=0.05, help="スタブのAPI応答時間（秒）")
+    parser.add_argument("--runtime", choices=["thread", "async", "both"], default="both")
+    args = parser.parse_args()
+
+    stub = StubSlackApi(args.latency)
+    stub.install()
+    events = build_events(args.events)
+
+    # チャンネルごとのレート制限の待ち時間ではなく処理そのものを計測するため、制限を外す
+    import outbox
+    from rate_limit import ChannelRateLimiter
+    outbox.channel_limiter = ChannelRateLimiter(1e9, 1e9)
+
+    runs = {"thread": run_threaded, "async": run_async}
+    names = ["thread", "async"] if args.runtime == "both" else [args.runtime]
+    for name in names:
+        reset_database()
+        expected = stub.responses + len(events)
+        started = time.perf_counter()
+        # 各リクエストは最後に1回chat.postMessageする
+        latencies = runs[name](events, args.concurrency, lambda: stub.responses >= expected)
+        elapsed = time.perf_counter() - started
+
+        cuts = statistics.quantiles(latencies, n=100)
+        print(
+            f"{name:>6}: {len(events)} events in {elapsed:.2f}s ({len(events) / elapsed:.0f} events/s), "
+            f"ack p50 {cuts[49] * 1000:.1f}ms p99 {cuts[98] * 1000:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
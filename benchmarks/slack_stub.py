@@ -0,0 +1,135 @@
+"""
+ベンチマーク用のスタブSlack APIとリクエストボディの生成
+WebClient / AsyncWebClient のapi_callを差し替え、ネットワークに出ずに一定の遅延で成功を返す
+"""
+import asyncio
+import threading
+import time
+from itertools import count
+
+from slack_sdk.web.client import WebClient
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.web.slack_response import SlackResponse
+from slack_sdk.web.async_slack_response import AsyncSlackResponse
+
+# ユーザーに見える応答（ハンドラーの処理完了の目印にする）
+RESPONSE_METHODS = ("chat.postMessage", "views.open")
+
+_ids = count(1)
+
+
+class StubSlackApi:
+    """api_callを差し替えて、auth.test以外は一定の遅延のあと成功を返す"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: dict[str, int] = {}
+        self.responses = 0
+        self._cond = threading.Condition()
+
+    def _data(self, api_method: str, kwargs: dict) -> dict:
+        with self._cond:
+            self.calls[api_method] = self.calls.get(api_method, 0) + 1
+            if api_method in RESPONSE_METHODS:
+                self.responses += 1
+                self._cond.notify_all()
+
+        if api_method == "auth.test":
+            return {"ok": True, "user_id": "UBOT", "bot_id": "BBOT", "team_id": "T1"}
+        if api_method == "users.info":
+            user_id = (kwargs.get("params") or {}).get("user", "U0")
+            return {"ok": True, "user": {"id": user_id, "name": user_id.lower(), "real_name": f"User {user_id}"}}
+        return {"ok": True}
+
+    def install(self):
+        stub = self
+
+        def api_call(client, api_method, **kwargs):
+            if api_method != "auth.test" and stub.latency:
+                time.sleep(stub.latency)
+            return SlackResponse(
+                client=client, http_verb="POST", api_url=api_method, req_args={},
+                data=stub._data(api_method, kwargs), headers={}, status_code=200
+            )
+
+        async def api_call_async(client, api_method, **kwargs):
+            if api_method != "auth.test" and stub.latency:
+                await asyncio.sleep(stub.latency)
+            return AsyncSlackResponse(
+                client=client, http_verb="POST", api_url=api_method, req_args={},
+                data=stub._data(api_method, kwargs), headers={}, status_code=200
+            )
+
+        WebClient.api_call = api_call
+        AsyncWebClient.api_call = api_call_async
+
+    def wait_for_responses(self, expected: int, timeout: float = 120) -> bool:
+        """応答（chat.postMessage / views.open）の累計がexpectedに達するまで待つ"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.responses >= expected, timeout)
+
+
+# ====================
+# リクエストボディ
+# ====================
+
+def mention_event(user_id: str, text: str) -> dict:
+    """app_mentionのイベント"""
+    i = next(_ids)
+    return {
+        "type": "event_callback", "team_id": "T1", "api_app_id": "A1", "token": "t",
+        "event_id": f"Ev{i}", "event_time": int(time.time()),
+        "event": {"type": "app_mention", "user": user_id, "channel": "C1", "ts": f"{i}.000100",
+                  "text": f"<@UBOT> {text}"},
+    }
+
+
+def block_action(action_id: str, user_id: str) -> dict:
+    """ボタンのblock_actions"""
+    i = next(_ids)
+    return {
+        "type": "block_actions", "team": {"id": "T1"}, "user": {"id": user_id},
+        "api_app_id": "A1", "token": "t", "trigger_id": f"trigger{i}",
+        "channel": {"id": "C1"}, "container": {"type": "message", "message_ts": f"{i}.000100"},
+        "actions": [{"type": "button", "action_id": action_id, "block_id": "b", "action_ts": f"{i}.000200"}],
+    }
+
+
+def view_submission(callback_id: str, values: dict, user_id: str) -> dict:
+    """モーダルのview_submission"""
+    i = next(_ids)
+    return {
+        "type": "view_submission", "team": {"id": "T1"}, "user": {"id": user_id},
+        "api_app_id": "A1", "token": "t", "trigger_id": f"trigger{i}",
+        "view": {"id": f"V{i}", "type": "modal", "callback_id": callback_id,
+                 "state": {"values": values}, "private_metadata": user_id},
+    }
+
+
+def block_suggestion(action_id: str, block_id: str, values: dict, user_id: str, value: str = "") -> dict:
+    """external_selectの選択肢の要求（valuesは要求時点のモーダルの入力値）"""
+    i = next(_ids)
+    return {
+        "type": "block_suggestion", "team": {"id": "T1"}, "user": {"id": user_id},
+        "api_app_id": "A1", "token": "t", "action_id": action_id, "block_id": block_id, "value": value,
+        "container": {"type": "view", "view_id": f"V{i}"},
+        "view": {"id": f"V{i}", "type": "modal", "callback_id": "reservation_modal",
+                 "state": {"values": values}, "private_metadata": user_id},
+    }
+
+
+def reservation_values(day: str, start: str, end: str, event_name: str, channel_id: str = "C1") -> dict:
+    """予約モーダルの入力値（dayはYYYY-MM-DD、start/endはHH:MM）"""
+    return {
+        "channel_block": {"channel_select": {"selected_conversation": channel_id}},
+        "date_block": {"date_select": {"selected_date": day}},
+        "start_time_block": {"start_time_select": {"selected_option": {"value": start}}},
+        "end_time_block": {"end_time_select": {"selected_option": {"value": end}}},
+        "event_name_block": {"event_name_input": {"value": event_name}},
+        "reminder_block": {"reminder_select": {"selected_option": {"value": "15"}}},
+    }
+
+
+def cancel_values(reservation_id: int) -> dict:
+    """キャンセルモーダルの入力値"""
+    return {"reservation_block": {"reservation_select": {"selected_option": {"value": str(reservation_id)}}}}
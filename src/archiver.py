@@ -0,0 +1,83 @@
+"""
+過去の予約のアーカイブ
+終了からARCHIVE_AFTER_DAYS日を過ぎた予約を、reservationsから同じDBのreservations_archiveへ少しずつ移す。
+1回のトランザクションはARCHIVE_BATCH_SIZE件までにして間を空けるため、予約の書き込みを長く止めない。
+DBのリースを取った1プロセスだけが行う
+"""
+import asyncio
+import time
+from datetime import datetime, time as dt_time, timedelta
+from typing import Optional
+
+import async_database as db
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL_SECONDS
+from database import acquire_lease, archive_reservations, checkpoint_wal
+from reminder_scheduler import WORKER_ID
+
+# アーカイブを行う役のリース名
+ARCHIVE_LEASE = "archive"
+
+# バッチの間に空ける時間（秒）。この間に他の書き込みがロックを取れる
+ARCHIVE_PAUSE_SECONDS = 0.05
+
+
+def archive_cutoff(now: Optional[datetime] = None) -> datetime:
+    """これより前に終わった予約をアーカイブする時刻
+
+    日付の境目にそろえ、今日に始まった予約は移さない（確認の一覧は前日以前だけアーカイブも読む）。
+    """
+    today = (now or datetime.now()).date()
+    return datetime.combine(today - timedelta(days=max(1, ARCHIVE_AFTER_DAYS)), dt_time.min)
+
+
+def archive_once() -> int:
+    """リースを取れたら、アーカイブの対象がなくなるまでバッチごとに移す（移した件数を返す）"""
+    if not acquire_lease(ARCHIVE_LEASE, WORKER_ID, ARCHIVE_INTERVAL_SECONDS):
+        return 0
+    before = archive_cutoff()
+    total = 0
+    while True:
+        moved = archive_reservations(before, ARCHIVE_BATCH_SIZE)
+        total += moved
+        if moved < ARCHIVE_BATCH_SIZE:
+            break
+        time.sleep(ARCHIVE_PAUSE_SECONDS)
+    if total:
+        checkpoint_wal()
+    return total
+
+
+def run():
+    """ARCHIVE_INTERVAL_SECONDSごとにアーカイブするループ（スレッド版）"""
+    while True:
+        try:
+            moved = archive_once()
+            if moved:
+                print(f"Archived {moved} reservations")
+        except Exception as e:
+            print(f"Archive error: {e}")
+        time.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+
+async def run_async():
+    """ARCHIVE_INTERVAL_SECONDSごとにアーカイブするタスク（asyncio版）
+
+    バッチごとにDB用スレッドで実行し、間はイベントループで待つ。
+    """
+    while True:
+        try:
+            moved = 0
+            if await db.acquire_lease(ARCHIVE_LEASE, WORKER_ID, ARCHIVE_INTERVAL_SECONDS):
+                before = archive_cutoff()
+                while True:
+                    count = await db.archive_reservations(before, ARCHIVE_BATCH_SIZE)
+                    moved += count
+                    if count < ARCHIVE_BATCH_SIZE:
+                        break
+                    await asyncio.sleep(ARCHIVE_PAUSE_SECONDS)
+            if moved:
+                await db.checkpoint_wal()
+                print(f"Archived {moved} reservations")
+        except Exception as e:
+            print(f"Archive error: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
@@ -0,0 +1,437 @@
+"""
+会議室予約Bot - asyncio版
+bot.pyと同じ機能をAsyncApp + aiohttpのSocket Mode + asyncioタスクで動かす。
+BOT_RUNTIME=async で bot.py から、または python async_bot.py で直接起動する
+"""
+import asyncio
+import logging
+import time
+from datetime import date
+
+from slack_bolt import BoltResponse
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_sdk.web.async_client import AsyncWebClient
+
+# ログ設定（接続状態の監視用）
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+from config import (
+    SLACK_BOT_TOKEN,
+    SLACK_SIGNING_SECRET,
+    SLACK_APP_TOKEN,
+    SLACK_API_URL,
+    USER_CACHE_TTL,
+    USER_CACHE_SIZE,
+    EVENT_DEDUP_TTL,
+    EVENT_DEDUP_SIZE,
+    EVENT_DEDUP_SHARED,
+    METRICS_ENABLED,
+    REMINDER_LEASE_SECONDS,
+)
+import archiver
+import async_database as db
+from event_dedup import EventDeduplicator, event_key
+from metrics import (
+    timed_handler,
+    observe_ack,
+    instrument_slack_api,
+    SOCKET_MODE_CONNECTED,
+    SOCKET_MODE_RECONNECTS,
+)
+from handlers import (
+    apply_reminder_update,
+    mention_replies,
+    start_time_options,
+    time_options,
+    check_reservation_submission,
+    save_reservation,
+    save_series,
+    notify_no_cancellable,
+    cancel_options,
+    check_cancel_submission,
+    cancel_submitted,
+    queue_reminders,
+)
+from metrics_server import serve_metrics
+from outbox import AsyncOutboxWorker
+from reminder_scheduler import (
+    AsyncReminderScheduler,
+    apply_reminder_changes,
+    REMINDER_LEASE,
+    REMINDER_SYNC_SECONDS,
+    WORKER_ID,
+)
+from user_cache import UserCache
+from views import (
+    strip_mention,
+    build_reservation_modal,
+    build_cancel_modal,
+)
+
+app = AsyncApp(client=AsyncWebClient(token=SLACK_BOT_TOKEN, base_url=SLACK_API_URL), signing_secret=SLACK_SIGNING_SECRET)
+
+# 実行中のack後タスク（完了前にGCされないよう参照を持っておく）
+_deferred_tasks: set[asyncio.Task] = set()
+
+# 通知はoutboxに積み、このワーカーが送る
+outbox_worker = AsyncOutboxWorker(app.client)
+
+# 再送されたイベント・操作を落とすための受信済みのキー
+event_dedup = EventDeduplicator(EVENT_DEDUP_TTL, EVENT_DEDUP_SIZE)
+
+
+@app.middleware
+async def record_received_at(context, next):
+    """リクエストの受信時刻を記録（ackまでのレイテンシ計測用）"""
+    context["received_at"] = time.perf_counter()
+    await next()
+
+
+@app.middleware
+async def drop_duplicate_events(body, next):
+    """再送されたイベント・操作はリスナーを動かさずにackする（HTTP版で複数ワーカーならEVENT_DEDUP_SHAREDでDBでも判定）"""
+    key = event_key(body)
+    if key and not await event_dedup.claim_async(key, db.claim_event if EVENT_DEDUP_SHARED else None):
+        return BoltResponse(status=200, body="")
+    await next()
+
+
+# ====================
+# ユーティリティ関数
+# ====================
+
+def log_ack_latency(name: str, context):
+    """受信からackまでの時間をログに出す"""
+    elapsed = time.perf_counter() - context["received_at"]
+    observe_ack(name, elapsed)
+    print(f"[ACK] {name}: {elapsed * 1000:.1f}ms")
+
+
+def run_deferred(coro):
+    """ack後の処理をタスクとして実行（例外はログに出す）"""
+    async def run():
+        try:
+            await coro
+        except Exception as e:
+            print(f"Deferred task {coro.__name__} failed: {e}")
+
+    task = asyncio.create_task(run())
+    _deferred_tasks.add(task)
+    task.add_done_callback(_deferred_tasks.discard)
+
+
+# ユーザー情報のキャッシュ（予約送信のたびにusers_infoを呼ばないように）
+user_cache = UserCache(USER_CACHE_TTL, USER_CACHE_SIZE)
+
+
+async def get_user_name(client, user_id: str) -> str:
+    """ユーザーの表示名を取得（キャッシュ経由）"""
+    async def load(uid: str) -> dict:
+        return (await client.users_info(user=uid))["user"]
+
+    user = await user_cache.get_async(user_id, load)
+    return user.get("real_name") or user["name"]
+
+
+async def warm_user_cache(client):
+    """users_listでワークスペースのユーザーをまとめて取得してキャッシュする"""
+    count = 0
+    cursor = None
+    try:
+        while True:
+            params = {"limit": 200}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.users_list(**params)
+            members = [m for m in response["members"] if not m.get("deleted")]
+            user_cache.put_many(members)
+            count += len(members)
+
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+    except Exception as e:
+        print(f"User cache warm-up failed: {e}")
+        return
+
+    print(f"User cache warmed: {count} users")
+
+
+# ====================
+# メンション処理
+# ====================
+
+@app.event("app_mention")
+@timed_handler
+async def handle_app_mention(body, client, event, say):
+    """メンションを処理してモーダルを開く"""
+    text = strip_mention(event["text"])
+    user_id = event["user"]
+
+    # 読み取りと返信の組み立てはまとめてDB用スレッドで実行する
+    for reply in await db.run_db(mention_replies, text, user_id):
+        await say(**reply)
+
+
+# ====================
+# 予約モーダル
+# ====================
+
+@app.action("open_reservation_modal")
+@timed_handler
+async def handle_open_reservation_modal(ack, body, client):
+    """予約モーダルを開くボタンのアクション"""
+    await ack()
+
+    user_id = body["user"]["id"]
+    await client.views_open(trigger_id=body["trigger_id"], view=build_reservation_modal(user_id))
+
+    # 直後に来る開始時刻の選択肢の要求に備え、初期値の日付（今日）の分を作っておく
+    await db.run_db(start_time_options, date.today())
+
+
+@app.options("start_time_select")
+@timed_handler
+async def handle_start_time_options(ack, body):
+    """開始時刻の選択肢を返す（選択中の日付の空いている枠のみ）"""
+    await ack(options=await db.run_db(time_options, body, False))
+
+
+@app.options("end_time_select")
+@timed_handler
+async def handle_end_time_options(ack, body):
+    """終了時刻の選択肢を返す（開始時刻を選択済みなら、そこから次の予約までの時刻のみ）"""
+    await ack(options=await db.run_db(time_options, body, True))
+
+
+@app.view("reservation_modal")
+@timed_handler
+async def handle_reservation_submission(ack, body, client, view, context):
+    """予約モーダルの送信処理（入力チェックだけ行ってack、予約作成・通知は後段で実行）"""
+    user_id = body["user"]["id"]
+    form, errors = await db.run_db(check_reservation_submission, view)
+
+    if errors:
+        await ack(response_action="errors", errors=errors)
+        log_ack_latency("reservation_modal", context)
+        return
+
+    await ack()
+    log_ack_latency("reservation_modal", context)
+
+    if form["frequency"]:
+        run_deferred(persist_series(client, user_id, form))
+    else:
+        run_deferred(persist_reservation(client, user_id, form))
+
+
+@timed_handler
+async def persist_reservation(client, user_id: str, form: dict):
+    """予約を作成して通知（ack後に実行）"""
+    user_name = await get_user_name(client, user_id)
+    update = await db.run_db(save_reservation, user_id, user_name, form)
+    outbox_worker.notify()
+    apply_reminder_update(reminder_scheduler, update)
+
+
+@timed_handler
+async def persist_series(client, user_id: str, form: dict):
+    """繰り返し予約を作成して通知（ack後に実行）"""
+    user_name = await get_user_name(client, user_id)
+    update = await db.run_db(save_series, user_id, user_name, form)
+    outbox_worker.notify()
+    apply_reminder_update(reminder_scheduler, update)
+
+
+# ====================
+# キャンセルモーダル
+# ====================
+
+@app.action("open_cancel_modal")
+@timed_handler
+async def handle_open_cancel_modal(ack, body, client):
+    """キャンセルモーダルを開くボタンのアクション"""
+    await ack()
+
+    user_id = body["user"]["id"]
+    if await db.run_db(notify_no_cancellable, user_id):
+        outbox_worker.notify()
+        return
+
+    await client.views_open(trigger_id=body["trigger_id"], view=build_cancel_modal(user_id))
+
+
+@app.options("reservation_select")
+@timed_handler
+async def handle_cancel_options(ack, body):
+    """キャンセルする予約の選択肢を返す（入力した日付・ミーティング名で絞り込み、1ページ分だけ読む）"""
+    await ack(options=await db.run_db(cancel_options, body))
+
+
+@app.view("cancel_modal")
+@timed_handler
+async def handle_cancel_submission(ack, body, client, view, context):
+    """キャンセルモーダルの送信処理（本人の予約か確認してack、削除・通知は後段で実行）"""
+    user_id = body["user"]["id"]
+    form, error = await db.run_db(check_cancel_submission, view, user_id)
+    if error:
+        await ack(response_action="errors", errors={"reservation_block": error})
+        log_ack_latency("cancel_modal", context)
+        return
+
+    await ack()
+    log_ack_latency("cancel_modal", context)
+
+    run_deferred(cancel_reservation(user_id, form))
+
+
+@timed_handler
+async def cancel_reservation(user_id: str, form: dict):
+    """予約・繰り返し予約の回を削除して通知（ack後に実行）"""
+    update = await db.run_db(cancel_submitted, user_id, form)
+    outbox_worker.notify()
+    apply_reminder_update(reminder_scheduler, update)
+
+
+# ====================
+# リマインダー機能
+# ====================
+
+@timed_handler
+async def send_reminders():
+    """送信時刻を過ぎた未送信のリマインダーをoutboxに積む（送信はoutboxのワーカーが行う）"""
+    if await db.run_db(queue_reminders):
+        outbox_worker.notify()
+
+
+reminder_scheduler = AsyncReminderScheduler(send_reminders)
+
+
+async def load_reminders() -> int:
+    """DBから未送信のリマインダーを読み込み直し、変更履歴の現在の番号を返す"""
+    # 先に番号を読むので、読み込み中の変更は次の反映で重ねて適用される（登録・取り消しは冪等）
+    seq = await db.get_last_change_seq()
+    reminders = await db.get_upcoming_reminders()
+    reminder_scheduler.clear()
+    for reservation_id, remind_at in reminders:
+        reminder_scheduler.schedule(reservation_id, remind_at)
+    return seq
+
+
+async def sync_reminder_changes(seq: int) -> int:
+    """他のプロセスによる予約の作成・削除をスケジューラに反映し、反映済みの番号を返す"""
+    changes = await db.get_changes(seq)
+    if not changes:
+        return seq
+    if not apply_reminder_changes(reminder_scheduler, changes, seq):
+        return await load_reminders()
+    return changes[-1]["seq"]
+
+
+async def reminder_leader_loop():
+    """リマインダーの送信役のリースを取得・延長し続けるタスク
+
+    リースを持つプロセスは変更履歴を追って全予約のリマインダーを登録する。
+    持たないプロセスも自分で作成した予約の分はoutboxに積むが、送信済みへの更新と同時に積むため重複はしない。
+    """
+    scheduler_task = asyncio.create_task(reminder_scheduler.run())
+    leader = False
+    seq = 0
+    renew_every = max(1, int(REMINDER_LEASE_SECONDS / 3 / REMINDER_SYNC_SECONDS))
+    tick = 0
+
+    try:
+        while True:
+            if tick % renew_every == 0:
+                try:
+                    acquired = await db.acquire_lease(REMINDER_LEASE, WORKER_ID, REMINDER_LEASE_SECONDS)
+                except Exception as e:
+                    print(f"Reminder lease error: {e}")
+                    acquired = False
+
+                if acquired and not leader:
+                    # 送信時刻を過ぎたものは即座に送信される
+                    seq = await load_reminders()
+                    print(f"Reminder lease acquired by {WORKER_ID}")
+                elif leader and not acquired:
+                    print(f"Reminder lease lost by {WORKER_ID}")
+                leader = acquired
+
+            if leader:
+                try:
+                    seq = await sync_reminder_changes(seq)
+                except Exception as e:
+                    print(f"Reminder sync error: {e}")
+
+            tick += 1
+            await asyncio.sleep(REMINDER_SYNC_SECONDS)
+    finally:
+        scheduler_task.cancel()
+        if leader:
+            # 次のプロセスがリースの期限切れを待たずに引き継げるようにする
+            await db.release_lease(REMINDER_LEASE, WORKER_ID)
+
+
+# ====================
+# メイン
+# ====================
+
+def socket_mode_connected(client) -> bool:
+    """aiohttp版のSocket Modeクライアントが接続中か（is_connectedはasyncのため同じ条件を同期で見る）"""
+    session = client.current_session
+    return not client.closed and session is not None and not session.closed
+
+
+async def count_reconnect(message):
+    """切断されるとSDKが自動で再接続する"""
+    SOCKET_MODE_RECONNECTS.inc()
+
+
+async def main():
+    """メインエントリーポイント（asyncio版）"""
+    instrument_slack_api()
+    await db.init_db()
+    print("Database initialized.")
+
+    metrics_task = asyncio.create_task(serve_metrics()) if METRICS_ENABLED else None
+
+    outbox_task = asyncio.create_task(outbox_worker.run())
+    reminder_task = asyncio.create_task(reminder_leader_loop())
+    print("Reminder scheduler started.")
+
+    archive_task = asyncio.create_task(archiver.run_async())
+
+    warm_task = asyncio.create_task(warm_user_cache(app.client))
+
+    # Socket Mode接続（自動再接続付き）
+    try:
+        while True:
+            try:
+                handler = AsyncSocketModeHandler(app, SLACK_APP_TOKEN)
+                SOCKET_MODE_CONNECTED.set_function(lambda c=handler.client: socket_mode_connected(c))
+                handler.client.on_close_listeners.append(count_reconnect)
+                print("Bot is running... (Socket Mode, asyncio)")
+                await handler.start_async()
+            except Exception as e:
+                SOCKET_MODE_RECONNECTS.inc()
+                print(f"Connection error: {e}")
+                print("Reconnecting in 5 seconds...")
+                await asyncio.sleep(5)
+    finally:
+        reminder_task.cancel()
+        archive_task.cancel()
+        outbox_task.cancel()
+        warm_task.cancel()
+        if metrics_task:
+            metrics_task.cancel()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Bot stopped by user.")
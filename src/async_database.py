@@ -0,0 +1,59 @@
+"""
+データベース操作（asyncio版）
+database.pyの関数を専用スレッドプールで実行し、イベントループを止めないようにする。
+接続・区間インデックス・日付キャッシュはdatabase.pyのものをそのまま共有する
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+# DB専用のスレッド（スレッドごとの接続が使い回される）
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="db")
+
+
+async def run_db(func, *args, **kwargs):
+    """同期関数をDB用スレッドで実行"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _to_async(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+init_db = _to_async(database.init_db)
+create_reservation = _to_async(database.create_reservation)
+reserve_if_free = _to_async(database.reserve_if_free)
+reserve_series_if_free = _to_async(database.reserve_series_if_free)
+get_reservation = _to_async(database.get_reservation)
+get_series = _to_async(database.get_series)
+get_reservations_by_date = _to_async(database.get_reservations_by_date)
+get_reservations_by_user = _to_async(database.get_reservations_by_user)
+has_upcoming_reservations = _to_async(database.has_upcoming_reservations)
+get_reservations_page_by_user = _to_async(database.get_reservations_page_by_user)
+delete_reservation = _to_async(database.delete_reservation)
+cancel_occurrence = _to_async(database.cancel_occurrence)
+check_conflict = _to_async(database.check_conflict)
+check_series_conflict = _to_async(database.check_series_conflict)
+get_busy_slots = _to_async(database.get_busy_slots)
+get_pending_reminders = _to_async(database.get_pending_reminders)
+get_upcoming_reminders = _to_async(database.get_upcoming_reminders)
+queue_due_reminders = _to_async(database.queue_due_reminders)
+mark_reminder_sent = _to_async(database.mark_reminder_sent)
+enqueue_messages = _to_async(database.enqueue_messages)
+claim_outbox_messages = _to_async(database.claim_outbox_messages)
+complete_outbox_messages = _to_async(database.complete_outbox_messages)
+fail_outbox_messages = _to_async(database.fail_outbox_messages)
+get_changes = _to_async(database.get_changes)
+get_last_change_seq = _to_async(database.get_last_change_seq)
+claim_event = _to_async(database.claim_event)
+release_event = _to_async(database.release_event)
+acquire_lease = _to_async(database.acquire_lease)
+release_lease = _to_async(database.release_lease)
+archive_reservations = _to_async(database.archive_reservations)
+checkpoint_wal = _to_async(database.checkpoint_wal)
@@ -3,13 +3,13 @@
 メンションでモーダルフォームを表示して予約・キャンセルを行う
 """
 import logging
-import re
 import threading
 import time
-from datetime import datetime
+from datetime import date
 
-from slack_bolt import App
+from slack_bolt import App, BoltResponse
 from slack_bolt.adapter.socket_mode import SocketModeHandler
+from slack_sdk.web.client import WebClient
 
 # ログ設定（接続状態の監視用）
 logging.basicConfig(
@@ -21,65 +21,207 @@ from config import (
     SLACK_BOT_TOKEN,
     SLACK_SIGNING_SECRET,
     SLACK_APP_TOKEN,
-    REMINDER_OPTIONS,
+    SLACK_API_URL,
+    USER_CACHE_TTL,
+    USER_CACHE_SIZE,
+    EVENT_DEDUP_TTL,
+    EVENT_DEDUP_SIZE,
+    EVENT_DEDUP_SHARED,
+    METRICS_ENABLED,
+    LISTENER_WORKERS,
+    LISTENER_QUEUE_SIZE,
+    DEFERRED_WORKERS,
+    DEFERRED_QUEUE_SIZE,
+    REMINDER_LEASE_SECONDS,
+    BOT_RUNTIME,
 )
 from database import (
     init_db,
-    create_reservation,
-    get_reservations_by_date,
-    get_reservations_by_user,
-    delete_reservation,
-    check_conflict,
-    get_pending_reminders,
-    mark_reminder_sent,
+    get_upcoming_reminders,
+    enqueue_messages,
+    get_changes,
+    get_last_change_seq,
+    acquire_lease,
+    release_lease,
+    claim_event,
+    release_event,
 )
+from event_dedup import EventDeduplicator, event_key
+from metrics import (
+    timed_handler,
+    observe_ack,
+    instrument_slack_api,
+    SOCKET_MODE_CONNECTED,
+    SOCKET_MODE_RECONNECTS,
+)
+import archiver
+from listener_executor import (
+    PriorityExecutor,
+    request_priority,
+    use_priority,
+    ACK_DEADLINE_SECONDS,
+    SUBMISSION,
+)
+from handlers import (
+    apply_reminder_update,
+    mention_replies,
+    start_time_options,
+    time_options,
+    check_reservation_submission,
+    save_reservation,
+    save_series,
+    notify_no_cancellable,
+    cancel_options,
+    check_cancel_submission,
+    cancel_submitted,
+    queue_reminders,
+)
+from metrics_server import start_metrics_server
+from outbox import OutboxWorker, outbox_message
+from reminder_scheduler import (
+    ReminderScheduler,
+    apply_reminder_changes,
+    REMINDER_LEASE,
+    REMINDER_SYNC_SECONDS,
+    WORKER_ID,
+)
+from user_cache import UserCache
+from views import (
+    strip_mention,
+    build_reservation_modal,
+    build_cancel_modal,
+    BUSY_TEXT,
+    busy_view_errors,
+)
+
+# Boltのリスナーを実行するスレッドプール（モーダルの送信を優先し、混雑時は読み取りから断る）
+listener_executor = PriorityExecutor("listener", LISTENER_WORKERS, LISTENER_QUEUE_SIZE)
+
+# ack後に行う処理（DB書き込み・通知）を実行するスレッドプール
+deferred_executor = PriorityExecutor("deferred", DEFERRED_WORKERS, DEFERRED_QUEUE_SIZE)
+
+app = App(
+    client=WebClient(token=SLACK_BOT_TOKEN, base_url=SLACK_API_URL),
+    signing_secret=SLACK_SIGNING_SECRET,
+    listener_executor=listener_executor,
+)
+
+# 通知はoutboxに積み、このワーカーが送る（Slackが遅くてもリスナーやack後の処理を止めない）
+outbox_worker = OutboxWorker(app.client)
+
+# 再送されたイベント・操作を落とすための受信済みのキー
+event_dedup = EventDeduplicator(EVENT_DEDUP_TTL, EVENT_DEDUP_SIZE)
+
+
+@app.middleware
+def record_received_at(context, next):
+    """リクエストの受信時刻を記録（ackまでのレイテンシ計測用）"""
+    context["received_at"] = time.perf_counter()
+    next()
+
+
+@app.middleware
+def drop_duplicate_events(body, context, next):
+    """再送されたイベント・操作はリスナーを動かさずにackする（DB・Slack APIの処理を繰り返さない）"""
+    key = event_key(body)
+    if key and not event_dedup.claim(key, claim_event if EVENT_DEDUP_SHARED else None):
+        return BoltResponse(status=200, body="")
+    context["event_key"] = key
+    next()
+
+
+@app.middleware
+def shed_when_busy(body, context, next):
+    """スレッドプールが混んでいれば、優先度の低いリクエストから「混雑中」と返してリスナーに渡さない
+
+    モーダルの送信はack後の処理のプールも見る。イベント以外はackの期限を過ぎたら実行しない。
+    """
+    priority = request_priority(body)
+    pools = (listener_executor, deferred_executor) if priority == SUBMISSION else (listener_executor,)
+    for pool in pools:
+        if not pool.accepts(priority):
+            pool.shed(priority)
+            # 処理していないため、受信済みのキーを消して再送を受け付けられるようにする
+            if context.get("event_key"):
+                event_dedup.release(context["event_key"], release_event if EVENT_DEDUP_SHARED else None)
+            return busy_response(body)
+
+    deadline = None if body.get("type") == "event_callback" else context["received_at"] + ACK_DEADLINE_SECONDS
+    use_priority(priority, deadline)
+    next()
+
 
-app = App(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET)
+def busy_response(body: dict) -> BoltResponse:
+    """混雑時の応答（モーダルは入力欄のエラー、選択肢は空、メンション・ボタンは通知で知らせる）"""
+    kind = body.get("type")
+    if kind == "view_submission":
+        errors = busy_view_errors(body["view"])
+        if errors:
+            return BoltResponse(status=200, body={"response_action": "errors", "errors": errors})
+    elif kind == "block_suggestion":
+        return BoltResponse(status=200, body={"options": []})
+
+    channel = body.get("event", {}).get("channel") or body.get("user", {}).get("id")
+    if channel:
+        enqueue_messages([outbox_message("notice", channel, BUSY_TEXT)])
+        outbox_worker.notify()
+    return BoltResponse(status=200, body="")
 
 
 # ====================
 # ユーティリティ関数
 # ====================
 
-def format_reminder_text(minutes: int) -> str:
-    """リマインダー分数を表示用テキストに変換"""
-    for text, mins in REMINDER_OPTIONS.items():
-        if mins == minutes:
-            return text
-    return f"{minutes}分前"
-
-
-# キャッシュ用変数（起動時に一度だけ生成）
-_TIME_OPTIONS = None
-_REMINDER_OPTIONS = None
-
-
-def generate_time_options():
-    """時刻選択用のオプションを生成（30分刻み）- キャッシュ"""
-    global _TIME_OPTIONS
-    if _TIME_OPTIONS is None:
-        _TIME_OPTIONS = []
-        for hour in range(7, 22):
-            for minute in [0, 30]:
-                time_str = f"{hour:02d}:{minute:02d}"
-                _TIME_OPTIONS.append({
-                    "text": {"type": "plain_text", "text": time_str},
-                    "value": time_str
-                })
-    return _TIME_OPTIONS
-
-
-def generate_reminder_options():
-    """リマインダー選択用のオプションを生成 - キャッシュ"""
-    global _REMINDER_OPTIONS
-    if _REMINDER_OPTIONS is None:
-        _REMINDER_OPTIONS = []
-        for text, minutes in REMINDER_OPTIONS.items():
-            _REMINDER_OPTIONS.append({
-                "text": {"type": "plain_text", "text": text},
-                "value": str(minutes)
-            })
-    return _REMINDER_OPTIONS
+def log_ack_latency(name: str, context):
+    """受信からackまでの時間をログに出す"""
+    elapsed = time.perf_counter() - context["received_at"]
+    observe_ack(name, elapsed)
+    print(f"[ACK] {name}: {elapsed * 1000:.1f}ms")
+
+
+def run_deferred(func, *args):
+    """ack後の処理をバックグラウンドで実行（例外はログに出す）"""
+    def run():
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"Deferred task {func.__name__} failed: {e}")
+
+    deferred_executor.submit_priority(SUBMISSION, run)
+
+
+# ユーザー情報のキャッシュ（予約送信のたびにusers_infoを呼ばないように）
+user_cache = UserCache(USER_CACHE_TTL, USER_CACHE_SIZE)
+
+
+def get_user_name(client, user_id: str) -> str:
+    """ユーザーの表示名を取得（キャッシュ経由）"""
+    user = user_cache.get(user_id, lambda uid: client.users_info(user=uid)["user"])
+    return user.get("real_name") or user["name"]
+
+
+def warm_user_cache(client):
+    """users_listでワークスペースのユーザーをまとめて取得してキャッシュする"""
+    count = 0
+    cursor = None
+    try:
+        while True:
+            params = {"limit": 200}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.users_list(**params)
+            members = [m for m in response["members"] if not m.get("deleted")]
+            user_cache.put_many(members)
+            count += len(members)
+
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+    except Exception as e:
+        print(f"User cache warm-up failed: {e}")
+        return
+
+    print(f"User cache warmed: {count} users")
 
 
 # ====================
@@ -87,6 +229,7 @@ def generate_reminder_options():
 # ====================
 
 @app.event("app_mention")
+@timed_handler
 def handle_app_mention(body, client, event, say):
     """メンションを処理してモーダルを開く"""
     text = event["text"]
@@ -94,66 +237,12 @@ def handle_app_mention(body, client, event, say):
 
     print(f"[DEBUG] Received mention: {repr(text)}")
 
-    # Botへのメンション部分を除去（大文字小文字両対応）
-    text = re.sub(r"<@[A-Za-z0-9]+>", "", text).strip()
+    text = strip_mention(text)
 
     print(f"[DEBUG] After cleanup: {repr(text)}")
 
-    if text.startswith("予約"):
-        # ボタン付きメッセージを送信
-        say(
-            text="予約フォームを開くには下のボタンをクリックしてください",
-            blocks=[
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": "会議室を予約するには、下のボタンをクリックしてください。"}
-                },
-                {
-                    "type": "actions",
-                    "elements": [
-                        {
-                            "type": "button",
-                            "text": {"type": "plain_text", "text": "予約フォームを開く"},
-                            "style": "primary",
-                            "action_id": "open_reservation_modal"
-                        }
-                    ]
-                }
-            ]
-        )
-    elif text.startswith("キャンセル"):
-        # キャンセル用のボタンを送信
-        reservations = get_reservations_by_user(user_id)
-        if not reservations:
-            say("キャンセルできる予約がありません。")
-            return
-
-        say(
-            text="キャンセルする予約を選択してください",
-            blocks=[
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": "キャンセルする予約を選択してください。"}
-                },
-                {
-                    "type": "actions",
-                    "elements": [
-                        {
-                            "type": "button",
-                            "text": {"type": "plain_text", "text": "キャンセルフォームを開く"},
-                            "style": "danger",
-                            "action_id": "open_cancel_modal"
-                        }
-                    ]
-                }
-            ]
-        )
-    elif text.startswith("確認"):
-        handle_check(text, say)
-    elif text.startswith("ヘルプ") or text.startswith("help"):
-        handle_help(say)
-    else:
-        handle_help(say)
+    for reply in mention_replies(text, user_id):
+        say(**reply)
 
 
 # ====================
@@ -161,170 +250,64 @@ def handle_app_mention(body, client, event, say):
 # ====================
 
 @app.action("open_reservation_modal")
+@timed_handler
 def handle_open_reservation_modal(ack, body, client):
     """予約モーダルを開くボタンのアクション"""
     ack()
 
     user_id = body["user"]["id"]
-    today = datetime.now().strftime("%Y-%m-%d")
-
-    modal = {
-        "type": "modal",
-        "callback_id": "reservation_modal",
-        "title": {"type": "plain_text", "text": "会議室予約"},
-        "submit": {"type": "plain_text", "text": "予約する"},
-        "close": {"type": "plain_text", "text": "キャンセル"},
-        "blocks": [
-            {
-                "type": "input",
-                "block_id": "channel_block",
-                "label": {"type": "plain_text", "text": "対象チャンネル"},
-                "element": {
-                    "type": "conversations_select",
-                    "action_id": "channel_select",
-                    "placeholder": {"type": "plain_text", "text": "チャンネルを選択"},
-                    "filter": {
-                        "include": ["public", "private"],
-                        "exclude_bot_users": True
-                    }
-                }
-            },
-            {
-                "type": "input",
-                "block_id": "date_block",
-                "label": {"type": "plain_text", "text": "予約日"},
-                "element": {
-                    "type": "datepicker",
-                    "action_id": "date_select",
-                    "initial_date": today,
-                    "placeholder": {"type": "plain_text", "text": "日付を選択"}
-                }
-            },
-            {
-                "type": "input",
-                "block_id": "start_time_block",
-                "label": {"type": "plain_text", "text": "開始時間"},
-                "element": {
-                    "type": "static_select",
-                    "action_id": "start_time_select",
-                    "placeholder": {"type": "plain_text", "text": "開始時間を選択"},
-                    "options": generate_time_options()
-                }
-            },
-            {
-                "type": "input",
-                "block_id": "end_time_block",
-                "label": {"type": "plain_text", "text": "終了時間"},
-                "element": {
-                    "type": "static_select",
-                    "action_id": "end_time_select",
-                    "placeholder": {"type": "plain_text", "text": "終了時間を選択"},
-                    "options": generate_time_options()
-                }
-            },
-            {
-                "type": "input",
-                "block_id": "event_name_block",
-                "label": {"type": "plain_text", "text": "ミーティング名"},
-                "element": {
-                    "type": "plain_text_input",
-                    "action_id": "event_name_input",
-                    "placeholder": {"type": "plain_text", "text": "例: 週次定例会議"}
-                }
-            },
-            {
-                "type": "input",
-                "block_id": "reminder_block",
-                "label": {"type": "plain_text", "text": "リマインダー"},
-                "element": {
-                    "type": "static_select",
-                    "action_id": "reminder_select",
-                    "placeholder": {"type": "plain_text", "text": "通知タイミングを選択"},
-                    "options": generate_reminder_options(),
-                    "initial_option": {
-                        "text": {"type": "plain_text", "text": "15分前"},
-                        "value": "15"
-                    }
-                }
-            }
-        ],
-        "private_metadata": user_id
-    }
-
-    client.views_open(trigger_id=body["trigger_id"], view=modal)
-
-
-@app.view("reservation_modal")
-def handle_reservation_submission(ack, body, client, view):
-    """予約モーダルの送信処理"""
-    user_id = body["user"]["id"]
-
-    # ユーザー情報を取得
-    user_info = client.users_info(user=user_id)
-    user_name = user_info["user"]["real_name"] or user_info["user"]["name"]
+    client.views_open(trigger_id=body["trigger_id"], view=build_reservation_modal(user_id))
 
-    # フォームの値を取得
-    values = view["state"]["values"]
+    # 直後に来る開始時刻の選択肢の要求に備え、初期値の日付（今日）の分を作っておく
+    start_time_options(date.today())
 
-    channel_id = values["channel_block"]["channel_select"]["selected_conversation"]
-    date_str = values["date_block"]["date_select"]["selected_date"]
-    start_time_str = values["start_time_block"]["start_time_select"]["selected_option"]["value"]
-    end_time_str = values["end_time_block"]["end_time_select"]["selected_option"]["value"]
-    event_name = values["event_name_block"]["event_name_input"]["value"]
-    reminder_minutes = int(values["reminder_block"]["reminder_select"]["selected_option"]["value"])
 
-    # 日時のパース
-    start_dt = datetime.strptime(f"{date_str} {start_time_str}", "%Y-%m-%d %H:%M")
-    end_dt = datetime.strptime(f"{date_str} {end_time_str}", "%Y-%m-%d %H:%M")
+@app.options("start_time_select")
+@timed_handler
+def handle_start_time_options(ack, body):
+    """開始時刻の選択肢を返す（選択中の日付の空いている枠のみ）"""
+    ack(options=time_options(body, end=False))
 
-    # バリデーション
-    errors = {}
 
-    if end_dt <= start_dt:
-        errors["end_time_block"] = "終了時間は開始時間より後に設定してください"
+@app.options("end_time_select")
+@timed_handler
+def handle_end_time_options(ack, body):
+    """終了時刻の選択肢を返す（開始時刻を選択済みなら、そこから次の予約までの時刻のみ）"""
+    ack(options=time_options(body, end=True))
 
-    if start_dt < datetime.now():
-        errors["date_block"] = "過去の日時は予約できません"
 
-    # 重複チェック
-    conflict = check_conflict(start_dt, end_dt)
-    if conflict:
-        conflict_start = datetime.fromisoformat(conflict["start_time"])
-        conflict_end = datetime.fromisoformat(conflict["end_time"])
-        errors["start_time_block"] = f"その時間帯は既に予約があります（{conflict['event_name']} / {conflict_start.strftime('%H:%M')}-{conflict_end.strftime('%H:%M')}）"
+@app.view("reservation_modal")
+@timed_handler
+def handle_reservation_submission(ack, body, client, view, context):
+    """予約モーダルの送信処理（入力チェックだけ行ってack、予約作成・通知は後段で実行）"""
+    user_id = body["user"]["id"]
+    form, errors = check_reservation_submission(view)
 
     if errors:
         ack(response_action="errors", errors=errors)
+        log_ack_latency("reservation_modal", context)
         return
 
     ack()
+    log_ack_latency("reservation_modal", context)
 
-    # 予約を作成
-    reservation_id = create_reservation(
-        user_id=user_id,
-        user_name=user_name,
-        channel_id=channel_id,
-        event_name=event_name,
-        start_time=start_dt,
-        end_time=end_dt,
-        reminder_minutes=reminder_minutes
-    )
-
-    # 予約完了メッセージ
-    message = (
-        f"新しい予約が作成されました\n\n"
-        f"*予約ID:* {reservation_id}\n"
-        f"*予約者:* {user_name}\n"
-        f"*日時:* {start_dt.strftime('%Y/%m/%d %H:%M')} - {end_dt.strftime('%H:%M')}\n"
-        f"*ミーティング名:* {event_name}\n"
-        f"*リマインド:* {format_reminder_text(reminder_minutes)}"
-    )
-
-    # 対象チャンネルに通知
-    client.chat_postMessage(
-        channel=channel_id,
-        text=message
-    )
+    run_deferred(persist_series if form["frequency"] else persist_reservation, client, user_id, form)
+
+
+@timed_handler
+def persist_reservation(client, user_id: str, form: dict):
+    """予約を作成して通知（ack後にバックグラウンドで実行）"""
+    update = save_reservation(user_id, get_user_name(client, user_id), form)
+    outbox_worker.notify()
+    apply_reminder_update(reminder_scheduler, update)
+
+
+@timed_handler
+def persist_series(client, user_id: str, form: dict):
+    """繰り返し予約を作成して通知（ack後にバックグラウンドで実行）"""
+    update = save_series(user_id, get_user_name(client, user_id), form)
+    outbox_worker.notify()
+    apply_reminder_update(reminder_scheduler, update)
 
 
 # ====================
@@ -332,190 +315,121 @@ def handle_reservation_submission(ack, body, client, view):
 # ====================
 
 @app.action("open_cancel_modal")
+@timed_handler
 def handle_open_cancel_modal(ack, body, client):
     """キャンセルモーダルを開くボタンのアクション"""
     ack()
 
     user_id = body["user"]["id"]
-    reservations = get_reservations_by_user(user_id)
-
-    if not reservations:
-        client.chat_postMessage(
-            channel=user_id,
-            text="キャンセルできる予約がありません。"
-        )
+    if notify_no_cancellable(user_id):
+        outbox_worker.notify()
         return
 
-    # 予約一覧をオプションとして生成
-    options = []
-    for r in reservations:
-        start = datetime.fromisoformat(r["start_time"])
-        label = f"{start.strftime('%m/%d %H:%M')} - {r['event_name']}"
-        if len(label) > 75:
-            label = label[:72] + "..."
-        options.append({
-            "text": {"type": "plain_text", "text": label},
-            "value": str(r["id"])
-        })
-
-    modal = {
-        "type": "modal",
-        "callback_id": "cancel_modal",
-        "title": {"type": "plain_text", "text": "予約キャンセル"},
-        "submit": {"type": "plain_text", "text": "キャンセルする"},
-        "close": {"type": "plain_text", "text": "閉じる"},
-        "blocks": [
-            {
-                "type": "input",
-                "block_id": "reservation_block",
-                "label": {"type": "plain_text", "text": "キャンセルする予約を選択"},
-                "element": {
-                    "type": "static_select",
-                    "action_id": "reservation_select",
-                    "placeholder": {"type": "plain_text", "text": "予約を選択"},
-                    "options": options
-                }
-            }
-        ],
-        "private_metadata": user_id
-    }
-
-    client.views_open(trigger_id=body["trigger_id"], view=modal)
+    client.views_open(trigger_id=body["trigger_id"], view=build_cancel_modal(user_id))
 
 
-@app.view("cancel_modal")
-def handle_cancel_submission(ack, body, client, view):
-    """キャンセルモーダルの送信処理"""
-    ack()
-
-    user_id = body["user"]["id"]
-    values = view["state"]["values"]
-    reservation_id = int(values["reservation_block"]["reservation_select"]["selected_option"]["value"])
-
-    # 予約を削除
-    deleted = delete_reservation(reservation_id, user_id)
-
-    if deleted:
-        start = datetime.fromisoformat(deleted["start_time"])
-        message = (
-            f"予約がキャンセルされました\n\n"
-            f"*予約ID:* {deleted['id']}\n"
-            f"*キャンセル者:* <@{user_id}>\n"
-            f"*日時:* {start.strftime('%Y/%m/%d %H:%M')}\n"
-            f"*ミーティング名:* {deleted['event_name']}"
-        )
-
-        # 対象チャンネルに通知
-        client.chat_postMessage(
-            channel=deleted["channel_id"],
-            text=message
-        )
-    else:
-        client.chat_postMessage(
-            channel=user_id,
-            text="予約のキャンセルに失敗しました。"
-        )
+@app.options("reservation_select")
+@timed_handler
+def handle_cancel_options(ack, body):
+    """キャンセルする予約の選択肢を返す（入力した日付・ミーティング名で絞り込み、1ページ分だけ読む）"""
+    ack(options=cancel_options(body))
 
 
-# ====================
-# 確認・ヘルプ
-# ====================
+@app.view("cancel_modal")
+@timed_handler
+def handle_cancel_submission(ack, body, client, view, context):
+    """キャンセルモーダルの送信処理（本人の予約か確認してack、削除・通知は後段で実行）"""
+    user_id = body["user"]["id"]
+    form, error = check_cancel_submission(view, user_id)
+    if error:
+        ack(response_action="errors", errors={"reservation_block": error})
+        log_ack_latency("cancel_modal", context)
+        return
 
-def handle_check(text: str, say):
-    """予約確認を処理"""
-    try:
-        # 日付を抽出
-        pattern = r"確認\s*(\d{1,4}[/-]\d{1,2}[/-]\d{1,2}|\d{1,2}[/-]\d{1,2})?"
-        match = re.match(pattern, text)
-
-        if match and match.group(1):
-            date_str = match.group(1).replace("-", "/")
-            if date_str.count("/") == 1:
-                date_str = f"{datetime.now().year}/{date_str}"
-            date_parts = date_str.split("/")
-            target_date = datetime(int(date_parts[0]), int(date_parts[1]), int(date_parts[2]))
-        else:
-            target_date = datetime.now()
-
-        date_formatted = target_date.strftime("%Y-%m-%d")
-        reservations = get_reservations_by_date(date_formatted)
-
-        if not reservations:
-            say(f"{target_date.strftime('%Y/%m/%d')} の予約はありません。")
-            return
-
-        lines = [f"*{target_date.strftime('%Y/%m/%d')} の予約一覧*\n"]
-        for r in reservations:
-            start = datetime.fromisoformat(r["start_time"])
-            end = datetime.fromisoformat(r["end_time"])
-            lines.append(
-                f"*[ID: {r['id']}]* {start.strftime('%H:%M')} - {end.strftime('%H:%M')}\n"
-                f"  {r['event_name']} / {r['user_name']}\n"
-                f"  対象: <#{r['channel_id']}>"
-            )
-            lines.append("")
-
-        say("\n".join(lines))
+    ack()
+    log_ack_latency("cancel_modal", context)
 
-    except Exception as e:
-        say(f"予約の確認中にエラーが発生しました: {str(e)}")
+    run_deferred(cancel_reservation, user_id, form)
 
 
-def handle_help(say):
-    """ヘルプメッセージを表示"""
-    say(
-        "*会議室予約Bot ヘルプ*\n\n"
-        "*予約する:*\n"
-        "`@reserve-bot 予約` → ボタンをクリックしてフォームを開く\n\n"
-        "*予約をキャンセル:*\n"
-        "`@reserve-bot キャンセル` → 自分の予約一覧から選択\n\n"
-        "*予約を確認:*\n"
-        "`@reserve-bot 確認` (今日の予約)\n"
-        "`@reserve-bot 確認 2025/01/15` (指定日の予約)\n\n"
-        "*ヘルプ:*\n"
-        "`@reserve-bot ヘルプ`"
-    )
+@timed_handler
+def cancel_reservation(user_id: str, form: dict):
+    """予約・繰り返し予約の回を削除して通知（ack後にバックグラウンドで実行）"""
+    update = cancel_submitted(user_id, form)
+    outbox_worker.notify()
+    apply_reminder_update(reminder_scheduler, update)
 
 
 # ====================
 # リマインダー機能
 # ====================
 
+@timed_handler
 def send_reminders():
-    """未送信のリマインダーをチェックして送信"""
-    reminders = get_pending_reminders()
-    if not reminders:
-        return
+    """送信時刻を過ぎた未送信のリマインダーをoutboxに積む（送信はoutboxのワーカーが行う）"""
+    if queue_reminders():
+        outbox_worker.notify()
 
-    client = app.client  # Boltアプリのクライアントを使用
 
-    for r in reminders:
-        try:
-            start = datetime.fromisoformat(r["start_time"])
-            message = (
-                f"リマインダー: まもなく会議が始まります\n\n"
-                f"*ミーティング名:* {r['event_name']}\n"
-                f"*時間:* {start.strftime('%Y/%m/%d %H:%M')}\n"
-                f"*予約者:* {r['user_name']}"
-            )
-            client.chat_postMessage(
-                channel=r["channel_id"],
-                text=message
-            )
-            mark_reminder_sent(r["id"])
-            print(f"Reminder sent for reservation {r['id']}")
-        except Exception as e:
-            print(f"Failed to send reminder for {r['id']}: {e}")
+reminder_scheduler = ReminderScheduler(send_reminders)
+
+
+def load_reminders() -> int:
+    """DBから未送信のリマインダーを読み込み直し、変更履歴の現在の番号を返す"""
+    # 先に番号を読むので、読み込み中の変更は次の反映で重ねて適用される（登録・取り消しは冪等）
+    seq = get_last_change_seq()
+    reminder_scheduler.clear()
+    for reservation_id, remind_at in get_upcoming_reminders():
+        reminder_scheduler.schedule(reservation_id, remind_at)
+    return seq
+
+
+def sync_reminder_changes(seq: int) -> int:
+    """他のプロセスによる予約の作成・削除をスケジューラに反映し、反映済みの番号を返す"""
+    changes = get_changes(seq)
+    if not changes:
+        return seq
+    if not apply_reminder_changes(reminder_scheduler, changes, seq):
+        return load_reminders()
+    return changes[-1]["seq"]
 
 
 def reminder_loop():
-    """リマインダーを定期的にチェックするループ"""
+    """リマインダーの送信役のリースを取得・延長し続けるループ
+
+    リースを持つプロセスは変更履歴を追って全予約のリマインダーを登録する。
+    持たないプロセスも自分で作成した予約の分はoutboxに積むが、送信済みへの更新と同時に積むため重複はしない。
+    """
+    threading.Thread(target=reminder_scheduler.run, name="reminder-scheduler", daemon=True).start()
+
+    leader = False
+    seq = 0
+    renew_every = max(1, int(REMINDER_LEASE_SECONDS / 3 / REMINDER_SYNC_SECONDS))
+    tick = 0
     while True:
-        try:
-            send_reminders()
-        except Exception as e:
-            print(f"Reminder loop error: {e}")
-        time.sleep(30)  # 30秒ごとにチェック
+        if tick % renew_every == 0:
+            try:
+                acquired = acquire_lease(REMINDER_LEASE, WORKER_ID, REMINDER_LEASE_SECONDS)
+            except Exception as e:
+                print(f"Reminder lease error: {e}")
+                acquired = False
+
+            if acquired and not leader:
+                # 送信時刻を過ぎたものは即座に送信される
+                seq = load_reminders()
+                print(f"Reminder lease acquired by {WORKER_ID}")
+            elif leader and not acquired:
+                print(f"Reminder lease lost by {WORKER_ID}")
+            leader = acquired
+
+        if leader:
+            try:
+                seq = sync_reminder_changes(seq)
+            except Exception as e:
+                print(f"Reminder sync error: {e}")
+
+        tick += 1
+        time.sleep(REMINDER_SYNC_SECONDS)
 
 
 # ====================
@@ -524,28 +438,57 @@ def reminder_loop():
 
 def main():
     """メインエントリーポイント"""
+    instrument_slack_api()
     init_db()
     print("Database initialized.")
 
+    if METRICS_ENABLED:
+        start_metrics_server()
+
+    # 通知の送信スレッドを開始
+    threading.Thread(target=outbox_worker.run, name="outbox", daemon=True).start()
+
     # リマインダースレッドを開始
     reminder_thread = threading.Thread(target=reminder_loop, daemon=True)
     reminder_thread.start()
     print("Reminder scheduler started.")
 
+    # 過去の予約のアーカイブ（リースを取った1プロセスのみ）
+    threading.Thread(target=archiver.run, name="archiver", daemon=True).start()
+
+    # ユーザー情報キャッシュを裏で温める（失敗しても起動は続ける）
+    threading.Thread(target=warm_user_cache, args=(app.client,), daemon=True).start()
+
     # Socket Mode接続（自動再接続付き）
     while True:
         try:
             handler = SocketModeHandler(app, SLACK_APP_TOKEN)
+            SOCKET_MODE_CONNECTED.set_function(handler.client.is_connected)
+            # 切断されるとSDKが自動で再接続する
+            handler.client.on_close_listeners.append(lambda code, reason: SOCKET_MODE_RECONNECTS.inc())
             print("Bot is running... (Socket Mode)")
             handler.start()
         except KeyboardInterrupt:
+            # 次のプロセスがリースの期限切れを待たずに引き継げるようにする
+            release_lease(REMINDER_LEASE, WORKER_ID)
             print("Bot stopped by user.")
             break
         except Exception as e:
+            SOCKET_MODE_RECONNECTS.inc()
             print(f"Connection error: {e}")
             print("Reconnecting in 5 seconds...")
             time.sleep(5)
 
 
 if __name__ == "__main__":
-    main()
+    if BOT_RUNTIME == "async":
+        # asyncio版のランタイムで起動（スレッド版のAppは使わない）
+        import asyncio
+        import async_bot
+        asyncio.run(async_bot.main())
+    elif BOT_RUNTIME == "http":
+        # Events APIをHTTPで受ける複数ワーカー版で起動
+        import http_app
+        http_app.main()
+    else:
+        main()
@@ -0,0 +1,424 @@
+"""
+予約の一括読み込み・書き出し（CSV・iCalendar）
+読み込みはファイルを2回読む。1回目は各行を検証して開始・終了だけを配列に集め、開始時刻順に並べて
+ファイル内・既存の予約・繰り返しの回との重なりを1回の走査で調べる。2回目は行をchunk件ずつのトランザクションで挿入する。
+書き出しは開始時刻順のカーソルをたどって1件ずつ書き、テーブルをリストにしない
+
+    python bulk_io.py import reservations.csv
+    python bulk_io.py import calendar.ics --user-id U123 --user-name 山田 --channel-id C123
+    python bulk_io.py export reservations.ics --from 2025-01-01 --to 2025-03-31 --archive
+"""
+import argparse
+import csv
+import re
+import time
+from array import array
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional, Union
+
+from database import (
+    BulkRow,
+    bulk_insert_reservations,
+    find_bulk_conflicts,
+    get_last_change_seq,
+    init_db,
+    iter_reservations_for_export,
+)
+from epoch import to_epoch
+from reservation import Reservation
+
+# CSVの列（書き出しはこの並び。読み込みではidを使わず、ユーザー・チャンネル・リマインダーの列はなくてもよい）
+CSV_FIELDS = ("id", "user_id", "user_name", "channel_id", "event_name", "start_time", "end_time", "reminder_minutes")
+
+# 1回のトランザクションで挿入する件数
+DEFAULT_CHUNK_SIZE = 10000
+
+# 読み込めない行・重なりを表示する件数
+MAX_REPORTED_ERRORS = 20
+
+# 予約のユーザー・チャンネルを持たせるiCalendarの独自プロパティ
+_ICS_FIELDS = {
+    "DTSTART": "start_time",
+    "DTEND": "end_time",
+    "DURATION": "duration",
+    "SUMMARY": "event_name",
+    "X-RESERVE-USER-ID": "user_id",
+    "X-RESERVE-USER-NAME": "user_name",
+    "X-RESERVE-CHANNEL-ID": "channel_id",
+}
+_ICS_TEXT_FIELDS = {"event_name", "user_id", "user_name", "channel_id"}
+
+# 名前;パラメータ:値（パラメータの値は引用符で囲まれていれば:を含んでよい）
+_ICS_PROPERTY = re.compile(r'(?P<name>[A-Za-z0-9-]+)(?P<params>(?:;[^:;=]+=(?:"[^"]*"|[^:;"]*))*):(?P<value>.*)')
+_ICS_ESCAPE = re.compile(r"\\([\\;,nN])")
+_DURATION = re.compile(r"([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?")
+
+
+# ====================
+# 行の検証
+# ====================
+
+def _parse_time(value: Optional[str]) -> datetime:
+    """CSVの日時（2025-01-15 10:00、2025/01/15 10:00）・iCalendarの日時（20250115T100000、末尾ZはUTC）をローカル時刻にする"""
+    value = (value or "").strip()
+    if not value:
+        raise ValueError("日時がありません")
+    if len(value) <= 10:
+        raise ValueError(f"時刻のない日時は読み込めません: {value}")
+    parsed = datetime.fromisoformat(value.replace("/", "-"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+@lru_cache(maxsize=256)
+def _parse_duration(value: str) -> timedelta:
+    """iCalendarの期間（PT1H30M、-PT15M）"""
+    match = _DURATION.fullmatch(value.strip())
+    if not match or not any(match.groups()[1:]):
+        raise ValueError(f"期間を読み取れません: {value}")
+    weeks, days, hours, minutes, seconds = (int(g or 0) for g in match.groups()[1:])
+    duration = timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+    return -duration if match.group(1) == "-" else duration
+
+
+def _record(line: int, fields: dict, defaults: dict) -> BulkRow:
+    """読み込んだ1件を挿入する行にする（ユーザー・チャンネル・リマインダーがなければdefaultsの値）"""
+    if fields.get("all_day"):
+        raise ValueError("終日の予定は読み込めません")
+    if fields.get("rrule"):
+        raise ValueError("繰り返しの予定は読み込めません")
+
+    event_name = (fields.get("event_name") or "").strip()
+    if not event_name:
+        raise ValueError("ミーティング名がありません")
+    user_id, user_name, channel_id = (
+        (fields.get(key) or "").strip() or defaults.get(key) for key in ("user_id", "user_name", "channel_id")
+    )
+    if not (user_id and user_name and channel_id):
+        raise ValueError("ユーザーID・ユーザー名・チャンネルIDがありません（--user-idなどで指定できます）")
+
+    start_time = _parse_time(fields.get("start_time"))
+    if fields.get("end_time"):
+        end_time = _parse_time(fields["end_time"])
+    elif fields.get("duration"):
+        end_time = start_time + _parse_duration(fields["duration"])
+    else:
+        raise ValueError("終了時刻がありません")
+    if end_time <= start_time:
+        raise ValueError("終了時刻は開始時刻より後にしてください")
+
+    if (fields.get("reminder_minutes") or "").strip():
+        reminder_minutes = int(fields["reminder_minutes"])
+    elif fields.get("trigger"):
+        reminder_minutes = -_parse_duration(fields["trigger"]) // timedelta(minutes=1)
+    else:
+        reminder_minutes = defaults["reminder_minutes"]
+    if reminder_minutes < 0:
+        raise ValueError("リマインダーは開始前にしてください")
+
+    return (
+        user_id, user_name, channel_id, event_name,
+        to_epoch(start_time), to_epoch(end_time), reminder_minutes, line,
+    )
+
+
+def _records(path: str, fmt: str, defaults: dict) -> Iterator[tuple[int, Union[BulkRow, ValueError]]]:
+    """ファイルの (行番号, 挿入する行か読み込めない理由) を1件ずつ生成"""
+    reader = read_ics(path) if fmt == "ics" else read_csv(path)
+    for line, fields in reader:
+        try:
+            yield line, _record(line, fields, defaults)
+        except ValueError as e:
+            yield line, e
+
+
+def _describe_conflict(other: Union[int, Reservation]) -> str:
+    if isinstance(other, int):
+        return f"{other}行目と重なっています"
+    if other.series_id is not None:
+        return f"繰り返し予約 S{other.series_id} の {other.start_time:%Y/%m/%d %H:%M} の回と重なっています"
+    return (
+        f"予約 ID {other.id}（{other.start_time:%Y/%m/%d %H:%M}-{other.end_time:%H:%M} {other.event_name}）"
+        "と重なっています"
+    )
+
+
+def validate_file(path: str, fmt: str, defaults: dict) -> tuple[int, list[str], int]:
+    """ファイルを1回読んで検証し、(読み込める件数, 表示するエラー, エラーの件数) を返す
+
+    各行の開始・終了・行番号だけを配列に持ち、開始時刻順に並べて重なりを調べる。
+    """
+    starts, ends, lines = array("q"), array("q"), array("q")
+    errors: list[str] = []
+    error_count = 0
+
+    def report(line: int, message: str):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(f"{line}行目: {message}")
+
+    for line, row in _records(path, fmt, defaults):
+        if isinstance(row, ValueError):
+            report(line, str(row))
+        else:
+            starts.append(row[4])
+            ends.append(row[5])
+            lines.append(line)
+
+    if starts:
+        order = sorted(range(len(starts)), key=starts.__getitem__)
+        spans = ((starts[i], ends[i], lines[i]) for i in order)
+        for line, other in find_bulk_conflicts(spans, starts[order[0]], max(ends)):
+            report(line, _describe_conflict(other))
+
+    return len(starts), errors, error_count
+
+
+def import_file(path: str, fmt: str, defaults: dict, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """ファイルの予約を検証してから一括で挿入し、挿入した件数を返す（読み込めない行・重なりがあれば何も挿入せずValueError）"""
+    # 検証の後に他で作られた予約とも重ならないよう、検証の前の変更履歴の番号から追う
+    after_seq = get_last_change_seq()
+    count, errors, error_count = validate_file(path, fmt, defaults)
+    if error_count:
+        more = f"\n...ほか{error_count - len(errors)}件" if error_count > len(errors) else ""
+        raise ValueError("読み込めない行・重なりがあります:\n" + "\n".join(errors) + more)
+
+    def rows() -> Iterator[BulkRow]:
+        for line, row in _records(path, fmt, defaults):
+            if isinstance(row, ValueError):
+                raise ValueError(f"{line}行目: {row}（検証の後にファイルが変更されました）")
+            yield row
+
+    return bulk_insert_reservations(rows(), chunk_size, after_seq)
+
+
+# ====================
+# CSV
+# ====================
+
+def read_csv(path: str) -> Iterator[tuple[int, dict]]:
+    """CSVの (行番号, 列名 -> 値) を1件ずつ生成（1行目は列名。ExcelのBOM付きUTF-8も読める）"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        missing = {"event_name", "start_time"} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"CSVに列がありません: {', '.join(sorted(missing))}")
+        for fields in reader:
+            yield reader.line_num, fields
+
+
+def write_csv(path: str, reservations: Iterable[Reservation]) -> int:
+    """予約をCSVに1件ずつ書き出し、書いた件数を返す"""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for r in reservations:
+            writer.writerow((
+                r.id, r.user_id, r.user_name, r.channel_id, r.event_name,
+                r.start_time.isoformat(sep=" "), r.end_time.isoformat(sep=" "), r.reminder_minutes,
+            ))
+            count += 1
+    return count
+
+
+# ====================
+# iCalendar
+# ====================
+
+def _ics_lines(path: str) -> Iterator[tuple[int, str]]:
+    """折り返しを戻した (行番号, 内容行) を生成"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        current, start = None, 0
+        for number, raw in enumerate(f, 1):
+            raw = raw.rstrip("\r\n")
+            if raw[:1] in (" ", "\t") and current is not None:
+                current += raw[1:]
+                continue
+            if current:
+                yield start, current
+            current, start = raw, number
+        if current:
+            yield start, current
+
+
+def _ics_unescape(value: str) -> str:
+    if "\\" not in value:
+        return value
+    return _ICS_ESCAPE.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def read_ics(path: str) -> Iterator[tuple[int, dict]]:
+    """iCalendarのVEVENTごとに (BEGIN:VEVENTの行番号, 項目 -> 値) を生成
+
+    TZID付きの日時はその地域の時刻をローカル時刻とみなす。リマインダーは最初のVALARMのTRIGGERを使う。
+    """
+    event, line, in_alarm = None, 0, False
+    for number, content in _ics_lines(path):
+        # ほとんどの行はパラメータのない 名前:値 のため、正規表現はパラメータのある行だけに使う
+        name, colon, value = content.partition(":")
+        if not colon:
+            continue
+        params = ""
+        if ";" in name:
+            match = _ICS_PROPERTY.fullmatch(content)
+            if not match:
+                continue
+            name, params, value = match["name"], match["params"].upper(), match["value"]
+        name = name.upper()
+        if name == "BEGIN":
+            if value.upper() == "VEVENT":
+                event, line = {}, number
+            elif value.upper() == "VALARM":
+                in_alarm = True
+        elif name == "END":
+            if value.upper() == "VEVENT" and event is not None:
+                yield line, event
+                event = None
+            elif value.upper() == "VALARM":
+                in_alarm = False
+        elif event is None:
+            continue
+        elif in_alarm:
+            if name == "TRIGGER" and "trigger" not in event and "RELATED=END" not in params:
+                event["trigger"] = value
+        elif name == "RRULE":
+            event["rrule"] = value
+        elif name in _ICS_FIELDS:
+            key = _ICS_FIELDS[name]
+            if key in ("start_time", "end_time") and ("VALUE=DATE" in params and "VALUE=DATE-TIME" not in params
+                                                       or len(value.strip()) == 8):
+                event["all_day"] = True
+            event[key] = _ics_unescape(value) if key in _ICS_TEXT_FIELDS else value
+
+
+def _ics_text(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ics_fold(content: str) -> str:
+    """75バイトを超える内容行を折り返す（UTF-8の文字の途中では切らない）"""
+    if len(content.encode()) <= 75:
+        return content + "\r\n"
+    parts, current, size, limit = [], [], 0, 75
+    for ch in content:
+        n = len(ch.encode())
+        if size + n > limit:
+            parts.append("".join(current))
+            current, size, limit = [], 0, 74
+        current.append(ch)
+        size += n
+    parts.append("".join(current))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def write_ics(path: str, reservations: Iterable[Reservation]) -> int:
+    """予約をiCalendarに1件ずつ書き出し、書いた件数を返す（日時はタイムゾーンなしのローカル時刻）"""
+    stamp = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}"
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//reserve-bot//reservations//JA\r\nCALSCALE:GREGORIAN\r\n")
+        for r in reservations:
+            summary = _ics_text(r.event_name)
+            f.write("".join((
+                "BEGIN:VEVENT\r\n",
+                f"UID:reservation-{r.id}@reserve-bot\r\n",
+                f"DTSTAMP:{stamp}\r\n",
+                f"DTSTART:{r.start_time:%Y%m%dT%H%M%S}\r\n",
+                f"DTEND:{r.end_time:%Y%m%dT%H%M%S}\r\n",
+                _ics_fold(f"SUMMARY:{summary}"),
+                _ics_fold(f"X-RESERVE-USER-ID:{_ics_text(r.user_id)}"),
+                _ics_fold(f"X-RESERVE-USER-NAME:{_ics_text(r.user_name)}"),
+                _ics_fold(f"X-RESERVE-CHANNEL-ID:{_ics_text(r.channel_id)}"),
+                "BEGIN:VALARM\r\nACTION:DISPLAY\r\n",
+                _ics_fold(f"DESCRIPTION:{summary}"),
+                f"TRIGGER:-PT{r.reminder_minutes}M\r\n",
+                "END:VALARM\r\nEND:VEVENT\r\n",
+            )))
+            count += 1
+        f.write("END:VCALENDAR\r\n")
+    return count
+
+
+def export_file(path: str, fmt: str, first: Optional[date] = None, last: Optional[date] = None,
+                archive: bool = False) -> int:
+    """first〜lastの予約を開始時刻順に書き出し、書いた件数を返す（繰り返し予約は含めない）"""
+    reservations = iter_reservations_for_export(first, last, archive)
+    if fmt == "ics":
+        return write_ics(path, reservations)
+    return write_csv(path, reservations)
+
+
+# ====================
+# コマンドライン
+# ====================
+
+def _file_format(path: str, fmt: Optional[str]) -> str:
+    """--formatか拡張子からcsv・icsを決める"""
+    fmt = fmt or path.rsplit(".", 1)[-1].lower()
+    if fmt not in ("csv", "ics"):
+        raise SystemExit(f"Unknown file format: {path} (use --format csv or ics)")
+    return fmt
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Import or export reservations as CSV / iCalendar")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="validate and insert reservations from a file")
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=("csv", "ics"))
+    importer.add_argument("--user-id", help="user ID for rows without one")
+    importer.add_argument("--user-name", help="user name for rows without one")
+    importer.add_argument("--channel-id", help="channel ID for rows without one")
+    importer.add_argument("--reminder", type=int, default=15, help="reminder minutes for rows without one")
+    importer.add_argument("--chunk", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per transaction")
+    importer.add_argument("--dry-run", action="store_true", help="validate only")
+
+    exporter = commands.add_parser("export", help="write reservations to a file in start time order")
+    exporter.add_argument("path")
+    exporter.add_argument("--format", choices=("csv", "ics"))
+    exporter.add_argument("--from", dest="first", type=date.fromisoformat, help="first day (YYYY-MM-DD)")
+    exporter.add_argument("--to", dest="last", type=date.fromisoformat, help="last day (YYYY-MM-DD)")
+    exporter.add_argument("--archive", action="store_true", help="include archived reservations")
+
+    args = parser.parse_args(argv)
+    fmt = _file_format(args.path, args.format)
+    init_db()
+
+    started = time.perf_counter()
+    if args.command == "export":
+        count = export_file(args.path, fmt, args.first, args.last, args.archive)
+        elapsed = time.perf_counter() - started
+        print(f"Exported {count} reservations in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+        return
+
+    defaults = {
+        "user_id": args.user_id,
+        "user_name": args.user_name,
+        "channel_id": args.channel_id,
+        "reminder_minutes": args.reminder,
+    }
+    try:
+        if args.dry_run:
+            count, errors, error_count = validate_file(args.path, fmt, defaults)
+            for error in errors:
+                print(error)
+            elapsed = time.perf_counter() - started
+            print(f"Validated {count} reservations with {error_count} errors in {elapsed:.1f}s")
+            if error_count:
+                raise SystemExit(1)
+            return
+        count = import_file(args.path, fmt, defaults, args.chunk)
+    except ValueError as e:
+        print(e)
+        raise SystemExit(1)
+    elapsed = time.perf_counter() - started
+    print(f"Imported {count} reservations in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,3 +28,57 @@ REMINDER_OPTIONS = {
     "3時間前": 180,
     "24時間前": 1440,
 }
+
+# 通知（outbox）を送信するワーカー数
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 8))
+
+# 通知の送信を試みる回数の上限（超えたものはdeadにしてoutboxに残す）
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+
+# Slackのチャンネルごとの投稿レート制限（件/秒・バースト件数）
+SLACK_CHANNEL_RATE = float(os.getenv("SLACK_CHANNEL_RATE", 1.0))
+SLACK_CHANNEL_BURST = float(os.getenv("SLACK_CHANNEL_BURST", 3))
+
+# ユーザー情報キャッシュ（有効期限（秒）・最大件数）
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 3600))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 5000))
+
+# Slackのイベント・操作の重複排除（再送を落とす期間（秒）・プロセス内で覚える件数・DBで複数プロセス・再起動をまたいで判定するか）
+EVENT_DEDUP_TTL = float(os.getenv("EVENT_DEDUP_TTL", 600))
+EVENT_DEDUP_SIZE = int(os.getenv("EVENT_DEDUP_SIZE", 10000))
+EVENT_DEDUP_SHARED = os.getenv("EVENT_DEDUP_SHARED", "false").lower() == "true"
+
+# Boltのリスナーを実行するワーカー数・待ちの上限（混雑時は確認などのメンション・ボタンから先に断り、モーダルの送信は上限まで受け付ける）
+LISTENER_WORKERS = int(os.getenv("LISTENER_WORKERS", 8))
+LISTENER_QUEUE_SIZE = int(os.getenv("LISTENER_QUEUE_SIZE", 64))
+
+# ack後の処理（予約作成・通知）を実行するワーカー数・待ちの上限
+DEFERRED_WORKERS = int(os.getenv("DEFERRED_WORKERS", 8))
+DEFERRED_QUEUE_SIZE = int(os.getenv("DEFERRED_QUEUE_SIZE", 256))
+
+# 日付ごとの予約一覧キャッシュに保持する日数
+DAY_CACHE_SIZE = int(os.getenv("DAY_CACHE_SIZE", 62))
+
+# ランタイム（thread: slack_bolt.App + スレッド / async: AsyncApp + asyncio / http: Events APIをuvicornの複数ワーカーで受ける）
+BOT_RUNTIME = os.getenv("BOT_RUNTIME", "thread")
+
+# HTTPモードのuvicornワーカー数
+HTTP_WORKERS = int(os.getenv("HTTP_WORKERS", 4))
+
+# リマインダー送信役のリース期間（秒）。期限までに延長されなければ他のプロセスが引き継ぐ
+REMINDER_LEASE_SECONDS = float(os.getenv("REMINDER_LEASE_SECONDS", 15))
+
+# 送信中の通知を確保しておく期間（秒）。送信中に落ちたプロセスの分は期限後に他のプロセスが送る。
+# 1回に確保する50件が同じチャンネル宛てでも送り切れるよう、50 / SLACK_CHANNEL_RATE より長くする
+OUTBOX_CLAIM_SECONDS = float(os.getenv("OUTBOX_CLAIM_SECONDS", 120))
+
+# Slack Web APIのURL（プロキシやベンチマーク用のスタブに向ける場合に変更）
+SLACK_API_URL = os.getenv("SLACK_API_URL", "https://slack.com/api/")
+
+# メトリクス・ヘルスチェックのHTTPサーバー（HOST:PORTで /metrics と /healthz を提供）
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# 過去の予約のアーカイブ（終了から何日過ぎた予約を移すか・1回のトランザクションで移す件数・実行間隔（秒））
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 7))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", 3600))
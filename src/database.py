@@ -1,50 +1,673 @@
+import heapq
 import sqlite3
 import os
-from datetime import datetime
-from typing import Optional
-from config import DATABASE_PATH
+import threading
+import time
+from datetime import date, datetime, timedelta
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, Optional, Union
+from config import DATABASE_PATH, DAY_CACHE_SIZE
+from day_cache import DayCache
+from epoch import DAY_SECONDS, date_of, day_number, day_start, from_epoch, to_epoch
+from interval_index import IntervalIndex
+from recurrence import Recurrence, SeriesIndex, last_occurrence, occurrence, order_key, series_recurrence
+from reservation import COLUMNS, SUMMARY_COLUMNS, Reservation, reservation_factory
+from slot_bitmap import SlotBitmap, day_masks, epoch_day_masks
+from metrics import timed_query
 
+# 接続ごとに発行するPRAGMA（journal_mode=WALはDBファイルに永続化されるためinit_dbの移行時に設定）
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+)
 
-def get_connection() -> sqlite3.Connection:
-    """データベース接続を取得"""
-    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
-    conn = sqlite3.connect(DATABASE_PATH)
+# プリペアドステートメントのキャッシュ数（接続ごと）
+_STATEMENT_CACHE_SIZE = 256
+
+# スレッドごとの接続（Boltのリスナースレッド・リマインダースレッドで使い回す）
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+# close_connections()のたびに進め、古い接続を各スレッドで開き直させる
+_generation = 0
+
+# 重複チェック用の区間インデックス（init_dbで読み込み、未読み込みの間はSQLで判定）
+_interval_index = IntervalIndex()
+
+# 日ごとの空き枠のビットマップ（区間インデックスと同時に読み込み・更新する）
+_slot_bitmap = SlotBitmap()
+
+# 繰り返し予約のシリーズ（区間インデックスと同時に読み込み・更新する）
+_series_index = SeriesIndex()
+
+# 日付ごとの予約一覧のキャッシュ（予約の作成・削除時にその日だけ破棄）
+# 読み取りのたびに変更履歴を確認し、他のプロセスが変更した日も破棄する
+day_cache = DayCache(DAY_CACHE_SIZE, refresh=lambda: sync_changes(get_connection()))
+
+# 区間インデックス・日付キャッシュに反映済みの変更履歴の番号
+_changes_seq = 0
+_changes_lock = threading.Lock()
+
+# 変更履歴に残す件数（これより遅れたプロセスはインデックスを読み直す）
+_CHANGES_RETENTION = 10000
+
+# reservationsとreservations_archiveに共通の列
+_RESERVATION_COLUMNS = (
+    "id, user_id, user_name, channel_id, event_name, start_time, end_time,"
+    " reminder_minutes, reminder_sent, created_at, remind_at"
+)
+
+# outboxに積むメッセージ: (種類, チャンネルID, 本文, 送るべき時刻(UNIX時間)) のリスト
+OutboxMessages = list[tuple[str, str, str, float]]
+
+
+def _fetch_reservations(conn: sqlite3.Connection, query: str, params=()) -> list[Reservation]:
+    """予約の行をReservationの一覧として読む（列はreservation.COLUMNSかSUMMARY_COLUMNSの並びで選ぶ）"""
+    cursor = conn.cursor()
+    cursor.row_factory = reservation_factory
+    return cursor.execute(query, params).fetchall()
+
+
+def _stream_reservations(conn: sqlite3.Connection, query: str, params=()) -> Iterator[Reservation]:
+    """予約の行を1件ずつReservationとして読む（一覧をまとめてリストにしない）"""
+    cursor = conn.cursor()
+    cursor.row_factory = reservation_factory
+    return cursor.execute(query, params)
+
+
+def _fetch_reservation(conn: sqlite3.Connection, query: str, params=()) -> Optional[Reservation]:
+    """予約の行を1件だけReservationとして読む（なければNone）"""
+    cursor = conn.cursor()
+    cursor.row_factory = reservation_factory
+    return cursor.execute(query, params).fetchone()
+
+
+def _open_connection() -> sqlite3.Connection:
+    """新しい接続を開いてPRAGMAを設定"""
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        timeout=5.0,
+        cached_statements=_STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """データベース接続を取得（スレッドごとに1本の接続を使い回す）"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = _open_connection()
+        with _connections_lock:
+            _connections.append(conn)
+        _local.conn = conn
+        _local.generation = _generation
     return conn
 
 
+def close_connections():
+    """全スレッドの接続を閉じる（終了時用）"""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+
+
 def init_db():
-    """データベースの初期化"""
+    """データベースの初期化（未適用のスキーマの移行を行う。最新の版ならDDLは発行しない）"""
+    os.makedirs(os.path.dirname(DATABASE_PATH) or ".", exist_ok=True)
     conn = get_connection()
-    cursor = conn.cursor()
+    if _schema_version(conn) < len(_MIGRATIONS):
+        conn.execute("PRAGMA journal_mode = WAL")
+        while (version := _schema_version(conn)) < len(_MIGRATIONS):
+            print(f"Migrating database schema: version {version} -> {version + 1}")
+            _MIGRATIONS[version](conn, version)
+
+    load_interval_index()
+    day_cache.clear()
+
+
+# ====================
+# スキーマの移行
+# ====================
+# PRAGMA user_versionに適用済みの移行の数を持ち、_MIGRATIONS[i]が版iから版i+1への移行を行う。
+# 既存の移行は書き換えず、スキーマを変えるときは末尾に追加する
+
+# 移行で1回のトランザクションで変換する行数
+_MIGRATION_BATCH = 5000
+
+
+def _schema_version(conn: sqlite3.Connection) -> int:
+    """DBのスキーマの版"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _begin_migration(conn: sqlite3.Connection, version: int) -> bool:
+    """書き込みロックを取り、DBがまだversionの版ならTrue（他のプロセスが先に移行していればロールバックしてFalse）
+
+    複数のワーカーが同時に起動しても移行が重ならないよう、版の確認はロックを取ってから行う。
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    if _schema_version(conn) != version:
+        conn.rollback()
+        return False
+    return True
+
+
+def _migrate_v1_tables(conn: sqlite3.Connection, version: int):
+    """版0→1: 日時をISO形式の文字列で持っていたスキーマの表と列をそろえる
+
+    版の管理より前に作られたDBもここで同じ形にする。トリガー・インデックスは版2で作り直すため作らない。
+    """
+    if not _begin_migration(conn, version):
+        return
+    try:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reservations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                user_name TEXT NOT NULL,
+                channel_id TEXT NOT NULL,
+                event_name TEXT NOT NULL,
+                start_time DATETIME NOT NULL,
+                end_time DATETIME NOT NULL,
+                reminder_minutes INTEGER DEFAULT 15,
+                reminder_sent BOOLEAN DEFAULT FALSE,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                remind_at DATETIME
+            )
+        """)
+
+        # リマインド時刻の列がないDBには追加して埋める
+        columns = {row["name"] for row in cursor.execute("PRAGMA table_info(reservations)")}
+        if "remind_at" not in columns:
+            cursor.execute("ALTER TABLE reservations ADD COLUMN remind_at DATETIME")
+            cursor.execute("""
+                UPDATE reservations
+                SET remind_at = strftime('%Y-%m-%dT%H:%M:%S', start_time, '-' || reminder_minutes || ' minutes')
+            """)
+
+        # 予約の変更履歴（他のプロセスの変更をインデックス・キャッシュ・リマインダーに反映するため）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reservation_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                reservation_id INTEGER NOT NULL,
+                start_time DATETIME,
+                end_time DATETIME,
+                remind_at DATETIME
+            )
+        """)
+
+        # アーカイブ済みの範囲（この時刻より前に終わった予約はreservations_archiveへ移す）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS archive_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                archived_before DATETIME NOT NULL
+            )
+        """)
 
+        # 終了した過去の予約（列はreservationsと同じ。archive_reservationsで少しずつ移す）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reservations_archive (
+                id INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                user_name TEXT NOT NULL,
+                channel_id TEXT NOT NULL,
+                event_name TEXT NOT NULL,
+                start_time DATETIME NOT NULL,
+                end_time DATETIME NOT NULL,
+                reminder_minutes INTEGER DEFAULT 15,
+                reminder_sent BOOLEAN DEFAULT FALSE,
+                created_at DATETIME,
+                remind_at DATETIME,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # 繰り返し予約（各回は保存せず、初回と間隔・最後の回からrecurrence.pyで生成する）
+        # last_startは最後の回の開始時刻（無期限ならNULL）、next_remind_atは次にリマインドする回の送信時刻
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reservation_series (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                user_name TEXT NOT NULL,
+                channel_id TEXT NOT NULL,
+                event_name TEXT NOT NULL,
+                start_time DATETIME NOT NULL,
+                end_time DATETIME NOT NULL,
+                frequency TEXT NOT NULL,
+                last_start DATETIME,
+                reminder_minutes INTEGER DEFAULT 15,
+                next_remind_at DATETIME,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # 個別にキャンセルした回
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS series_exceptions (
+                series_id INTEGER NOT NULL,
+                occurrence_start DATETIME NOT NULL,
+                PRIMARY KEY (series_id, occurrence_start)
+            ) WITHOUT ROWID
+        """)
+
+        # 送信待ちのSlackメッセージ（予約の変更と同じトランザクションで積み、outbox.pyのワーカーが送る）
+        # 送信できたものは削除し、再送の上限に達したものはstatus = 'dead'で残す
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                channel_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                due_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL,
+                claim_owner TEXT,
+                claim_expires_at REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON outbox(status, next_attempt_at)
+        """)
+
+        # プロセス間で1つだけが持つ役割（リマインダーの送信など）のリース
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+        cursor.execute("PRAGMA user_version = 1")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+# 版2で整数の秒（epoch.py）に変える列
+_EPOCH_COLUMNS = {
+    "reservations": ("start_time", "end_time", "remind_at"),
+    "reservations_archive": ("start_time", "end_time", "remind_at"),
+    "reservation_series": ("start_time", "end_time", "last_start", "next_remind_at"),
+    "series_exceptions": ("occurrence_start",),
+    "archive_state": ("archived_before",),
+}
+
+# 版2で作り直すトリガー・インデックス
+_V1_TRIGGERS = (
+    "reservations_log_insert", "reservations_log_delete", "reservations_log_update",
+    "series_log_insert", "series_log_delete", "series_log_update", "series_log_remind",
+    "series_exceptions_log_insert", "reservation_changes_prune",
+)
+_V1_INDEXES = ("idx_start_time", "idx_user_id", "idx_user_start", "idx_remind_at", "idx_archive_start_time", "idx_series_remind")
+
+
+def _epoch_update_sql(table: str, columns: tuple[str, ...]) -> str:
+    """tableのISO形式の日時の列を整数の秒に変えるUPDATE文（変換済みの行は対象外。1つ目の列はNULLにならないこと）"""
+    sets = ", ".join(
+        f"{c} = CASE WHEN typeof({c}) = 'text' THEN CAST(strftime('%s', {c}) AS INTEGER) ELSE {c} END"
+        for c in columns
+    )
+    return f"UPDATE {table} SET {sets} WHERE typeof({columns[0]}) = 'text'"
+
+
+def _migrate_v2_epoch(conn: sqlite3.Connection, version: int):
+    """版1→2: 日時の列をISO形式の文字列から整数の秒（epoch.py）に変え、日付の番号の列と被覆インデックスを加える
+
+    予約・アーカイブの行は_MIGRATION_BATCH行ずつ別のトランザクションで変換し、他のプロセスの書き込みを長く止めない。
+    最後のトランザクションで残りの行と小さい表を変換し、インデックス・トリガーの作成と版の更新を行う。
+    移行中のDBに版1のプロセスが書き込んだ行も最後に変換されるが、移行後は版1のプロセスを動かさないこと。
+    """
+    if not _begin_migration(conn, version):
+        return
+    # 変換のUPDATEを変更履歴に残さないよう、先にトリガーを外す（作り直すのは最後のトランザクション）
+    for trigger in _V1_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.commit()
+
+    for table in ("reservations", "reservations_archive"):
+        update = _epoch_update_sql(table, _EPOCH_COLUMNS[table]) + " AND rowid > ? AND rowid <= ?"
+        last = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+        for lo in range(0, last, _MIGRATION_BATCH):
+            with conn:
+                conn.execute(update, (lo, lo + _MIGRATION_BATCH))
+
+    if not _begin_migration(conn, version):
+        return
+    try:
+        cursor = conn.cursor()
+        for table, columns in _EPOCH_COLUMNS.items():
+            cursor.execute(_epoch_update_sql(table, columns))
+
+        # 日付の番号（1970-01-01が0）。確認の一覧は日付ごとにこの列で引く
+        for table in ("reservations", "reservations_archive"):
+            cursor.execute(f"""
+                ALTER TABLE {table} ADD COLUMN day INTEGER GENERATED ALWAYS AS (start_time / {DAY_SECONDS}) VIRTUAL
+            """)
+
+        for index in _V1_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {index}")
+
+        # 重複チェック・空き枠（SQLで判定する場合）とアーカイブの対象の選択。表を読まずに済むよう終了時刻も含める
+        cursor.execute("CREATE INDEX idx_start_end ON reservations(start_time, end_time)")
+
+        # 確認の一覧（日付の番号で引き、開始時刻順に読む）
+        cursor.execute("CREATE INDEX idx_day ON reservations(day, start_time)")
+        cursor.execute("CREATE INDEX idx_archive_day ON reservations_archive(day, start_time)")
+
+        # ユーザーの予約を (開始時刻, id) 順に読む（キャンセルの選択肢のページ送りは並べ替えも表の読み取りもしない）
+        cursor.execute("CREATE INDEX idx_user_start ON reservations(user_id, start_time, id, event_name)")
+
+        # 送信時刻を過ぎた未送信のリマインダー（開始済みの予約を表を読まずに除く）
+        cursor.execute("CREATE INDEX idx_remind_at ON reservations(reminder_sent, remind_at, start_time)")
+
+        cursor.execute("CREATE INDEX idx_series_remind ON reservation_series(next_remind_at)")
+
+        _create_change_triggers(cursor)
+
+        # 文字列の日時で残っている変更履歴は読めないため捨てる（他のプロセスは遅れを検知して読み直す）
+        cursor.execute("DELETE FROM reservation_changes")
+
+        cursor.execute("PRAGMA user_version = 2")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _create_change_triggers(cursor: sqlite3.Cursor):
+    """予約・シリーズの変更を変更履歴に残すトリガーを作成"""
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS reservations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            user_name TEXT NOT NULL,
-            channel_id TEXT NOT NULL,
-            event_name TEXT NOT NULL,
-            start_time DATETIME NOT NULL,
-            end_time DATETIME NOT NULL,
-            reminder_minutes INTEGER DEFAULT 15,
-            reminder_sent BOOLEAN DEFAULT FALSE,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
+        CREATE TRIGGER reservations_log_insert AFTER INSERT ON reservations
+        BEGIN
+            INSERT INTO reservation_changes (op, reservation_id, start_time, end_time, remind_at)
+            VALUES ('insert', NEW.id, NEW.start_time, NEW.end_time, NEW.remind_at);
+        END
     """)
 
+    # アーカイブへ移す予約の削除は1件ずつ残さない（範囲の変更を op = 'archive' として1件だけ残す）
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_start_time ON reservations(start_time)
+        CREATE TRIGGER reservations_log_delete AFTER DELETE ON reservations
+        WHEN MAX(OLD.start_time, OLD.end_time) >= COALESCE((SELECT archived_before FROM archive_state), 0)
+        BEGIN
+            INSERT INTO reservation_changes (op, reservation_id, start_time, end_time, remind_at)
+            VALUES ('delete', OLD.id, OLD.start_time, OLD.end_time, OLD.remind_at);
+        END
     """)
 
+    # 表示・重複チェック・リマインドに関わる列の更新は削除＋追加として残す（送信済みフラグの更新は残さない）
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_user_id ON reservations(user_id)
+        CREATE TRIGGER reservations_log_update
+        AFTER UPDATE OF user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes, remind_at
+        ON reservations
+        BEGIN
+            INSERT INTO reservation_changes (op, reservation_id, start_time, end_time, remind_at)
+            VALUES ('delete', OLD.id, OLD.start_time, OLD.end_time, OLD.remind_at);
+            INSERT INTO reservation_changes (op, reservation_id, start_time, end_time, remind_at)
+            VALUES ('insert', NEW.id, NEW.start_time, NEW.end_time, NEW.remind_at);
+        END
     """)
 
-    conn.commit()
-    conn.close()
+    # シリーズの変更は op = 'series'（reservation_idにシリーズID）として残し、各プロセスはシリーズを読み直す
+    # 次のリマインドの時刻だけの更新は 'series_remind' として残す（リマインダーの送信役だけが使う）
+    cursor.execute("""
+        CREATE TRIGGER series_log_insert AFTER INSERT ON reservation_series
+        BEGIN
+            INSERT INTO reservation_changes (op, reservation_id, remind_at)
+            VALUES ('series', NEW.id, NEW.next_remind_at);
+        END
+    """)
 
+    cursor.execute("""
+        CREATE TRIGGER series_log_delete AFTER DELETE ON reservation_series
+        BEGIN
+            INSERT INTO reservation_changes (op, reservation_id, remind_at)
+            VALUES ('series', OLD.id, NULL);
+        END
+    """)
+
+    cursor.execute("""
+        CREATE TRIGGER series_log_update
+        AFTER UPDATE OF user_id, user_name, channel_id, event_name, start_time, end_time, frequency, last_start, reminder_minutes
+        ON reservation_series
+        BEGIN
+            INSERT INTO reservation_changes (op, reservation_id, remind_at)
+            VALUES ('series', NEW.id, NEW.next_remind_at);
+        END
+    """)
+
+    cursor.execute("""
+        CREATE TRIGGER series_log_remind AFTER UPDATE OF next_remind_at ON reservation_series
+        BEGIN
+            INSERT INTO reservation_changes (op, reservation_id, remind_at)
+            VALUES ('series_remind', NEW.id, NEW.next_remind_at);
+        END
+    """)
+
+    cursor.execute("""
+        CREATE TRIGGER series_exceptions_log_insert AFTER INSERT ON series_exceptions
+        BEGIN
+            INSERT INTO reservation_changes (op, reservation_id, remind_at)
+            VALUES ('series', NEW.series_id, (SELECT next_remind_at FROM reservation_series WHERE id = NEW.series_id));
+        END
+    """)
 
+    cursor.execute(f"""
+        CREATE TRIGGER reservation_changes_prune AFTER INSERT ON reservation_changes
+        WHEN NEW.seq % 1000 = 0
+        BEGIN
+            DELETE FROM reservation_changes WHERE seq <= NEW.seq - {_CHANGES_RETENTION};
+        END
+    """)
+
+
+def _migrate_v3_processed_events(conn: sqlite3.Connection, version: int):
+    """版2→3: Slackのイベント・操作の重複排除に使う、処理済みのキーの表を加える"""
+    if not _begin_migration(conn, version):
+        return
+    try:
+        conn.execute("""
+            CREATE TABLE processed_events (
+                key TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX idx_processed_events_expires ON processed_events(expires_at)")
+        conn.execute("PRAGMA user_version = 3")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+_MIGRATIONS: list[Callable[[sqlite3.Connection, int], None]] = [
+    _migrate_v1_tables,
+    _migrate_v2_epoch,
+    _migrate_v3_processed_events,
+]
+
+
+def load_interval_index():
+    """全予約から重複チェック用の区間インデックスと空き枠のビットマップ、繰り返し予約のシリーズを構築"""
+    global _changes_seq
+    conn = get_connection()
+
+    with _changes_lock:
+        # 予約一覧と変更履歴の番号を同じスナップショットから読む
+        # （書き込みトランザクションの中から呼ばれた場合はそのトランザクションで読み、コミットは呼び出し側に任せる）
+        nested = conn.in_transaction
+        if not nested:
+            conn.execute("BEGIN")
+        try:
+            rows = conn.execute("SELECT id, start_time, end_time FROM reservations").fetchall()
+            series = _load_series(conn)
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM reservation_changes").fetchone()[0]
+        finally:
+            if not nested:
+                conn.commit()
+        rows = [tuple(row) for row in rows]
+        _interval_index.load(rows)
+        _slot_bitmap.load(rows)
+        _series_index.load(series)
+        _changes_seq = seq
+
+
+def _load_series(conn: sqlite3.Connection, series_id: Optional[int] = None) -> list[tuple[dict, Recurrence]]:
+    """シリーズと除外する回を読み、(シリーズの行, 規則) の一覧にする（series_idを渡すとそのシリーズのみ）"""
+    if series_id is None:
+        rows = conn.execute("SELECT * FROM reservation_series ORDER BY id").fetchall()
+        exceptions = conn.execute("SELECT series_id, occurrence_start FROM series_exceptions").fetchall()
+    else:
+        rows = conn.execute("SELECT * FROM reservation_series WHERE id = ?", (series_id,)).fetchall()
+        exceptions = conn.execute(
+            "SELECT series_id, occurrence_start FROM series_exceptions WHERE series_id = ?", (series_id,)
+        ).fetchall()
+
+    skips: dict[int, list[str]] = {}
+    for row in exceptions:
+        skips.setdefault(row["series_id"], []).append(row["occurrence_start"])
+    return [(dict(row), series_recurrence(row, skips.get(row["id"], ()))) for row in rows]
+
+
+def _reload_series(conn: sqlite3.Connection, series_id: int):
+    """シリーズをDBから読み直してメモリに反映（削除済みなら取り除く）"""
+    entries = _load_series(conn, series_id)
+    if entries:
+        _series_index.put(*entries[0])
+    else:
+        _series_index.remove(series_id)
+
+
+def _series_entries(conn: sqlite3.Connection) -> list[tuple[dict, Recurrence]]:
+    """全シリーズの (シリーズの行, 規則)（未読み込み時はDBから読む）"""
+    if _series_index.loaded:
+        sync_changes(conn)
+        return _series_index.snapshot()
+    return _load_series(conn)
+
+
+def get_changes(after_seq: int) -> list[dict]:
+    """変更履歴のうちafter_seqより後のものを取得"""
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT seq, op, reservation_id, start_time, end_time, remind_at
+        FROM reservation_changes
+        WHERE seq > ?
+        ORDER BY seq
+    """, (after_seq,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_last_change_seq() -> int:
+    """変更履歴の最新の番号"""
+    conn = get_connection()
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM reservation_changes").fetchone()[0]
+
+
+def sync_changes(conn: sqlite3.Connection):
+    """他のプロセス・接続による予約の変更を区間インデックス・空き枠のビットマップ・日付キャッシュに反映
+
+    変更がなければ主キーの範囲検索1回で終わる。履歴が削除済みの範囲まで遅れていた場合は読み直す。
+    """
+    global _changes_seq
+    with _changes_lock:
+        rows = conn.execute("""
+            SELECT seq, op, reservation_id, start_time, end_time
+            FROM reservation_changes
+            WHERE seq > ?
+            ORDER BY seq
+        """, (_changes_seq,)).fetchall()
+        if not rows:
+            return
+
+        if rows[0]["seq"] != _changes_seq + 1:
+            lagged = True
+        else:
+            lagged = False
+            series_changed = False
+            for row in rows:
+                if row["op"] == "series_remind":
+                    continue
+                if row["op"] == "archive":
+                    # start_timeより前に終わった予約はアーカイブへ移る（過去の日の一覧は変わらない）
+                    _slot_bitmap.remove_many(_interval_index.prune(from_epoch(row["start_time"])))
+                    continue
+                if row["op"] == "series":
+                    # シリーズの回はどの日にも現れ得るため、日付キャッシュはまとめて破棄する
+                    _reload_series(conn, row["reservation_id"])
+                    series_changed = True
+                    continue
+                if row["op"] == "insert":
+                    start_time = from_epoch(row["start_time"])
+                    end_time = from_epoch(row["end_time"])
+                    _interval_index.add(row["reservation_id"], start_time, end_time)
+                    _slot_bitmap.add(row["reservation_id"], start_time, end_time)
+                else:
+                    _interval_index.remove(row["reservation_id"])
+                    _slot_bitmap.remove(row["reservation_id"])
+                day_cache.invalidate(date_of(row["start_time"]).isoformat())
+            if series_changed:
+                day_cache.clear()
+            _changes_seq = rows[-1]["seq"]
+
+    if lagged:
+        print("Change log lagged behind; reloading interval index")
+        load_interval_index()
+        day_cache.clear()
+
+
+def _insert_reservation(
+    conn: sqlite3.Connection,
+    user_id: str,
+    user_name: str,
+    channel_id: str,
+    event_name: str,
+    start_time: datetime,
+    end_time: datetime,
+    reminder_minutes: int
+) -> int:
+    """トランザクション内で予約を挿入し、区間インデックス・空き枠のビットマップにも反映"""
+    remind_at = start_time - timedelta(minutes=reminder_minutes)
+    cursor = conn.execute("""
+        INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes, remind_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, user_name, channel_id, event_name, to_epoch(start_time), to_epoch(end_time), reminder_minutes, to_epoch(remind_at)))
+
+    # コミット前にインデックスへ入れ、次の書き込みトランザクションから必ず見えるようにする
+    reservation_id = cursor.lastrowid
+    _interval_index.add(reservation_id, start_time, end_time)
+    _slot_bitmap.add(reservation_id, start_time, end_time)
+    return reservation_id
+
+
+def _rollback_insert(conn: sqlite3.Connection, reservation_id: Optional[int]):
+    """挿入をロールバックしてインデックス・ビットマップからも外す"""
+    conn.rollback()
+    if reservation_id is not None:
+        _interval_index.remove(reservation_id)
+        _slot_bitmap.remove(reservation_id)
+
+
+@timed_query
 def create_reservation(
     user_id: str,
     user_name: str,
@@ -56,148 +679,1036 @@ def create_reservation(
 ) -> int:
     """予約を作成"""
     conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (user_id, user_name, channel_id, event_name, start_time.isoformat(), end_time.isoformat(), reminder_minutes))
 
-    reservation_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    reservation_id = None
+    try:
+        reservation_id = _insert_reservation(
+            conn, user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes
+        )
+        conn.commit()
+    except BaseException:
+        # 接続は使い回すため、失敗時はロールバックしておく
+        _rollback_insert(conn, reservation_id)
+        raise
+    day_cache.invalidate(start_time.date().isoformat())
 
     return reservation_id
 
 
-def get_reservation(reservation_id: int) -> Optional[dict]:
+@timed_query
+def reserve_if_free(
+    user_id: str,
+    user_name: str,
+    channel_id: str,
+    event_name: str,
+    start_time: datetime,
+    end_time: datetime,
+    reminder_minutes: int = 15,
+    notify: Optional[Callable[[int], OutboxMessages]] = None
+) -> tuple[Optional[int], Optional[Reservation]]:
+    """重複がなければ予約を作成（重複チェックと作成を1つのトランザクションで行う）
+
+    BEGIN IMMEDIATEで書き込みロックを先に取るため、同時に送信されても二重予約にならない。
+    notifyを渡すと、予約IDから作った通知を同じトランザクションでoutboxに積む。
+    戻り値は作成時 (予約ID, None)、重複時 (None, 重複している予約)
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+
+    reservation_id = None
+    try:
+        conflict = _find_conflict(conn, start_time, end_time)
+        if conflict:
+            conn.rollback()
+            return None, conflict
+
+        reservation_id = _insert_reservation(
+            conn, user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes
+        )
+        if notify:
+            _enqueue(conn, notify(reservation_id))
+        conn.commit()
+    except BaseException:
+        _rollback_insert(conn, reservation_id)
+        raise
+    day_cache.invalidate(start_time.date().isoformat())
+
+    return reservation_id, None
+
+
+@timed_query
+def get_reservation(reservation_id: int) -> Optional[Reservation]:
     """予約を取得"""
     conn = get_connection()
-    cursor = conn.cursor()
+    return _fetch_reservation(conn, f"SELECT {COLUMNS} FROM reservations WHERE id = ?", (reservation_id,))
 
-    cursor.execute("SELECT * FROM reservations WHERE id = ?", (reservation_id,))
-    row = cursor.fetchone()
-    conn.close()
 
-    return dict(row) if row else None
+@timed_query
+def get_reservations_by_date(date: str) -> list[Reservation]:
+    """指定日の予約一覧を取得（キャッシュ経由、返すリストは変更しないこと）"""
+    return day_cache.get(date, "reservations", lambda: _load_reservations_by_date(date))
 
 
-def get_reservations_by_date(date: str) -> list[dict]:
-    """指定日の予約一覧を取得"""
+@timed_query
+def _load_reservations_by_date(date: str) -> list[Reservation]:
+    """指定日の予約一覧をDBから取得"""
     conn = get_connection()
-    cursor = conn.cursor()
 
-    cursor.execute("""
-        SELECT * FROM reservations
-        WHERE DATE(start_time) = ?
+    # 日付の番号の列（idx_day）で引く
+    first = datetime.fromisoformat(date)
+    day = day_number(first)
+    rows = _fetch_reservations(conn, f"""
+        SELECT {COLUMNS} FROM reservations
+        WHERE day = ?
         ORDER BY start_time
-    """, (date,))
+    """, (day,))
 
-    rows = cursor.fetchall()
-    conn.close()
+    # 過去の日はアーカイブへ移した予約も読む（アーカイブするのは前日以前に始まった予約のみ）
+    if date < datetime.now().date().isoformat():
+        rows += _fetch_reservations(conn, f"""
+            SELECT {COLUMNS} FROM reservations_archive
+            WHERE day = ?
+        """, (day,))
 
-    return [dict(row) for row in rows]
+    # その日に始まる繰り返しの回を加えて開始時刻順に並べる
+    occurrences = _series_occurrences(conn, first, first + timedelta(days=1))
+    return sorted(rows + occurrences, key=order_key)
 
 
-def get_reservations_by_user(user_id: str) -> list[dict]:
-    """指定ユーザーの予約一覧を取得（未来の予約のみ）"""
+def iter_reservations_between(first: date, last: date) -> Iterator[tuple[date, list[Reservation]]]:
+    """first〜lastの (日付, その日の予約一覧) を日付順に生成（予約のない日も空の一覧で含める）
+
+    予約・アーカイブはそれぞれ1回の範囲のクエリ（idx_day・idx_archive_day）で開始時刻順に読み、
+    繰り返しの回とマージしながら日ごとにまとめる。期間の予約をまとめてリストにはしない。
+    """
     conn = get_connection()
-    cursor = conn.cursor()
+    first_day, last_day = day_number(first), day_number(last)
+    streams = [_stream_reservations(conn, f"""
+        SELECT {COLUMNS} FROM reservations
+        WHERE day BETWEEN ? AND ?
+        ORDER BY day, start_time, id
+    """, (first_day, last_day))]
 
-    cursor.execute("""
-        SELECT * FROM reservations
-        WHERE user_id = ? AND start_time > datetime('now', 'localtime')
+    # 前日以前の日はアーカイブへ移した予約も読む
+    today = day_number(datetime.now().date())
+    if first_day < today:
+        streams.append(_stream_reservations(conn, f"""
+            SELECT {COLUMNS} FROM reservations_archive
+            WHERE day BETWEEN ? AND ?
+            ORDER BY day, start_time, id
+        """, (first_day, min(last_day, today - 1))))
+
+    start = datetime(first.year, first.month, first.day)
+    occurrences = _series_occurrences(conn, start, start + timedelta(days=last_day - first_day + 1))
+    streams.append(sorted(occurrences, key=order_key))
+
+    days = groupby(heapq.merge(*streams, key=order_key), key=lambda r: r.start_time.date())
+    pending = next(days, None)
+    for i in range(last_day - first_day + 1):
+        day = first + timedelta(days=i)
+        if pending and pending[0] == day:
+            yield day, list(pending[1])
+            pending = next(days, None)
+        else:
+            yield day, []
+
+
+def _series_occurrences(conn: sqlite3.Connection, first: datetime, before: datetime) -> list[Reservation]:
+    """first〜beforeに始まる繰り返しの回"""
+    found = []
+    for series, rule in _series_entries(conn):
+        found.extend(occurrence(series, s, e) for s, e in rule.occurrences(first, before) if s >= first)
+    return found
+
+
+@timed_query
+def get_reservations_by_user(user_id: str) -> list[Reservation]:
+    """指定ユーザーの予約一覧を取得（未来の予約のみ）"""
+    conn = get_connection()
+    return _fetch_reservations(conn, f"""
+        SELECT {COLUMNS} FROM reservations
+        WHERE user_id = ? AND start_time > ?
         ORDER BY start_time
-    """, (user_id,))
+    """, (user_id, to_epoch(datetime.now())))
 
-    rows = cursor.fetchall()
-    conn.close()
 
-    return [dict(row) for row in rows]
+@timed_query
+def has_upcoming_reservations(user_id: str) -> bool:
+    """指定ユーザーに未来の予約があるか"""
+    conn = get_connection()
+    now = datetime.now()
+    row = conn.execute("""
+        SELECT 1 FROM reservations WHERE user_id = ? AND start_time > ? LIMIT 1
+    """, (user_id, to_epoch(now))).fetchone()
+    if row is not None:
+        return True
+    return any(
+        series["user_id"] == user_id and rule.next_start(now) is not None
+        for series, rule in _series_entries(conn)
+    )
+
 
+@timed_query
+def get_reservations_page_by_user(
+    user_id: str,
+    limit: int,
+    after: Optional[tuple[datetime, int]] = None,
+    day: Optional[date] = None,
+    name: Optional[str] = None
+) -> list[Reservation]:
+    """指定ユーザーの未来の予約・繰り返しの回を開始時刻順に最大limit件取得（予約はid・event_name・start_timeのみ）
 
-def delete_reservation(reservation_id: int, user_id: str) -> Optional[dict]:
-    """予約を削除（本人のみ可能）、削除した予約情報を返す"""
+    afterに前のページの最後の (start_time, id) を渡すとその続きから読む（OFFSETを使わないkeyset方式、
+    繰り返しの回のidは -シリーズID、recurrence.order_key参照）。
+    dayは開始日、nameはミーティング名の部分一致で絞り込む。
+    idx_user_start (user_id, start_time, id) を順に読み、繰り返しの回もページの分だけ生成して混ぜる。
+    """
     conn = get_connection()
-    cursor = conn.cursor()
 
-    # まず予約情報を取得
-    cursor.execute("SELECT * FROM reservations WHERE id = ? AND user_id = ?", (reservation_id, user_id))
-    row = cursor.fetchone()
+    # 下限（今・開始日・前のページの最後）は1つにまとめ、インデックスをその位置から読む
+    # （行値の比較だけではインデックスの読み始めに使われない）
+    lower = max(to_epoch(datetime.now()), day_start(day) if day else 0, to_epoch(after[0]) if after else 0)
+    query = f"""
+        SELECT {SUMMARY_COLUMNS} FROM reservations
+        WHERE user_id = ? AND start_time >= ?
+    """
+    params = [user_id, lower]
 
-    if not row:
-        conn.close()
-        return None
+    if after:
+        query += " AND (start_time, id) > (?, ?)"
+        params.extend((to_epoch(after[0]), after[1]))
+    if day:
+        query += " AND start_time < ?"
+        params.append(day_start(day + timedelta(days=1)))
+    if name:
+        query += " AND event_name LIKE ? ESCAPE '\\'"
+        escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
 
-    reservation = dict(row)
+    query += " ORDER BY start_time, id LIMIT ?"
+    params.append(limit)
 
-    # 削除実行
-    cursor.execute("DELETE FROM reservations WHERE id = ? AND user_id = ?", (reservation_id, user_id))
-    conn.commit()
-    conn.close()
+    rows = _fetch_reservations(conn, query, params)
 
-    return reservation
+    before = datetime.combine(day + timedelta(days=1), datetime.min.time()) if day else None
+    occurrences = [
+        _page_occurrences(series, rule, lower, before, after)
+        for series, rule in _series_entries(conn)
+        if series["user_id"] == user_id and (not name or name.lower() in series["event_name"].lower())
+    ]
+    if not occurrences:
+        return rows
+    return list(islice(heapq.merge(rows, *occurrences, key=order_key), limit))
+
+
+def _page_occurrences(
+    series: dict, rule: Recurrence, lower: int, before: Optional[datetime], after: Optional[tuple[datetime, int]]
+) -> Iterator[Reservation]:
+    """キャンセルの選択肢のページ用に、lower以降に始まる繰り返しの回を順に生成"""
+    first = from_epoch(lower)
+    for s, e in rule.occurrences(first, before):
+        r = occurrence(series, s, e)
+        if s >= first and (after is None or order_key(r) > after):
+            yield r
 
 
-def check_conflict(start_time: datetime, end_time: datetime, exclude_id: Optional[int] = None) -> Optional[dict]:
-    """予約の重複をチェック"""
+@timed_query
+def delete_reservation(
+    reservation_id: int,
+    user_id: str,
+    notify: Optional[Callable[[Reservation], OutboxMessages]] = None
+) -> Optional[Reservation]:
+    """予約を削除（本人のみ可能）、削除した予約情報を返す
+
+    notifyを渡すと、削除した予約から作った通知を同じトランザクションでoutboxに積む。
+    """
     conn = get_connection()
-    cursor = conn.cursor()
 
-    query = """
-        SELECT * FROM reservations
+    with conn:
+        reservation = _fetch_reservation(
+            conn, f"DELETE FROM reservations WHERE id = ? AND user_id = ? RETURNING {COLUMNS}", (reservation_id, user_id)
+        )
+        if not reservation:
+            return None
+        if notify:
+            _enqueue(conn, notify(reservation))
+    _interval_index.remove(reservation_id)
+    _slot_bitmap.remove(reservation_id)
+    day_cache.invalidate(reservation.start_time.date().isoformat())
+
+    return reservation
+
+
+@timed_query
+def check_conflict(start_time: datetime, end_time: datetime, exclude_id: Optional[int] = None) -> Optional[Reservation]:
+    """予約の重複をチェック（繰り返し予約の回と重なる場合はその回を返す）"""
+    return _find_conflict(get_connection(), start_time, end_time, exclude_id)
+
+
+def _find_conflict(
+    conn: sqlite3.Connection, start_time: datetime, end_time: datetime, exclude_id: Optional[int] = None
+) -> Optional[Reservation]:
+    """指定した接続で重複する予約・繰り返しの回を探す"""
+    conflict = _find_reservation_conflict(conn, start_time, end_time, exclude_id)
+    if conflict:
+        return conflict
+
+    # シリーズごとに重なり得る回を間隔から計算する（各回を並べてたどらない）
+    for series, rule in _series_entries(conn):
+        found = rule.first_overlap(start_time, end_time)
+        if found:
+            return occurrence(series, *found)
+    return None
+
+
+def _find_reservation_conflict(
+    conn: sqlite3.Connection, start_time: datetime, end_time: datetime, exclude_id: Optional[int] = None
+) -> Optional[Reservation]:
+    """指定した接続で重複する予約を探す（インデックス未読み込み時はSQLで判定）"""
+    if _interval_index.loaded:
+        sync_changes(conn)
+        while True:
+            conflict_id = _interval_index.find_conflict(start_time, end_time, exclude_id)
+            if conflict_id is None:
+                return None
+            conflict = _fetch_reservation(conn, f"SELECT {COLUMNS} FROM reservations WHERE id = ?", (conflict_id,))
+            if conflict:
+                return conflict
+            # 削除の反映より前に読んだ変更で残っていた予約は取り除いて探し直す
+            _interval_index.remove(conflict_id)
+            _slot_bitmap.remove(conflict_id)
+
+    query = f"""
+        SELECT {COLUMNS} FROM reservations
         WHERE (
             (start_time < ? AND end_time > ?) OR
             (start_time < ? AND end_time > ?) OR
             (start_time >= ? AND end_time <= ?)
         )
     """
-    params = [
-        end_time.isoformat(), start_time.isoformat(),
-        end_time.isoformat(), start_time.isoformat(),
-        start_time.isoformat(), end_time.isoformat()
-    ]
+    start, end = to_epoch(start_time), to_epoch(end_time)
+    params = [end, start, end, start, start, end]
 
     if exclude_id:
         query += " AND id != ?"
         params.append(exclude_id)
 
-    cursor.execute(query, params)
-    row = cursor.fetchone()
-    conn.close()
+    # 区間インデックスと同じく、重なる予約が複数あれば最小のIDを返す
+    return _fetch_reservation(conn, query + " ORDER BY id LIMIT 1", params)
+
+
+@timed_query
+def check_series_conflict(
+    start_time: datetime,
+    end_time: datetime,
+    frequency: str,
+    until: Optional[date] = None,
+    count: Optional[int] = None
+) -> Optional[Reservation]:
+    """繰り返し予約の各回の重複をチェック（最初に重なる予約・繰り返しの回を返す）"""
+    rule = Recurrence(start_time, end_time, frequency, last_occurrence(start_time, frequency, until, count))
+    return _find_series_conflict(get_connection(), rule)
+
+
+def _find_series_conflict(conn: sqlite3.Connection, rule: Recurrence) -> Optional[Reservation]:
+    """指定した接続で、繰り返しの各回と重複する予約・繰り返しの回を探す
+
+    各回を開始時刻順に生成しながら既存の予約を1回なめる（無期限でも最後の予約を過ぎたら打ち切る）。
+    他のシリーズとは周期の重なりを計算で判定し、個別にキャンセルした回も重なりとみなす。
+    """
+    if _interval_index.loaded:
+        sync_changes(conn)
+        while True:
+            found = _interval_index.find_first_conflict(rule.occurrences())
+            if found is None:
+                break
+            conflict = _fetch_reservation(conn, f"SELECT {COLUMNS} FROM reservations WHERE id = ?", (found[0],))
+            if conflict:
+                return conflict
+            _interval_index.remove(found[0])
+            _slot_bitmap.remove(found[0])
+    else:
+        # 初回以降の予約を開始時刻順に読み、それぞれに重なる回があるかを間隔から計算する
+        query = f"SELECT {COLUMNS} FROM reservations WHERE end_time > ?"
+        params = [to_epoch(rule.start)]
+        if rule.last is not None:
+            query += " AND start_time < ?"
+            params.append(to_epoch(rule.last + rule.duration))
+        cursor = conn.cursor()
+        cursor.row_factory = reservation_factory
+        for r in cursor.execute(query + " ORDER BY start_time", params):
+            if rule.first_overlap(r.start_time, r.end_time):
+                return r
+
+    for series, other in _series_entries(conn):
+        found = rule.overlap_with(other)
+        if found:
+            return occurrence(series, *found)
+    return None
+
+
+@timed_query
+def reserve_series_if_free(
+    user_id: str,
+    user_name: str,
+    channel_id: str,
+    event_name: str,
+    start_time: datetime,
+    end_time: datetime,
+    frequency: str,
+    until: Optional[date] = None,
+    count: Optional[int] = None,
+    reminder_minutes: int = 15,
+    notify: Optional[Callable[[dict], OutboxMessages]] = None
+) -> tuple[Optional[dict], Optional[Reservation]]:
+    """重複がなければ繰り返し予約を作成（各回は保存せず、シリーズの1行だけを挿入する）
+
+    重複チェックと作成はreserve_if_freeと同じく1つのトランザクションで行う。
+    戻り値は作成時 (シリーズの行, None)、重複時 (None, 重複している予約・繰り返しの回)
+    """
+    rule = Recurrence(start_time, end_time, frequency, last_occurrence(start_time, frequency, until, count))
+    next_start = rule.next_start(datetime.now())
+    next_remind_at = next_start - timedelta(minutes=reminder_minutes) if next_start else None
+
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+
+    series = None
+    try:
+        conflict = _find_series_conflict(conn, rule)
+        if conflict:
+            conn.rollback()
+            return None, conflict
+
+        series = dict(conn.execute("""
+            INSERT INTO reservation_series (
+                user_id, user_name, channel_id, event_name, start_time, end_time,
+                frequency, last_start, reminder_minutes, next_remind_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING *
+        """, (
+            user_id, user_name, channel_id, event_name, to_epoch(start_time), to_epoch(end_time),
+            frequency, to_epoch(rule.last) if rule.last else None, reminder_minutes,
+            to_epoch(next_remind_at) if next_remind_at else None
+        )).fetchone())
+        # コミット前に入れ、次の書き込みトランザクションから必ず見えるようにする
+        _series_index.put(series, rule)
+        if notify:
+            _enqueue(conn, notify(series))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        if series is not None:
+            _series_index.remove(series["id"])
+        raise
+    day_cache.clear()
 
+    return series, None
+
+
+@timed_query
+def get_series(series_id: int) -> Optional[dict]:
+    """繰り返し予約のシリーズを取得"""
+    conn = get_connection()
+    row = conn.execute("SELECT * FROM reservation_series WHERE id = ?", (series_id,)).fetchone()
     return dict(row) if row else None
 
 
-def get_pending_reminders() -> list[dict]:
-    """未送信のリマインダーを取得"""
+@timed_query
+def cancel_occurrence(
+    series_id: int,
+    user_id: str,
+    occurrence_start: datetime,
+    following: bool = False,
+    notify: Optional[Callable[[Reservation], OutboxMessages]] = None
+) -> Optional[Reservation]:
+    """繰り返し予約の1回をキャンセル（本人のみ可能）、キャンセルした回を返す
+
+    followingならその回以降をすべてキャンセルする（初回からならシリーズごと削除）。
+    返す回のnext_remind_atはシリーズの次のリマインドの時刻（残っていなければNone）。
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+
+    try:
+        entries = _load_series(conn, series_id)
+        if not entries or entries[0][0]["user_id"] != user_id or not entries[0][1].includes(occurrence_start):
+            conn.rollback()
+            return None
+        series, rule = entries[0]
+        cancelled = occurrence(series, occurrence_start, occurrence_start + rule.duration)
+
+        if following and occurrence_start - rule.step < rule.start:
+            conn.execute("DELETE FROM series_exceptions WHERE series_id = ?", (series_id,))
+            conn.execute("DELETE FROM reservation_series WHERE id = ?", (series_id,))
+            series = None
+            next_remind_at = None
+        else:
+            if following:
+                rule.last = occurrence_start - rule.step
+                series["last_start"] = to_epoch(rule.last)
+                conn.execute(
+                    "UPDATE reservation_series SET last_start = ? WHERE id = ?", (series["last_start"], series_id)
+                )
+            else:
+                rule.skip.add(occurrence_start)
+                conn.execute(
+                    "INSERT INTO series_exceptions (series_id, occurrence_start) VALUES (?, ?)",
+                    (series_id, to_epoch(occurrence_start))
+                )
+            next_start = rule.next_start(datetime.now())
+            next_remind_at = (
+                to_epoch(next_start - timedelta(minutes=series["reminder_minutes"])) if next_start else None
+            )
+            series["next_remind_at"] = next_remind_at
+            conn.execute(
+                "UPDATE reservation_series SET next_remind_at = ? WHERE id = ?", (next_remind_at, series_id)
+            )
+
+        cancelled.next_remind_at = from_epoch(next_remind_at) if next_remind_at is not None else None
+        if notify:
+            _enqueue(conn, notify(cancelled))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    if series is None:
+        _series_index.remove(series_id)
+    else:
+        _series_index.put(series, rule)
+    if following:
+        day_cache.clear()
+    else:
+        day_cache.invalidate(occurrence_start.date().isoformat())
+
+    return cancelled
+
+
+@timed_query
+def get_busy_slots(first_day: date, last_day: date) -> list[int]:
+    """first_day〜last_dayの各日の埋まっている枠のビット（ビットiが07:00からi番目の30分枠、slot_bitmap参照）"""
+    conn = get_connection()
+    if _slot_bitmap.loaded:
+        sync_changes(conn)
+        return _add_series_slots(conn, first_day, _slot_bitmap.busy(first_day, last_day))
+
+    # ビットマップ未読み込み時はSQLで範囲内の予約を読んで組み立てる
+    rows = conn.execute("""
+        SELECT start_time, end_time FROM reservations
+        WHERE start_time < ? AND end_time > ?
+    """, (day_start(last_day + timedelta(days=1)), day_start(first_day))).fetchall()
+
+    busy = [0] * ((last_day - first_day).days + 1)
+    offset = first_day.toordinal()
+    for row in rows:
+        masks = epoch_day_masks(row["start_time"], row["end_time"])
+        for ordinal, mask in masks.items():
+            if 0 <= ordinal - offset < len(busy):
+                busy[ordinal - offset] |= mask
+    return _add_series_slots(conn, first_day, busy)
+
+
+def _add_series_slots(conn: sqlite3.Connection, first_day: date, busy: list[int]) -> list[int]:
+    """各日の埋まっている枠のビットに繰り返しの回の分を加える"""
+    first = datetime.combine(first_day, datetime.min.time())
+    before = first + timedelta(days=len(busy))
+    offset = first_day.toordinal()
+    for _, rule in _series_entries(conn):
+        for s, e in rule.occurrences(first, before):
+            for ordinal, mask in day_masks(s, e).items():
+                if 0 <= ordinal - offset < len(busy):
+                    busy[ordinal - offset] |= mask
+    return busy
+
+
+@timed_query
+def get_pending_reminders() -> list[Reservation]:
+    """未送信のリマインダーを取得（送信時刻を過ぎたもの）"""
+    conn = get_connection()
+    now = to_epoch(datetime.now())
+    return _fetch_reservations(conn, f"""
+        SELECT {COLUMNS} FROM reservations
+        WHERE reminder_sent = FALSE
+        AND remind_at <= ?
+        AND start_time > ?
+    """, (now, now))
+
+
+@timed_query
+def get_upcoming_reminders() -> list[tuple[int, datetime]]:
+    """未送信のリマインダーの (予約ID, 送信時刻) の一覧を取得（スケジューラの初期化用）
+
+    繰り返し予約は次の回の送信時刻を、予約IDを -シリーズID として含める。
+    """
     conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute("""
-        SELECT * FROM reservations
+        SELECT id, remind_at FROM reservations
         WHERE reminder_sent = FALSE
-        AND datetime(start_time, '-' || reminder_minutes || ' minutes') <= datetime('now', 'localtime')
-        AND start_time > datetime('now', 'localtime')
-    """)
+        AND start_time > ?
+        UNION ALL
+        SELECT -id, next_remind_at FROM reservation_series
+        WHERE next_remind_at IS NOT NULL
+        ORDER BY remind_at
+    """, (to_epoch(datetime.now()),))
 
-    rows = cursor.fetchall()
-    conn.close()
+    return [(reservation_id, from_epoch(remind_at)) for reservation_id, remind_at in cursor]
 
-    return [dict(row) for row in rows]
 
+# SQLiteのバインド変数上限を超えないよう、IN句は分割して発行する
+_IN_CLAUSE_CHUNK = 500
+
+
+@timed_query
+def queue_due_reminders(format_message: Callable[[Reservation], str], limit: int) -> int:
+    """送信時刻を過ぎた未送信のリマインダーを送信時刻の早い順にlimit件まで送信済みにし、
+    同じトランザクションでメッセージをoutboxに積む（積んだ件数を返す）
+
+    送信済みへの更新と取得を1文で行うため、複数のプロセスが同時に呼んでも1件は1回しか積まれない。
+    繰り返し予約は次のリマインドの時刻を次の回へ進めた分を数える（開始を過ぎた回は送らずに飛ばす）。
+    """
+    conn = get_connection()
+    now = to_epoch(datetime.now())
+
+    with conn:
+        rows = _fetch_reservations(conn, f"""
+            UPDATE reservations SET reminder_sent = TRUE
+            WHERE id IN (
+                SELECT id FROM reservations
+                WHERE reminder_sent = FALSE
+                AND remind_at <= ?
+                AND start_time > ?
+                ORDER BY remind_at
+                LIMIT ?
+            )
+            RETURNING {COLUMNS}
+        """, (now, now, limit))
+        _enqueue(conn, [
+            ("reminder", r.channel_id, format_message(r), r.remind_at.timestamp())
+            for r in rows
+        ])
+        advanced = _queue_series_reminders(conn, format_message, now, limit - len(rows))
+
+    return len(rows) + advanced
+
+
+def _queue_series_reminders(
+    conn: sqlite3.Connection, format_message: Callable[[Reservation], str], now: int, limit: int
+) -> int:
+    """トランザクション内で、送信時刻を過ぎた繰り返しの回のリマインダーをoutboxに積んで次の回へ進める"""
+    if limit <= 0:
+        return 0
+
+    rows = conn.execute("""
+        SELECT * FROM reservation_series
+        WHERE next_remind_at <= ?
+        ORDER BY next_remind_at
+        LIMIT ?
+    """, (now, limit)).fetchall()
 
+    now_dt = from_epoch(now)
+    advanced = 0
+    messages = []
+    for row in rows:
+        series, rule = _load_series(conn, row["id"])[0]
+        remind_at = from_epoch(row["next_remind_at"])
+        start = remind_at + timedelta(minutes=row["reminder_minutes"])
+        next_start = rule.next_start(max(start, now_dt))
+        next_remind_at = (
+            to_epoch(next_start - timedelta(minutes=row["reminder_minutes"])) if next_start else None
+        )
+        # 読んだ時刻のままの場合だけ進める（他のプロセスが先に進めていれば積まない）
+        claimed = conn.execute("""
+            UPDATE reservation_series SET next_remind_at = ? WHERE id = ? AND next_remind_at = ?
+        """, (next_remind_at, row["id"], row["next_remind_at"])).rowcount
+        if not claimed:
+            continue
+        advanced += 1
+        if start > now_dt and rule.includes(start):
+            reminder = occurrence(series, start, start + rule.duration)
+            messages.append(("reminder", row["channel_id"], format_message(reminder), remind_at.timestamp()))
+    _enqueue(conn, messages)
+    return advanced
+
+
+@timed_query
 def mark_reminder_sent(reservation_id: int):
     """リマインダー送信済みにマーク"""
     conn = get_connection()
-    cursor = conn.cursor()
 
-    cursor.execute("""
-        UPDATE reservations SET reminder_sent = TRUE WHERE id = ?
-    """, (reservation_id,))
+    with conn:
+        conn.execute("""
+            UPDATE reservations SET reminder_sent = TRUE WHERE id = ?
+        """, (reservation_id,))
 
-    conn.commit()
-    conn.close()
+
+def _enqueue(conn: sqlite3.Connection, messages: OutboxMessages):
+    """トランザクション内でメッセージをoutboxに積む"""
+    now = time.time()
+    conn.executemany("""
+        INSERT INTO outbox (kind, channel_id, text, due_at, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, ((kind, channel_id, text, due_at, now, now) for kind, channel_id, text, due_at in messages))
+
+
+@timed_query
+def enqueue_messages(messages: OutboxMessages):
+    """予約の変更を伴わないメッセージ（エラーの通知など）をoutboxに積む"""
+    if not messages:
+        return
+
+    conn = get_connection()
+
+    with conn:
+        _enqueue(conn, messages)
+
+
+@timed_query
+def claim_outbox_messages(owner: str, ttl: float, limit: int) -> list[dict]:
+    """送信できる時刻になったメッセージを古い順にlimit件まで、ownerの送信分としてttl秒間確保して返す
+
+    他のプロセスが確保中のものは返さない。確保したまま期限が切れたもの
+    （送信中にプロセスが落ちた場合など）は再び確保できる。
+    """
+    conn = get_connection()
+    now = time.time()
+
+    with conn:
+        rows = conn.execute("""
+            UPDATE outbox SET claim_owner = ?, claim_expires_at = ?
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status = 'pending'
+                AND next_attempt_at <= ?
+                AND (claim_owner IS NULL OR claim_expires_at <= ?)
+                ORDER BY next_attempt_at
+                LIMIT ?
+            )
+            RETURNING *
+        """, (owner, now + ttl, now, now, limit)).fetchall()
+
+    return [dict(row) for row in rows]
+
+
+@timed_query
+def complete_outbox_messages(message_ids: list[int]):
+    """送信できたメッセージをoutboxから削除"""
+    if not message_ids:
+        return
+
+    conn = get_connection()
+
+    with conn:
+        for i in range(0, len(message_ids), _IN_CLAUSE_CHUNK):
+            chunk = message_ids[i:i + _IN_CLAUSE_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM outbox WHERE id IN ({placeholders})", chunk)
+
+
+@timed_query
+def fail_outbox_messages(failures: list[tuple[int, str, Optional[float]]]):
+    """送信に失敗したメッセージを記録する
+
+    failuresは (メッセージID, エラー内容, 次に送る時刻(UNIX時間)) のリスト。
+    次に送る時刻がNoneのものは再送せずdeadにする。
+    """
+    if not failures:
+        return
+
+    conn = get_connection()
+
+    with conn:
+        conn.executemany("""
+            UPDATE outbox
+            SET attempts = attempts + 1,
+                last_error = ?,
+                status = CASE WHEN ? IS NULL THEN 'dead' ELSE 'pending' END,
+                next_attempt_at = COALESCE(?, next_attempt_at),
+                claim_owner = NULL,
+                claim_expires_at = NULL
+            WHERE id = ?
+        """, ((error, next_attempt_at, next_attempt_at, message_id) for message_id, error, next_attempt_at in failures))
+
+
+def get_outbox_stats() -> dict:
+    """outboxの送信待ち件数・最も古い送信待ちの経過秒数・dead件数（1文で読み、同じ時点の値を返す）"""
+    conn = get_connection()
+    pending, oldest, dead = conn.execute("""
+        SELECT COUNT(*), MIN(due_at), (SELECT COUNT(*) FROM outbox WHERE status = 'dead')
+        FROM outbox WHERE status = 'pending'
+    """).fetchone()
+    return {
+        "pending": pending,
+        "oldest_age": max(0.0, time.time() - oldest) if oldest is not None else 0.0,
+        "dead": dead,
+    }
+
+
+@timed_query
+def claim_event(key: str, ttl: float) -> bool:
+    """イベント・操作のキーをttl秒のあいだ処理済みとして記録し、初めてならTrue（記録済みなら重複としてFalse）
+
+    期限切れのキーは同じトランザクションで消す（1回に消えるのは前回から期限が切れた分だけ）。
+    """
+    conn = get_connection()
+    now = time.time()
+
+    with conn:
+        conn.execute("DELETE FROM processed_events WHERE expires_at <= ?", (now,))
+        claimed = conn.execute(
+            "INSERT OR IGNORE INTO processed_events (key, expires_at) VALUES (?, ?)", (key, now + ttl)
+        ).rowcount
+
+    return claimed == 1
+
+
+@timed_query
+def release_event(key: str):
+    """claim_eventで記録したキーを消す（処理せずに断ったリクエストを、再送されたときに処理できるようにする）"""
+    conn = get_connection()
+
+    with conn:
+        conn.execute("DELETE FROM processed_events WHERE key = ?", (key,))
+
+
+def acquire_lease(name: str, owner: str, ttl: float) -> bool:
+    """リースを取得・延長（期限切れか自分が持っている場合のみ）、取れたかを返す"""
+    conn = get_connection()
+    now = time.time()
+
+    with conn:
+        row = conn.execute("""
+            INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+            RETURNING owner
+        """, (name, owner, now + ttl, now)).fetchone()
+
+    return row is not None
+
+
+def release_lease(name: str, owner: str):
+    """自分が持っているリースを手放す"""
+    conn = get_connection()
+
+    with conn:
+        conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+
+@timed_query
+def archive_reservations(before: datetime, limit: int) -> int:
+    """beforeより前に終わった予約を開始時刻の古い順にlimit件までreservations_archiveへ移す（移した件数を返す）
+
+    1回のトランザクションで移すのはlimit件までにして、予約の書き込みを長く待たせない。
+    移す予約の削除は変更履歴に1件ずつ残さず、アーカイブ済みの範囲を広げたときに op = 'archive' を1件だけ残す。
+    """
+    conn = get_connection()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        extended = conn.execute("""
+            INSERT INTO archive_state (id, archived_before) VALUES (1, ?)
+            ON CONFLICT(id) DO UPDATE SET archived_before = excluded.archived_before
+            WHERE excluded.archived_before > archive_state.archived_before
+            RETURNING archived_before
+        """, (to_epoch(before),)).fetchone()
+        if extended:
+            conn.execute("""
+                INSERT INTO reservation_changes (op, reservation_id, start_time) VALUES ('archive', 0, ?)
+            """, (to_epoch(before),))
+
+        rows = conn.execute(f"""
+            DELETE FROM reservations
+            WHERE id IN (
+                SELECT id FROM reservations
+                WHERE start_time < ? AND end_time < ?
+                ORDER BY start_time
+                LIMIT ?
+            )
+            RETURNING {_RESERVATION_COLUMNS}
+        """, (to_epoch(before), to_epoch(before), limit)).fetchall()
+        conn.executemany(f"""
+            INSERT INTO reservations_archive ({_RESERVATION_COLUMNS}) VALUES ({", ".join("?" for _ in _RESERVATION_COLUMNS.split(","))})
+        """, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return len(rows)
+
+
+def checkpoint_wal():
+    """WALの内容をDBファイルへ書き戻してWALを切り詰める（大量の予約をアーカイブへ移した後用）
+
+    読み取り中の接続があると自動のチェックポイントでは書き戻しきれず、WALが大きいままになって読み取りが遅くなる。
+    """
+    conn = get_connection()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+
+
+# ====================
+# 一括読み込み・書き出し
+# ====================
+
+# 一括読み込みの行: (user_id, user_name, channel_id, event_name, 開始, 終了, リマインダー分数, 行番号)（日時は秒）
+BulkRow = tuple[str, str, str, str, int, int, int, int]
+
+
+def iter_reservations_for_export(
+    first: Optional[date] = None, last: Optional[date] = None, archive: bool = False
+) -> Iterator[Reservation]:
+    """first〜lastの予約を開始時刻順に1件ずつ生成（archiveならアーカイブも含める。繰り返し予約は含めない）
+
+    idx_day・idx_archive_dayの順に読むカーソルをそのままたどり、テーブルをリストにしない。
+    """
+    conn = get_connection()
+    bounds = (
+        day_number(first) if first else -(1 << 31),
+        day_number(last) if last else 1 << 31,
+    )
+    streams = [_stream_reservations(conn, f"""
+        SELECT {COLUMNS} FROM reservations
+        WHERE day BETWEEN ? AND ?
+        ORDER BY day, start_time, id
+    """, bounds)]
+    if archive:
+        streams.append(_stream_reservations(conn, f"""
+            SELECT {COLUMNS} FROM reservations_archive
+            WHERE day BETWEEN ? AND ?
+            ORDER BY day, start_time, id
+        """, bounds))
+    return heapq.merge(*streams, key=order_key)
+
+
+def find_bulk_conflicts(
+    spans: Iterable[tuple[int, int, int]], first: int, last: int
+) -> Iterator[tuple[int, Union[int, Reservation]]]:
+    """読み込む予約の (開始, 終了, 行番号)（開始時刻順）と重なる (行番号, 相手) を生成
+
+    相手は重なる別の行の行番号か、既存の予約・アーカイブ・繰り返しの回。
+    既存の予約は読み込む範囲（最初の開始first〜最後の終了last）だけを開始時刻順に読み、読み込む行とまとめて1回なめる。
+    それまでで最も遅く終わる区間だけを覚えて比べるため、重なりがあれば少なくとも1組は見つかる。
+    """
+    conn = get_connection()
+    live = _stream_reservations(conn, f"""
+        SELECT {COLUMNS} FROM reservations
+        WHERE start_time < ? AND end_time > ?
+        ORDER BY start_time
+    """, (last, first))
+    archived = _stream_reservations(conn, f"""
+        SELECT {COLUMNS} FROM reservations_archive
+        WHERE day BETWEEN ? AND ? AND end_time > ?
+        ORDER BY day, start_time
+    """, (first // DAY_SECONDS - 1, last // DAY_SECONDS, first))
+    begin = from_epoch(first)
+    occurrences = sorted(
+        (r for r in _series_occurrences(conn, begin - timedelta(days=1), from_epoch(last)) if r.end_time > begin),
+        key=lambda r: r.start_time
+    )
+    existing = (
+        (to_epoch(r.start_time), to_epoch(r.end_time), r)
+        for r in heapq.merge(live, archived, occurrences, key=lambda r: r.start_time)
+    )
+
+    reach_end, reach = None, None
+    for start, end, owner in heapq.merge(spans, existing, key=itemgetter(0)):
+        if reach is not None and start < reach_end:
+            if isinstance(owner, int):
+                yield owner, reach
+            elif isinstance(reach, int):
+                yield reach, owner
+        if reach is None or end > reach_end:
+            reach_end, reach = end, owner
+
+
+def bulk_insert_reservations(rows: Iterable[BulkRow], chunk_size: int, after_seq: int) -> int:
+    """検証済みの予約をchunk_size件ずつのトランザクションでまとめて挿入し、挿入した件数を返す
+
+    after_seqは検証の前に読んだ変更履歴の番号。各トランザクションの初めにそれ以降の他の書き込みを読み、
+    検証の後に作られた予約・繰り返し予約と重なる行があればそのトランザクションを取り消して止める（それまでの分は残る）。
+    送信時刻を過ぎたリマインダーは送信済みとして入れる。
+    """
+    conn = get_connection()
+    now = to_epoch(datetime.now())
+    added: dict[int, tuple[int, int]] = {}
+    added_series: dict[int, Recurrence] = {}
+    inserted = 0
+    seq = after_seq
+
+    rows = iter(rows)
+    try:
+        while batch := list(islice(rows, chunk_size)):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _collect_bulk_changes(conn, seq, added, added_series)
+                if added or added_series:
+                    _check_bulk_batch(batch, added, added_series, inserted)
+                conn.executemany("""
+                    INSERT INTO reservations (
+                        user_id, user_name, channel_id, event_name, start_time, end_time,
+                        reminder_minutes, remind_at, reminder_sent
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    (user_id, user_name, channel_id, event_name, start, end,
+                     minutes, start - minutes * 60, start - minutes * 60 <= now)
+                    for user_id, user_name, channel_id, event_name, start, end, minutes, _ in batch
+                ))
+                # 自分の挿入の分まで進め、次のトランザクションでは他の書き込みだけを読む
+                seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM reservation_changes").fetchone()[0]
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            inserted += len(batch)
+    finally:
+        day_cache.clear()
+
+    return inserted
+
+
+def _collect_bulk_changes(
+    conn: sqlite3.Connection, seq: int, added: dict[int, tuple[int, int]], added_series: dict[int, Recurrence]
+):
+    """seqより後の他の書き込みで追加・削除された予約とシリーズをadded・added_seriesに反映"""
+    rows = conn.execute("""
+        SELECT seq, op, reservation_id, start_time, end_time
+        FROM reservation_changes
+        WHERE seq > ?
+        ORDER BY seq
+    """, (seq,)).fetchall()
+    if rows and rows[0]["seq"] != seq + 1:
+        raise ValueError("読み込み中の他の書き込みが多く、変更履歴を追えなくなりました")
+
+    for row in rows:
+        if row["op"] == "insert":
+            added[row["reservation_id"]] = (row["start_time"], row["end_time"])
+        elif row["op"] == "delete":
+            added.pop(row["reservation_id"], None)
+        elif row["op"] == "series":
+            entries = _load_series(conn, row["reservation_id"])
+            if entries:
+                added_series[row["reservation_id"]] = entries[0][1]
+            else:
+                added_series.pop(row["reservation_id"], None)
+
+
+def _check_bulk_batch(
+    batch: list[BulkRow], added: dict[int, tuple[int, int]], added_series: dict[int, Recurrence], inserted: int
+):
+    """検証の後に他から追加された予約・シリーズと重なる行があればValueError"""
+    for row in batch:
+        start, end, line = row[4], row[5], row[7]
+        for reservation_id, (other_start, other_end) in added.items():
+            if start < other_end and other_start < end:
+                raise ValueError(f"{line}行目が読み込み中に作られた予約 ID {reservation_id} と重なっています（{inserted}件は読み込み済み）")
+        for series_id, rule in added_series.items():
+            if rule.first_overlap(from_epoch(start), from_epoch(end)):
+                raise ValueError(f"{line}行目が読み込み中に作られた繰り返し予約 S{series_id} と重なっています（{inserted}件は読み込み済み）")
 
 
 if __name__ == "__main__":
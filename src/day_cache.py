@@ -0,0 +1,57 @@
+"""
+日付ごとの読み取りキャッシュ
+日付(YYYY-MM-DD)ごとに予約一覧や表示用メッセージを保持し、予約の作成・削除時にその日だけを破棄する
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+
+class DayCache:
+    """日付 -> {キー: 値} のLRUキャッシュ"""
+
+    def __init__(self, maxsize: int, refresh: Optional[Callable[[], None]] = None):
+        self.maxsize = maxsize
+        # 読み取りの前に呼ぶ関数（他のプロセスによる変更を反映して破棄させる）
+        self._refresh = refresh
+        self._days: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        # 破棄のたびに進める版数（読み込み中に破棄された古い結果を保存しないため）
+        self._version = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, day: str, key: str, loader: Callable[[], Any]) -> Any:
+        """キャッシュから取得（なければloaderで作成して保存）"""
+        if self._refresh is not None:
+            self._refresh()
+
+        with self._lock:
+            values = self._days.get(day)
+            if values is not None and key in values:
+                self._days.move_to_end(day)
+                self.hits += 1
+                return values[key]
+            self.misses += 1
+            version = self._version
+
+        value = loader()
+
+        with self._lock:
+            if self._version == version:
+                self._days.setdefault(day, {})[key] = value
+                self._days.move_to_end(day)
+                while len(self._days) > self.maxsize:
+                    self._days.popitem(last=False)
+        return value
+
+    def invalidate(self, day: str):
+        """指定日のキャッシュを破棄"""
+        with self._lock:
+            self._days.pop(day, None)
+            self._version += 1
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+            self._version += 1
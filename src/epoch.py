@@ -0,0 +1,37 @@
+"""
+日時とDBに保存する整数の秒の変換
+DBの日時は、ローカル時刻をそのままUTCとみなした1970-01-01 00:00からの秒で持つ（SQLiteの strftime('%s', ...) と同じ値）。
+タイムゾーンを扱わないため夏時間の切り替えでもずれず、日付の番号（DBのday列）は 秒 // 86400 で求まる
+"""
+from datetime import date, datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+DAY_SECONDS = 86400
+
+_EPOCH_ORDINAL = EPOCH.toordinal()
+_SECOND = timedelta(seconds=1)
+
+
+def to_epoch(dt: datetime) -> int:
+    """日時を秒にする（秒未満は切り捨て）"""
+    return (dt - EPOCH) // _SECOND
+
+
+def from_epoch(ts: int) -> datetime:
+    """秒を日時に戻す"""
+    return EPOCH + timedelta(seconds=ts)
+
+
+def day_number(day: date) -> int:
+    """日付の番号（1970-01-01が0）"""
+    return day.toordinal() - _EPOCH_ORDINAL
+
+
+def day_start(day: date) -> int:
+    """その日の0時の秒"""
+    return day_number(day) * DAY_SECONDS
+
+
+def date_of(ts: int) -> date:
+    """秒が属する日付"""
+    return date.fromordinal(ts // DAY_SECONDS + _EPOCH_ORDINAL)
@@ -0,0 +1,112 @@
+"""
+Slackのイベント・操作の重複排除
+ackが遅れたりSocket Modeの接続が切れたりすると、Slackは同じイベント・操作を再送する。
+キー（event_id・trigger_id）をTTL付きLRUで覚え、2回目以降はリスナーを動かさずにackする。
+sharedを渡すとDB（processed_events）でも判定し、複数のプロセス・再起動をまたいで重複を落とす
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from metrics import DUPLICATE_EVENTS
+
+
+def event_key(body: dict) -> Optional[str]:
+    """重複判定のキー（Events APIはevent_id、ボタン・モーダルの送信はtrigger_id、trigger_idのない操作はview ID）
+
+    選択肢の読み込み（block_suggestion）は入力のたびに同じモーダルから届き、副作用もないため対象外（None）。
+    """
+    if body.get("event_id"):
+        return f"event:{body['event_id']}"
+    if body.get("type") == "block_suggestion":
+        return None
+    if body.get("trigger_id"):
+        return f"trigger:{body['trigger_id']}"
+    view = body.get("view")
+    if view and view.get("id"):
+        return f"view:{view['id']}"
+    return None
+
+
+class EventDeduplicator:
+    """キー -> 期限 のTTL/LRU（登録順に期限が並ぶため、期限切れは先頭から捨てる）"""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.claimed = 0
+        self.dropped = 0
+
+    def _claim_local(self, key: str) -> bool:
+        """プロセス内で初めてのキーなら覚えてTrue"""
+        now = time.monotonic()
+        with self._lock:
+            while self._entries and next(iter(self._entries.values())) <= now:
+                self._entries.popitem(last=False)
+            if key in self._entries:
+                self.dropped += 1
+                DUPLICATE_EVENTS.labels("memory").inc()
+                return False
+            self._entries[key] = now + self.ttl
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return True
+
+    def _record_shared(self, claimed: bool) -> bool:
+        with self._lock:
+            if claimed:
+                self.claimed += 1
+            else:
+                self.dropped += 1
+        if not claimed:
+            DUPLICATE_EVENTS.labels("shared").inc()
+        return claimed
+
+    def claim(self, key: str, shared: Optional[Callable[[str, float], bool]] = None) -> bool:
+        """初めてのキーならTrue（処理する）、有効期限内に受け取ったキーならFalse（重複）
+
+        sharedはプロセス内で初めてのキーの場合だけ呼ぶ。DBに書けなければ処理する側に倒す。
+        """
+        if not self._claim_local(key):
+            return False
+        if shared is None:
+            return self._record_shared(True)
+        try:
+            return self._record_shared(shared(key, self.ttl))
+        except Exception as e:
+            print(f"Event dedup error: {e}")
+            return True
+
+    async def claim_async(self, key: str, shared: Optional[Callable[[str, float], Awaitable[bool]]] = None) -> bool:
+        """claimのasyncio版（sharedはDB用スレッドで実行するコルーチン関数）"""
+        if not self._claim_local(key):
+            return False
+        if shared is None:
+            return self._record_shared(True)
+        try:
+            return self._record_shared(await shared(key, self.ttl))
+        except Exception as e:
+            print(f"Event dedup error: {e}")
+            return True
+
+    def release(self, key: str, shared: Optional[Callable[[str], None]] = None):
+        """claimで覚えたキーを忘れる（処理せずに断ったリクエストの再送を、重複として落とさないように）"""
+        with self._lock:
+            self._entries.pop(key, None)
+        if shared is None:
+            return
+        try:
+            shared(key)
+        except Exception as e:
+            print(f"Event dedup error: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "claimed": self.claimed,
+                "dropped": self.dropped,
+            }
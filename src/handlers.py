@@ -0,0 +1,351 @@
+"""
+ハンドラーの共通処理
+スレッド版(bot.py)とasyncio版(async_bot.py)で共通に使う、入力の解釈・検証、DBの読み書き、返すメッセージの組み立て。
+Slack APIの呼び出し・ack・outboxワーカーへの通知・スケジューラの操作は各ランタイムで行う。
+asyncio版はここの関数をDB用スレッドで実行する
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from database import (
+    reserve_if_free,
+    reserve_series_if_free,
+    check_conflict,
+    check_series_conflict,
+    get_busy_slots,
+    get_reservation,
+    get_series,
+    get_reservations_by_date,
+    iter_reservations_between,
+    has_upcoming_reservations,
+    get_reservations_page_by_user,
+    delete_reservation,
+    cancel_occurrence,
+    queue_due_reminders,
+    enqueue_messages,
+    day_cache,
+)
+from epoch import from_epoch
+from outbox import outbox_message
+from slot_bitmap import free_slots, find_free_gap
+from views import (
+    RESERVE_PROMPT_TEXT,
+    RESERVE_PROMPT_BLOCKS,
+    CANCEL_PROMPT_TEXT,
+    CANCEL_PROMPT_BLOCKS,
+    NO_CANCELLABLE_TEXT,
+    parse_time_options_request,
+    build_start_time_options,
+    build_end_time_options,
+    filter_time_options,
+    parse_reservation_form,
+    validate_reservation_times,
+    validate_recurrence,
+    conflict_error_text,
+    series_conflict_error_text,
+    reservation_created_message,
+    series_created_message,
+    parse_cancel_options_request,
+    build_cancel_options,
+    parse_cancel_form,
+    CANCEL_OPTIONS_PAGE,
+    CANCEL_SELECT_TEXT,
+    CANCEL_NOT_ALLOWED_TEXT,
+    CANCEL_FAILED_TEXT,
+    reservation_cancelled_message,
+    reservation_id_text,
+    format_reminder_message,
+    parse_check_command,
+    render_day_schedule,
+    render_range_schedule,
+    check_error_message,
+    parse_free_command,
+    render_free_slots,
+    render_free_gap,
+    free_error_message,
+    HELP_TEXT,
+)
+
+# スケジューラに反映するリマインドの変更 (予約ID または -シリーズID, 送信時刻)。送信時刻がNoneなら取り消す
+ReminderUpdate = tuple[int, Optional[datetime]]
+
+
+def apply_reminder_update(scheduler, update: Optional[ReminderUpdate]):
+    """リマインドの変更をスケジューラに反映する（asyncio版はイベントループ内から呼ぶ）"""
+    if update is None:
+        return
+    key, remind_at = update
+    if remind_at:
+        scheduler.schedule(key, remind_at)
+    else:
+        scheduler.cancel(key)
+
+
+# ====================
+# メンション処理
+# ====================
+
+def mention_replies(text: str, user_id: str) -> list[dict]:
+    """メンション（メンション部分を除いた本文）への返信を、sayに渡す引数の一覧で返す"""
+    if text.startswith("予約"):
+        # ボタン付きメッセージを送信
+        return [{"text": RESERVE_PROMPT_TEXT, "blocks": RESERVE_PROMPT_BLOCKS}]
+    if text.startswith("キャンセル"):
+        # キャンセル用のボタンを送信
+        if not has_upcoming_reservations(user_id):
+            return [{"text": NO_CANCELLABLE_TEXT}]
+        return [{"text": CANCEL_PROMPT_TEXT, "blocks": CANCEL_PROMPT_BLOCKS}]
+    if text.startswith("確認"):
+        return check_replies(text)
+    if text.startswith("空き"):
+        return [{"text": free_reply(text)}]
+    return [{"text": HELP_TEXT}]
+
+
+def check_replies(text: str) -> list[dict]:
+    """予約確認の返信（期間の指定は1回の範囲クエリで読み、日ごとにまとめる）"""
+    try:
+        first_day, last_day = parse_check_command(text, datetime.now())
+        if first_day != last_day:
+            # 送信中にDBの読み取りを開いたままにしないよう、メッセージを組み立て終えてから返す
+            return list(render_range_schedule(first_day, last_day, iter_reservations_between(first_day, last_day)))
+
+        date_formatted = first_day.isoformat()
+
+        # 表示用メッセージも日付ごとにキャッシュし、予約の作成・削除時に破棄される
+        message = day_cache.get(
+            date_formatted, "check_message",
+            lambda: render_day_schedule(first_day, get_reservations_by_date(date_formatted))
+        )
+        return [{"text": message}]
+
+    except Exception as e:
+        return [{"text": check_error_message(e)}]
+
+
+def free_reply(text: str) -> str:
+    """空き枠の返信（日ごとの空き枠のビットマップから求める）"""
+    try:
+        now = datetime.now()
+        first_day, last_day, minutes = parse_free_command(text, now)
+        free = free_slots(first_day, get_busy_slots(first_day, last_day), now)
+        if minutes:
+            return render_free_gap(first_day, last_day, minutes, find_free_gap(first_day, free, minutes))
+        return render_free_slots(first_day, free)
+
+    except Exception as e:
+        return free_error_message(e)
+
+
+# ====================
+# 予約モーダル
+# ====================
+
+def start_time_options(day: date) -> list[dict]:
+    """開始時刻の選択肢（日付キャッシュ経由、その日の予約の作成・削除時に破棄される）"""
+    return day_cache.get(
+        day.isoformat(), "start_time_options",
+        lambda: build_start_time_options(day, get_busy_slots(day, day)[0])
+    )
+
+
+def end_time_options(day: date, start: Optional[str]) -> list[dict]:
+    """終了時刻の選択肢（開始時刻ごとに変わるため、空き枠のビットマップから毎回作る）"""
+    return build_end_time_options(day, get_busy_slots(day, day)[0], start)
+
+
+def time_options(body: dict, end: bool) -> list[dict]:
+    """開始・終了時刻の選択肢の要求に返す選択肢（選択中の日付の空いている枠のみ）"""
+    now = datetime.now()
+    day, start, query = parse_time_options_request(body, now)
+    options = end_time_options(day, start) if end else start_time_options(day)
+    return filter_time_options(options, day, now, query, end=end)
+
+
+def check_reservation_submission(view: dict) -> tuple[dict, dict]:
+    """予約モーダルの入力を取り出して検証し、(フォームの値, 入力欄ごとのエラー) を返す
+
+    重複は区間インデックスで判定する（確定は後段のsave_reservation・save_seriesで行う）。
+    """
+    form = parse_reservation_form(view)
+
+    errors = validate_reservation_times(form["start_time"], form["end_time"])
+    errors.update(validate_recurrence(form))
+    if not errors:
+        if form["frequency"]:
+            conflict = check_series_conflict(
+                form["start_time"], form["end_time"], form["frequency"], form["until"], form["count"]
+            )
+            if conflict:
+                errors["start_time_block"] = series_conflict_error_text(conflict)
+        else:
+            conflict = check_conflict(form["start_time"], form["end_time"])
+            if conflict:
+                errors["start_time_block"] = conflict_error_text(conflict)
+    return form, errors
+
+
+def save_reservation(user_id: str, user_name: str, form: dict) -> Optional[ReminderUpdate]:
+    """予約を作成して通知をoutboxに積み、登録するリマインドを返す
+
+    ack後に他の予約が先に確定していた場合は、予約者への通知を積んでNoneを返す。
+    """
+    # 重複チェックと予約作成、対象チャンネルへの通知の登録を1トランザクションで行う（同時送信による二重予約を防ぐ）
+    reservation_id, conflict = reserve_if_free(
+        user_id=user_id,
+        user_name=user_name,
+        channel_id=form["channel_id"],
+        event_name=form["event_name"],
+        start_time=form["start_time"],
+        end_time=form["end_time"],
+        reminder_minutes=form["reminder_minutes"],
+        notify=lambda reservation_id: [outbox_message(
+            "reservation", form["channel_id"],
+            reservation_created_message(
+                reservation_id, user_name, form["start_time"], form["end_time"],
+                form["event_name"], form["reminder_minutes"]
+            )
+        )]
+    )
+    if conflict:
+        enqueue_messages([outbox_message(
+            "notice", user_id, f"予約できませんでした: {conflict_error_text(conflict)}"
+        )])
+        print(f"Reservation rejected for {user_id}: conflicts with {reservation_id_text(conflict)}")
+        return None
+
+    print(f"Reservation {reservation_id} created by {user_id}")
+    return reservation_id, form["start_time"] - timedelta(minutes=form["reminder_minutes"])
+
+
+def save_series(user_id: str, user_name: str, form: dict) -> Optional[ReminderUpdate]:
+    """繰り返し予約を作成して通知をoutboxに積み、登録するリマインド（-シリーズID をキーに次の回の分）を返す"""
+    series, conflict = reserve_series_if_free(
+        user_id=user_id,
+        user_name=user_name,
+        channel_id=form["channel_id"],
+        event_name=form["event_name"],
+        start_time=form["start_time"],
+        end_time=form["end_time"],
+        frequency=form["frequency"],
+        until=form["until"],
+        count=form["count"],
+        reminder_minutes=form["reminder_minutes"],
+        notify=lambda series: [outbox_message(
+            "reservation", form["channel_id"], series_created_message(series, form["until"], form["count"])
+        )]
+    )
+    if conflict:
+        enqueue_messages([outbox_message(
+            "notice", user_id, f"予約できませんでした: {series_conflict_error_text(conflict)}"
+        )])
+        print(f"Series rejected for {user_id}: conflicts with {reservation_id_text(conflict)}")
+        return None
+
+    print(f"Series {series['id']} created by {user_id}")
+    if not series["next_remind_at"]:
+        return None
+    return -series["id"], from_epoch(series["next_remind_at"])
+
+
+# ====================
+# キャンセルモーダル
+# ====================
+
+def notify_no_cancellable(user_id: str) -> bool:
+    """キャンセルできる予約がなければ本人への通知をoutboxに積み、Trueを返す（モーダルは開かない）"""
+    if has_upcoming_reservations(user_id):
+        return False
+    enqueue_messages([outbox_message("notice", user_id, NO_CANCELLABLE_TEXT)])
+    return True
+
+
+def cancel_options(body: dict) -> list[dict]:
+    """キャンセルする予約の選択肢（入力した日付・ミーティング名で絞り込み、1ページ分だけ読む）"""
+    day, name, after = parse_cancel_options_request(body)
+    reservations = get_reservations_page_by_user(body["user"]["id"], CANCEL_OPTIONS_PAGE + 1, after, day, name)
+    return build_cancel_options(reservations)
+
+
+def check_cancel_submission(view: dict, user_id: str) -> tuple[Optional[dict], Optional[str]]:
+    """キャンセルモーダルの入力を取り出し、本人の予約か確かめて (フォームの値, 予約欄のエラー) を返す"""
+    form = parse_cancel_form(view)
+    if form is None:
+        return None, CANCEL_SELECT_TEXT
+
+    if form["series_id"] is not None:
+        series = get_series(form["series_id"])
+        owner = series["user_id"] if series else None
+    else:
+        reservation = get_reservation(form["reservation_id"])
+        owner = reservation.user_id if reservation else None
+    if owner != user_id:
+        return form, CANCEL_NOT_ALLOWED_TEXT
+    return form, None
+
+
+def cancel_submitted(user_id: str, form: dict) -> Optional[ReminderUpdate]:
+    """送信されたキャンセルを行って通知をoutboxに積み、スケジューラに反映するリマインドの変更を返す"""
+    if form["series_id"] is not None:
+        return cancel_series_occurrence(
+            user_id, form["series_id"], form["occurrence_start"], form["following"]
+        )
+    return cancel_reservation(user_id, form["reservation_id"])
+
+
+def cancel_reservation(user_id: str, reservation_id: int) -> Optional[ReminderUpdate]:
+    """予約を削除して通知をoutboxに積む（削除できなければ本人への通知を積む）"""
+    # 削除と対象チャンネルへの通知の登録を1トランザクションで行う
+    deleted = delete_reservation(
+        reservation_id, user_id,
+        notify=lambda deleted: [outbox_message(
+            "cancellation", deleted.channel_id, reservation_cancelled_message(deleted, user_id)
+        )]
+    )
+
+    if not deleted:
+        enqueue_messages([outbox_message("notice", user_id, CANCEL_FAILED_TEXT)])
+        return None
+    print(f"Reservation {reservation_id} cancelled by {user_id}")
+    return reservation_id, None
+
+
+def cancel_series_occurrence(
+    user_id: str, series_id: int, occurrence_start: datetime, following: bool
+) -> Optional[ReminderUpdate]:
+    """繰り返し予約の回（followingならその回以降すべて）をキャンセルして通知をoutboxに積む"""
+    cancelled = cancel_occurrence(
+        series_id, user_id, occurrence_start, following,
+        notify=lambda cancelled: [outbox_message(
+            "cancellation", cancelled.channel_id, reservation_cancelled_message(cancelled, user_id, following)
+        )]
+    )
+
+    if not cancelled:
+        enqueue_messages([outbox_message("notice", user_id, CANCEL_FAILED_TEXT)])
+        return None
+    print(f"Series {series_id} occurrence {occurrence_start.isoformat()} cancelled by {user_id}")
+    # 次のリマインドは残っている回のうち最初のものに置き換える
+    return -series_id, cancelled.next_remind_at
+
+
+# ====================
+# リマインダー機能
+# ====================
+
+# 1トランザクションでoutboxに積むリマインダーの件数
+REMINDER_QUEUE_BATCH = 500
+
+
+def queue_reminders() -> int:
+    """送信時刻を過ぎた未送信のリマインダーをoutboxに積み、積んだ件数を返す（送信はoutboxのワーカーが行う）"""
+    queued = 0
+    while True:
+        count = queue_due_reminders(format_reminder_message, REMINDER_QUEUE_BATCH)
+        if not count:
+            break
+        queued += count
+
+    if queued:
+        print(f"Reminders queued: {queued}")
+    return queued
@@ -0,0 +1,72 @@
+"""
+会議室予約Bot - HTTP(Events API)版
+asyncio版(async_bot.py)のAsyncAppをFastAPIにマウントし、uvicornの複数ワーカーで動かす。
+リクエストは署名(SLACK_SIGNING_SECRET)を検証してから処理する。
+リマインダーはDBのリースを取った1プロセスが全予約を見張る。通知はoutboxに積み、各ワーカーが確保して送る
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request
+from slack_bolt.adapter.fastapi.async_handler import AsyncSlackRequestHandler
+
+import archiver
+import async_bot
+import async_database as db
+from config import HOST, PORT, HTTP_WORKERS, SLACK_SIGNING_SECRET
+from database import init_db
+from metrics import instrument_slack_api
+from metrics_server import router as metrics_router
+from reminder_scheduler import WORKER_ID
+
+handler = AsyncSlackRequestHandler(async_bot.app)
+
+
+# ====================
+# FastAPIアプリ
+# ====================
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    instrument_slack_api()
+    await db.init_db()
+    outbox_task = asyncio.create_task(async_bot.outbox_worker.run())
+    leader_task = asyncio.create_task(async_bot.reminder_leader_loop())
+    archive_task = asyncio.create_task(archiver.run_async())
+    print(f"Worker {WORKER_ID} ready.")
+    yield
+    outbox_task.cancel()
+    archive_task.cancel()
+    leader_task.cancel()
+    try:
+        await leader_task
+    except asyncio.CancelledError:
+        pass
+
+
+api = FastAPI(title="meeting-room-bot", lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+api.include_router(metrics_router)
+
+
+@api.post("/slack/events")
+async def slack_events(req: Request):
+    """Events API・インタラクション（ボタン、モーダル送信）の受け口"""
+    return await handler.handle(req)
+
+
+def main():
+    """HTTPモードのエントリーポイント（uvicornでHTTP_WORKERS個のワーカーを起動）"""
+    if not SLACK_SIGNING_SECRET:
+        raise SystemExit("SLACK_SIGNING_SECRET is required in HTTP mode")
+
+    # スキーマの作成・移行はワーカーを起動する前に1回だけ行う
+    init_db()
+    print("Database initialized.")
+
+    print(f"Bot is running... (HTTP, {HTTP_WORKERS} workers on {HOST}:{PORT})")
+    uvicorn.run("http_app:api", host=HOST, port=PORT, workers=HTTP_WORKERS, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+予約時間帯のインメモリ区間インデックス
+重複チェックをSQLiteの全件スキャンではなく二分探索で行う
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Iterable, Optional
+
+from epoch import to_epoch
+
+
+class IntervalIndex:
+    """開始時刻でソートした区間の一覧
+
+    どの予約も最長の予約時間(max_duration)より長くはないため、
+    [start, end] と重なり得るのは開始時刻が [start - max_duration, end] の範囲にある予約だけ。
+    その範囲を二分探索で切り出すので、問い合わせは O(log n + k)（kは範囲内の件数）で済む。
+    終了が開始より前の不正な行もSQLと同じ結果になるよう、キーは min(開始, 終了) とする。
+    日時はDBと同じ整数の秒（epoch.py）で持ち、読み込み時にdatetimeを作らない。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._starts: list[tuple[int, int]] = []
+        self._intervals: dict[int, tuple[int, int]] = {}
+        self._max_duration = 0
+        self.loaded = False
+
+    def load(self, rows: Iterable[tuple[int, int, int]]):
+        """(id, start_time, end_time) の一覧（日時はDBの整数の秒）からインデックスを構築"""
+        intervals = {rid: (start, end) for rid, start, end in rows}
+        starts = sorted((min(start, end), rid) for rid, (start, end) in intervals.items())
+        max_duration = max((abs(end - start) for start, end in intervals.values()), default=0)
+
+        with self._lock:
+            self._intervals = intervals
+            self._starts = starts
+            self._max_duration = max_duration
+            self.loaded = True
+
+    def clear(self):
+        """インデックスを破棄（以降はSQLiteにフォールバック）"""
+        with self._lock:
+            self._intervals = {}
+            self._starts = []
+            self._max_duration = 0
+            self.loaded = False
+
+    def add(self, reservation_id: int, start_time: datetime, end_time: datetime):
+        """予約を追加（登録済みなら置き換え）"""
+        with self._lock:
+            if not self.loaded:
+                return
+            self._discard(reservation_id)
+            start, end = to_epoch(start_time), to_epoch(end_time)
+            insort(self._starts, (min(start, end), reservation_id))
+            self._intervals[reservation_id] = (start, end)
+            self._max_duration = max(self._max_duration, abs(end - start))
+
+    def remove(self, reservation_id: int):
+        """予約を削除"""
+        with self._lock:
+            if not self.loaded:
+                return
+            self._discard(reservation_id)
+
+    def prune(self, before: datetime) -> list[int]:
+        """beforeより前に終わった予約をまとめて取り除き、そのIDを返す（アーカイブへ移した予約用）"""
+        with self._lock:
+            if not self.loaded:
+                return []
+            before = to_epoch(before)
+            hi = bisect_left(self._starts, (before,))
+            kept = []
+            pruned = []
+            for key, rid in self._starts[:hi]:
+                if max(self._intervals[rid]) < before:
+                    pruned.append(rid)
+                    del self._intervals[rid]
+                else:
+                    kept.append((key, rid))
+            self._starts[:hi] = kept
+            return pruned
+
+    def _discard(self, reservation_id: int):
+        """ロック取得済みの状態で予約を取り除く"""
+        interval = self._intervals.pop(reservation_id, None)
+        if interval is None:
+            return
+        key = (min(interval), reservation_id)
+        i = bisect_left(self._starts, key)
+        if i < len(self._starts) and self._starts[i] == key:
+            del self._starts[i]
+
+    def find_conflict(
+        self, start_time: datetime, end_time: datetime, exclude_id: Optional[int] = None
+    ) -> Optional[int]:
+        """重なる予約のIDを返す（複数ある場合は最小のID）
+
+        判定条件は database.check_conflict のSQLと同じ:
+        重なっている、または [start_time, end_time] に完全に含まれている
+        """
+        start, end = to_epoch(start_time), to_epoch(end_time)
+        with self._lock:
+            lo = bisect_left(self._starts, (start - self._max_duration,))
+            hi = bisect_right(self._starts, (end, float("inf")))
+            return self._scan(lo, hi, start, end, exclude_id)
+
+    def find_first_conflict(
+        self, intervals: Iterable[tuple[datetime, datetime]]
+    ) -> Optional[tuple[int, datetime, datetime]]:
+        """開始時刻順に並んだ区間の列のうち、予約と重なる最初の区間を (予約ID, 区間の開始, 区間の終了) で返す
+
+        繰り返し予約の各回の重複チェック用。区間の開始は増えていく一方なので二分探索の下限を前の区間の位置から進め、
+        インデックスを1回なめるだけで済ませる。列が無期限でも、最後の予約より後まで来たら打ち切る。
+        """
+        with self._lock:
+            if not self._starts:
+                return None
+            last_key = self._starts[-1][0]
+            lo = 0
+            for start_time, end_time in intervals:
+                start, end = to_epoch(start_time), to_epoch(end_time)
+                if start - self._max_duration > last_key:
+                    return None
+                lo = bisect_left(self._starts, (start - self._max_duration,), lo)
+                hi = bisect_right(self._starts, (end, float("inf")), lo)
+                found = self._scan(lo, hi, start, end)
+                if found is not None:
+                    return found, start_time, end_time
+            return None
+
+    def _scan(
+        self, lo: int, hi: int, start: int, end: int, exclude_id: Optional[int] = None
+    ) -> Optional[int]:
+        """ロック取得済みの状態で、_starts[lo:hi] のうち [start, end]（整数の秒）と重なる予約の最小のIDを返す"""
+        found = None
+        for _, rid in self._starts[lo:hi]:
+            if rid == exclude_id:
+                continue
+            s, e = self._intervals[rid]
+            if (s < end and e > start) or (s >= start and e <= end):
+                if found is None or rid < found:
+                    found = rid
+        return found
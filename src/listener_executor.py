@@ -0,0 +1,138 @@
+"""
+リスナー・ack後の処理を実行するスレッドプール（優先度付き・キューの上限付き）
+混雑時はモーダルの送信を確認などの読み取りより先に実行し、優先度の低いリクエストから受け付けを断る。
+ackの期限を過ぎて順番が回ってきたリクエストは実行しない
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Callable, Optional
+
+from metrics import EXECUTOR_QUEUE_DEPTH, EXECUTOR_SHED, EXECUTOR_WAIT
+
+# 優先度（小さいほど先に実行し、キューが埋まっても最後まで受け付ける）
+SUBMISSION = 0   # モーダルの送信（予約・キャンセル）
+INTERACTIVE = 1  # ボタン・選択肢の読み込み（trigger_idの期限が短い）
+READ = 2         # メンション（確認・空き・ヘルプなど）
+
+PRIORITY_NAMES = {SUBMISSION: "submission", INTERACTIVE: "interactive", READ: "read"}
+
+# キューの上限に対して、各優先度を受け付ける長さの割合（低い優先度ほど早く断る）
+_ADMIT_RATIO = {SUBMISSION: 1.0, INTERACTIVE: 0.75, READ: 0.5}
+
+# Slackのackの期限（3秒）から、応答を返すまでの余裕を引いた秒数
+ACK_DEADLINE_SECONDS = 2.5
+
+_current = threading.local()
+
+
+def request_priority(body: dict) -> int:
+    """Slackのリクエストの優先度"""
+    kind = body.get("type")
+    if kind == "view_submission":
+        return SUBMISSION
+    if kind == "event_callback":
+        return READ
+    return INTERACTIVE
+
+
+def use_priority(priority: int, deadline: Optional[float] = None):
+    """このスレッドがこの後submitするタスクの優先度と実行の期限（time.perf_counterの値）を設定
+
+    Boltはミドルウェアと同じスレッドでリスナーをlistener_executorにsubmitするため、ミドルウェアで設定する。
+    """
+    _current.priority = priority
+    _current.deadline = deadline
+
+
+class PriorityExecutor(Executor):
+    """優先度順（同じ優先度なら投入順）にタスクを実行するスレッドプール"""
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.max_queue = max_queue
+        # (優先度, 投入順, 投入時刻, 期限, Future, 関数, 引数)
+        self._queue: list[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._waits = {p: EXECUTOR_WAIT.labels(name, n) for p, n in PRIORITY_NAMES.items()}
+        EXECUTOR_QUEUE_DEPTH.labels(name).set_function(lambda: len(self._queue))
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def depth(self) -> int:
+        """実行を待っているタスクの数"""
+        return len(self._queue)
+
+    def accepts(self, priority: int) -> bool:
+        """priorityのタスクを受け付けられるか（待ちの数が優先度ごとの上限未満）
+
+        上限はsubmitの前にこれで判定する。判定とsubmitの間に他のスレッドが積んだ分だけ超えることがある。
+        """
+        return len(self._queue) < self.max_queue * _ADMIT_RATIO[priority]
+
+    def shed(self, priority: int, reason: str = "busy"):
+        """受け付けを断った・実行しなかったタスクを記録"""
+        EXECUTOR_SHED.labels(self.name, PRIORITY_NAMES[priority], reason).inc()
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        """use_priorityで設定した優先度・期限で実行する（設定がなければREAD・期限なし）"""
+        priority = getattr(_current, "priority", READ)
+        deadline = getattr(_current, "deadline", None)
+        return self._enqueue(priority, deadline, fn, args, kwargs)
+
+    def submit_priority(self, priority: int, fn: Callable, *args) -> Future:
+        """優先度を指定して実行する（期限なし）"""
+        return self._enqueue(priority, None, fn, args, {})
+
+    def _enqueue(self, priority: int, deadline: Optional[float], fn: Callable, args: tuple, kwargs: dict) -> Future:
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            heapq.heappush(self._queue, (priority, next(self._seq), time.perf_counter(), deadline, future, fn, args, kwargs))
+            self._cond.notify()
+        return future
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._shutdown:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                priority, _, enqueued_at, deadline, future, fn, args, kwargs = heapq.heappop(self._queue)
+
+            now = time.perf_counter()
+            self._waits[priority].observe(now - enqueued_at)
+            # ackの期限を過ぎたリクエストはSlack側で既にエラーになっているため実行しない
+            if deadline is not None and now > deadline:
+                self.shed(priority, "expired")
+                future.cancel()
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._cond:
+            self._shutdown = True
+            if cancel_futures:
+                for item in self._queue:
+                    item[4].cancel()
+                self._queue.clear()
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
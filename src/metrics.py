@@ -0,0 +1,389 @@
+"""
+メトリクス（Prometheusのテキスト形式で出力）
+prometheus_clientと同じ使い方（labels(...).observe()、.time()）の最小限の実装。
+ホットパスでの記録はロック1回と数回の加算だけで済むようにしている
+"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Optional
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.client import WebClient
+from slack_sdk.web.async_client import AsyncWebClient
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ヒストグラムの既定のバケット（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list["_Metric"] = []
+
+# 出力の前に1回ずつ呼ぶ関数（1回の問い合わせで複数のゲージの値をまとめて設定する）
+_collectors: list[Callable[[], None]] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """ラベルの値ごとに子を持つメトリクスの基底クラス"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        # ラベルなしのメトリクスは初期値から出力する
+        if not self.labelnames:
+            self.labels()
+        _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """ラベルの値に対応する子を取得（呼び出し側で保持すれば辞書の参照も省ける）"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            lines.extend(child._samples(self.name, self.labelnames, values))
+        return lines
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def value(self) -> float:
+        return self._value
+
+    def _samples(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self._value)}"]
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    type_name = "counter"
+    _new_child = _CounterChild
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """出力のたびにfunctionを呼んで値を取る（Noneで解除）"""
+        self._function = function
+
+    def has_function(self) -> bool:
+        return self._function is not None
+
+    def value(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return float("nan")
+        return self._value
+
+    def _samples(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value())}"]
+
+
+class Gauge(_Metric):
+    """増減する値（関数を登録して出力時に値を取ることもできる）"""
+
+    type_name = "gauge"
+    _new_child = _GaugeChild
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        self.labels().set_function(function)
+
+    def has_function(self) -> bool:
+        return self.labels().has_function()
+
+    def value(self) -> float:
+        return self.labels().value()
+
+
+class _HistogramChild:
+    def __init__(self, upper_bounds: tuple):
+        self._upper_bounds = upper_bounds
+        # バケットごとの件数（累積ではない、最後は+Inf）
+        self._counts = [0] * (len(upper_bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def time(self):
+        """関数（同期・async両対応）の実行時間を記録するデコレーター"""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.observe(time.perf_counter() - started)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def _samples(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._upper_bounds + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+        labels = _format_labels(labelnames, values)
+        lines.append(f"{name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    """値の分布（バケットごとの件数・合計・件数）"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self._upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self._upper_bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+def add_collector(function: Callable[[], None]):
+    """出力のたびに、メトリクスを書き出す前に1回だけ呼ぶ関数を登録する"""
+    _collectors.append(function)
+
+
+def render() -> str:
+    """登録済みの全メトリクスをPrometheusのテキスト形式で出力"""
+    for collect in _collectors:
+        collect()
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# ====================
+# Botのメトリクス
+# ====================
+
+HANDLER_DURATION = Histogram(
+    "bot_handler_duration_seconds", "Boltリスナー・ack後の処理の実行時間", ("handler",)
+)
+ACK_LATENCY = Histogram(
+    "bot_ack_latency_seconds", "リクエスト受信からackまでの時間", ("handler",)
+)
+DB_QUERY_DURATION = Histogram(
+    "bot_db_query_duration_seconds", "database.pyの関数ごとの実行時間", ("function",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+SLACK_API_CALLS = Counter(
+    "bot_slack_api_calls_total", "Slack Web APIの呼び出し回数", ("method", "status")
+)
+SLACK_API_DURATION = Histogram(
+    "bot_slack_api_duration_seconds", "Slack Web APIの応答時間", ("method",)
+)
+SOCKET_MODE_CONNECTED = Gauge(
+    "bot_socket_mode_connected", "Socket Modeで接続中なら1"
+)
+SOCKET_MODE_RECONNECTS = Counter(
+    "bot_socket_mode_reconnects_total", "Socket Modeの切断・再接続の回数"
+)
+REMINDER_LAG = Histogram(
+    "bot_reminder_lag_seconds", "リマインダーの送信予定時刻から実際に送信するまでの遅れ",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+)
+REMINDERS_SENT = Counter(
+    "bot_reminders_sent_total", "送信したリマインダーの件数", ("result",)
+)
+OUTBOX_MESSAGES = Counter(
+    "bot_outbox_messages_total", "outboxから送信を試みたメッセージの件数（sent: 送信、retry: 再送待ち、dead: 再送をあきらめた）",
+    ("kind", "result")
+)
+OUTBOX_DELIVERY_LAG = Histogram(
+    "bot_outbox_delivery_lag_seconds", "メッセージを送るべき時刻から実際に送信できるまでの時間", ("kind",),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+)
+OUTBOX_PENDING = Gauge(
+    "bot_outbox_pending", "outboxの送信待ちの件数（全プロセス分）"
+)
+OUTBOX_OLDEST_AGE = Gauge(
+    "bot_outbox_oldest_age_seconds", "outboxの送信待ちのうち、送るべき時刻が最も古いものの経過秒数"
+)
+OUTBOX_DEAD = Gauge(
+    "bot_outbox_dead", "再送をあきらめてoutboxに残っているメッセージの件数"
+)
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "bot_executor_queue_depth", "リスナー・ack後の処理のスレッドプールで実行を待っているタスクの数", ("pool",)
+)
+EXECUTOR_WAIT = Histogram(
+    "bot_executor_wait_seconds", "スレッドプールに積んでから実行が始まるまでの時間", ("pool", "priority")
+)
+EXECUTOR_SHED = Counter(
+    "bot_executor_shed_total", "混雑のため受け付けを断った（busy）・ackの期限を過ぎて実行しなかった（expired）リクエストの件数",
+    ("pool", "priority", "reason")
+)
+DUPLICATE_EVENTS = Counter(
+    "bot_duplicate_events_total", "再送された重複として処理せずにackしたイベント・操作の件数（memory: プロセス内、shared: DBで判定）",
+    ("source",)
+)
+PROCESS_START_TIME = Gauge(
+    "bot_process_start_time_seconds", "プロセスの起動時刻（UNIX時間）"
+)
+PROCESS_START_TIME.set(time.time())
+
+
+def timed_handler(func):
+    """ハンドラーの実行時間を記録するデコレーター（Boltの引数の解決はfunctools.wrapsで元の関数を見る）"""
+    return HANDLER_DURATION.labels(func.__name__).time()(func)
+
+
+def timed_query(func):
+    """database.pyの関数の実行時間を記録するデコレーター"""
+    return DB_QUERY_DURATION.labels(func.__name__).time()(func)
+
+
+def observe_ack(name: str, elapsed: float):
+    ACK_LATENCY.labels(name).observe(elapsed)
+
+
+def observe_outbox_sent(kind: str, due_at: float, now: float):
+    """outboxから送信したメッセージの遅れを記録（due_at・nowはUNIX時間）"""
+    lag = max(0.0, now - due_at)
+    OUTBOX_MESSAGES.labels(kind, "sent").inc()
+    OUTBOX_DELIVERY_LAG.labels(kind).observe(lag)
+    if kind == "reminder":
+        REMINDERS_SENT.labels("sent").inc()
+        REMINDER_LAG.observe(lag)
+
+
+def observe_outbox_failed(kind: str, dead: bool):
+    """outboxからの送信の失敗を記録"""
+    OUTBOX_MESSAGES.labels(kind, "dead" if dead else "retry").inc()
+    if kind == "reminder":
+        REMINDERS_SENT.labels("failed").inc()
+
+
+def _slack_status(error: BaseException) -> str:
+    if isinstance(error, SlackApiError):
+        return str(error.response.get("error") or "error")
+    return "exception"
+
+
+def instrument_slack_api():
+    """WebClient / AsyncWebClientのapi_callを包んで、呼び出し回数と応答時間を記録する
+
+    Boltはリクエストごとに新しいWebClientを作るため、インスタンスではなくクラスに仕込む。
+    """
+    if getattr(WebClient.api_call, "_instrumented", False):
+        return
+
+    original = WebClient.api_call
+    original_async = AsyncWebClient.api_call
+
+    @functools.wraps(original)
+    def api_call(self, api_method, **kwargs):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return original(self, api_method, **kwargs)
+        except BaseException as e:
+            status = _slack_status(e)
+            raise
+        finally:
+            SLACK_API_DURATION.labels(api_method).observe(time.perf_counter() - started)
+            SLACK_API_CALLS.labels(api_method, status).inc()
+
+    @functools.wraps(original_async)
+    async def api_call_async(self, api_method, **kwargs):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await original_async(self, api_method, **kwargs)
+        except BaseException as e:
+            status = _slack_status(e)
+            raise
+        finally:
+            SLACK_API_DURATION.labels(api_method).observe(time.perf_counter() - started)
+            SLACK_API_CALLS.labels(api_method, status).inc()
+
+    api_call._instrumented = True
+    api_call_async._instrumented = True
+    WebClient.api_call = api_call
+    AsyncWebClient.api_call = api_call_async
@@ -0,0 +1,82 @@
+"""
+メトリクス・ヘルスチェックのHTTPサーバー（FastAPI + uvicorn）
+/metrics: Prometheusのテキスト形式 / /healthz: DBとSocket Modeの接続状態
+"""
+import asyncio
+import threading
+import time
+
+import uvicorn
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import JSONResponse, Response
+
+import metrics
+from config import HOST, PORT
+from database import get_connection
+
+# HTTPモードではBotのFastAPIアプリにも同じルートを載せる
+router = APIRouter()
+
+
+def _check_database() -> bool:
+    try:
+        get_connection().execute("SELECT 1").fetchone()
+        return True
+    except Exception as e:
+        print(f"Health check: database error: {e}")
+        return False
+
+
+@router.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@router.get("/healthz")
+def get_healthz():
+    checks = {"database": _check_database()}
+    # Socket Modeで動いている場合のみ接続状態を見る
+    if metrics.SOCKET_MODE_CONNECTED.has_function():
+        checks["socket_mode"] = metrics.SOCKET_MODE_CONNECTED.value() == 1
+
+    healthy = all(checks.values())
+    return JSONResponse(
+        {
+            "status": "ok" if healthy else "unhealthy",
+            "checks": checks,
+            "uptime_seconds": round(time.time() - metrics.PROCESS_START_TIME.value()),
+        },
+        status_code=200 if healthy else 503,
+    )
+
+
+api = FastAPI(title="meeting-room-bot", docs_url=None, redoc_url=None, openapi_url=None)
+api.include_router(router)
+
+
+class _EmbeddedServer(uvicorn.Server):
+    """Bot本体に組み込むuvicorn（Ctrl+CなどのシグナルはBot側で扱うため横取りしない）"""
+
+    def install_signal_handlers(self):
+        pass
+
+
+def _server() -> uvicorn.Server:
+    return _EmbeddedServer(uvicorn.Config(api, host=HOST, port=PORT, log_level="warning", access_log=False))
+
+
+async def serve_metrics():
+    """メトリクスサーバーを現在のイベントループで動かす（asyncio版はタスクとして実行）"""
+    print(f"Metrics server listening on {HOST}:{PORT}")
+    try:
+        await _server().serve()
+    except SystemExit:
+        # ポートが使用中などで起動できなかった場合もBotは止めない
+        print(f"Metrics server failed to start on {HOST}:{PORT}")
+
+
+def start_metrics_server() -> threading.Thread:
+    """メトリクスサーバーを専用スレッドで起動（スレッド版）"""
+    thread = threading.Thread(target=asyncio.run, args=(serve_metrics(),), name="metrics", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,247 @@
+"""
+通知（outbox）の送信ワーカー
+予約の作成・キャンセル・リマインダーなどの通知は、予約の変更と同じトランザクションでoutboxテーブルに積み、
+このワーカーが送る。ワーカープールで並列に送り、チャンネルごとのレート制限と429のRetry-Afterを守る。
+失敗したものは指数バックオフで再送し、再送しても成功しないもの・OUTBOX_MAX_ATTEMPTS回失敗したものはdeadとして残す
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, Optional
+
+from slack_sdk.errors import SlackApiError
+
+import async_database as db
+import database
+from config import (
+    OUTBOX_WORKERS,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_CLAIM_SECONDS,
+    SLACK_CHANNEL_RATE,
+    SLACK_CHANNEL_BURST,
+)
+from metrics import (
+    add_collector,
+    observe_outbox_sent,
+    observe_outbox_failed,
+    OUTBOX_PENDING,
+    OUTBOX_OLDEST_AGE,
+    OUTBOX_DEAD,
+)
+from rate_limit import ChannelRateLimiter, post_message, post_message_async
+from reminder_scheduler import WORKER_ID
+
+# 1回に確保して送信する件数
+OUTBOX_BATCH = 50
+
+# 他のプロセスが積んだものや再送時刻を迎えたものを見に行く間隔（秒）
+OUTBOX_POLL_SECONDS = 1.0
+
+# 再送までの待ち時間（秒）: _BACKOFF_BASE * 2^(失敗回数-1)、上限_BACKOFF_MAX、±20%ばらつかせる
+_BACKOFF_BASE = 2.0
+_BACKOFF_MAX = 600.0
+
+# 再送しても成功しないエラー（すぐにdeadにする）
+_PERMANENT_ERRORS = {"channel_not_found", "not_in_channel", "is_archived", "msg_too_long", "no_text"}
+
+_executor = ThreadPoolExecutor(max_workers=OUTBOX_WORKERS, thread_name_prefix="outbox")
+channel_limiter = ChannelRateLimiter(SLACK_CHANNEL_RATE, SLACK_CHANNEL_BURST)
+
+
+def outbox_message(kind: str, channel_id: str, text: str, due_at: Optional[float] = None) -> tuple:
+    """outboxに積むメッセージ（due_atは送るべき時刻、省略時は今）"""
+    return kind, channel_id, text, time.time() if due_at is None else due_at
+
+
+def collect_outbox_stats():
+    """送信待ちの件数・経過時間・dead件数を全プロセス分DBから1回で取り、ゲージに設定する（メトリクスの出力ごとに呼ぶ）"""
+    try:
+        stats = database.get_outbox_stats()
+    except Exception as e:
+        print(f"Outbox stats failed: {e}")
+        stats = dict.fromkeys(("pending", "oldest_age", "dead"), float("nan"))
+    OUTBOX_PENDING.set(stats["pending"])
+    OUTBOX_OLDEST_AGE.set(stats["oldest_age"])
+    OUTBOX_DEAD.set(stats["dead"])
+
+
+add_collector(collect_outbox_stats)
+
+
+def _interleave_by_channel(messages: list[dict]) -> list[dict]:
+    """チャンネルごとに順番に並べ替える（1チャンネルの待ちでワーカーが埋まらないように）"""
+    queues = defaultdict(deque)
+    for m in messages:
+        queues[m["channel_id"]].append(m)
+
+    ordered = []
+    while queues:
+        for channel in list(queues):
+            queue = queues[channel]
+            ordered.append(queue.popleft())
+            if not queue:
+                del queues[channel]
+    return ordered
+
+
+def dispatch_messages(
+    client,
+    messages: list[dict],
+    executor: Optional[ThreadPoolExecutor] = None,
+    limiter: Optional[ChannelRateLimiter] = None
+) -> Iterator[tuple[int, Optional[Exception]]]:
+    """メッセージ（id・channel_id・textを持つ辞書）を並列に送信し、完了した順に (ID, 失敗時の例外) を返す"""
+    executor = executor or _executor
+    limiter = limiter or channel_limiter
+
+    futures = {
+        executor.submit(
+            post_message, client, limiter,
+            channel=m["channel_id"],
+            text=m["text"]
+        ): m["id"]
+        for m in _interleave_by_channel(messages)
+    }
+
+    for future in as_completed(futures):
+        yield futures[future], future.exception()
+
+
+async def dispatch_messages_async(
+    client,
+    messages: list[dict],
+    limiter: Optional[ChannelRateLimiter] = None,
+    concurrency: int = OUTBOX_WORKERS
+) -> list[tuple[int, Optional[Exception]]]:
+    """dispatch_messagesのasyncio版（clientはAsyncWebClient、同時送信数をconcurrencyに制限）"""
+    limiter = limiter or channel_limiter
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(m: dict) -> tuple[int, Optional[Exception]]:
+        async with semaphore:
+            try:
+                await post_message_async(
+                    client, limiter,
+                    channel=m["channel_id"],
+                    text=m["text"]
+                )
+            except Exception as e:
+                return m["id"], e
+        return m["id"], None
+
+    return await asyncio.gather(*(send(m) for m in _interleave_by_channel(messages)))
+
+
+def next_attempt_at(message: dict, error: Exception) -> Optional[float]:
+    """送信に失敗したメッセージを次に送る時刻（UNIX時間、再送しない場合はNone）"""
+    attempts = message["attempts"] + 1
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        return None
+    if isinstance(error, SlackApiError) and error.response.get("error") in _PERMANENT_ERRORS:
+        return None
+    delay = min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** (attempts - 1))
+    return time.time() + delay * random.uniform(0.8, 1.2)
+
+
+def record_results(messages: list[dict], results: list[tuple[int, Optional[Exception]]]) -> int:
+    """送信結果をoutboxとメトリクスに記録し、送信できた件数を返す"""
+    now = time.time()
+    by_id = {m["id"]: m for m in messages}
+    sent_ids = []
+    failures = []
+    for message_id, error in results:
+        message = by_id[message_id]
+        if error is None:
+            observe_outbox_sent(message["kind"], message["due_at"], now)
+            sent_ids.append(message_id)
+            continue
+
+        retry_at = next_attempt_at(message, error)
+        observe_outbox_failed(message["kind"], retry_at is None)
+        print(
+            f"Failed to send {message['kind']} message {message_id} to {message['channel_id']}: {error}"
+            + ("" if retry_at else " (dead)")
+        )
+        failures.append((message_id, str(error), retry_at))
+
+    database.complete_outbox_messages(sent_ids)
+    database.fail_outbox_messages(failures)
+    return len(sent_ids)
+
+
+class OutboxWorker:
+    """outboxのメッセージを送り続けるワーカー（スレッド版）"""
+
+    def __init__(
+        self,
+        client,
+        executor: Optional[ThreadPoolExecutor] = None,
+        limiter: Optional[ChannelRateLimiter] = None
+    ):
+        self._client = client
+        self._executor = executor
+        self._limiter = limiter
+        self._wakeup = threading.Event()
+
+    def notify(self):
+        """メッセージを積んだことを知らせ、待たずに送らせる"""
+        self._wakeup.set()
+
+    def drain(self) -> int:
+        """送信できる時刻になったメッセージを送り切り、送信できた件数を返す"""
+        sent = 0
+        while True:
+            messages = database.claim_outbox_messages(WORKER_ID, OUTBOX_CLAIM_SECONDS, OUTBOX_BATCH)
+            if not messages:
+                return sent
+            results = list(dispatch_messages(self._client, messages, self._executor, self._limiter))
+            sent += record_results(messages, results)
+
+    def run(self):
+        """送信を続ける（専用スレッドで実行）"""
+        while True:
+            self._wakeup.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Outbox worker error: {e}")
+            self._wakeup.wait(OUTBOX_POLL_SECONDS)
+
+
+class AsyncOutboxWorker:
+    """outboxのメッセージを送り続けるワーカー（asyncio版、イベントループ内からのみ操作する）"""
+
+    def __init__(self, client, limiter: Optional[ChannelRateLimiter] = None):
+        self._client = client
+        self._limiter = limiter
+        self._wakeup = asyncio.Event()
+
+    def notify(self):
+        """メッセージを積んだことを知らせ、待たずに送らせる"""
+        self._wakeup.set()
+
+    async def drain(self) -> int:
+        """送信できる時刻になったメッセージを送り切り、送信できた件数を返す"""
+        sent = 0
+        while True:
+            messages = await db.claim_outbox_messages(WORKER_ID, OUTBOX_CLAIM_SECONDS, OUTBOX_BATCH)
+            if not messages:
+                return sent
+            results = await dispatch_messages_async(self._client, messages, self._limiter)
+            sent += await db.run_db(record_results, messages, results)
+
+    async def run(self):
+        """送信を続ける（タスクとして実行）"""
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                print(f"Outbox worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,115 @@
+"""
+Slack APIのチャンネル単位レート制限
+chat.postMessageは1チャンネルあたり約1件/秒（短いバーストは可）のため、トークンバケットで送信間隔を揃える
+"""
+import asyncio
+import threading
+import time
+
+from slack_sdk.errors import SlackApiError
+
+
+class TokenBucket:
+    """トークンバケット（rate件/秒で補充、最大capacity件まで貯まる）"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        # 429を受けた場合、この時刻まではトークンを払い出さない
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """トークンを1つ予約し、使えるようになるまでの待ち時間を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(wait, self._blocked_until - now)
+
+    def acquire(self):
+        """トークンが使えるようになるまで待つ"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """トークンが使えるようになるまで待つ（asyncio版）"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def block(self, seconds: float):
+        """Retry-Afterの秒数だけ払い出しを止める"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+
+class ChannelRateLimiter:
+    """チャンネルIDごとのトークンバケット"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, channel: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(channel)
+            if bucket is None:
+                bucket = self._buckets[channel] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def acquire(self, channel: str):
+        self.bucket(channel).acquire()
+
+    async def acquire_async(self, channel: str):
+        await self.bucket(channel).acquire_async()
+
+    def block(self, channel: str, seconds: float):
+        self.bucket(channel).block(seconds)
+
+
+def retry_after_seconds(error: SlackApiError):
+    """429応答ならRetry-Afterの秒数を返す（それ以外はNone）"""
+    response = error.response
+    if response is None or response.status_code != 429:
+        return None
+    for name, value in (response.headers or {}).items():
+        if name.lower() == "retry-after":
+            return float(value[0] if isinstance(value, list) else value)
+    return 1.0
+
+
+def post_message(client, limiter: ChannelRateLimiter, max_retries: int = 3, **kwargs):
+    """レート制限を守ってchat_postMessageを呼ぶ（429ならRetry-After後に再試行）"""
+    channel = kwargs["channel"]
+    for attempt in range(max_retries + 1):
+        limiter.acquire(channel)
+        try:
+            return client.chat_postMessage(**kwargs)
+        except SlackApiError as e:
+            retry_after = retry_after_seconds(e)
+            if retry_after is None or attempt == max_retries:
+                raise
+            limiter.block(channel, retry_after)
+
+
+async def post_message_async(client, limiter: ChannelRateLimiter, max_retries: int = 3, **kwargs):
+    """post_messageのasyncio版（clientはAsyncWebClient）"""
+    channel = kwargs["channel"]
+    for attempt in range(max_retries + 1):
+        await limiter.acquire_async(channel)
+        try:
+            return await client.chat_postMessage(**kwargs)
+        except SlackApiError as e:
+            retry_after = retry_after_seconds(e)
+            if retry_after is None or attempt == max_retries:
+                raise
+            limiter.block(channel, retry_after)
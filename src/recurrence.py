@@ -0,0 +1,170 @@
+"""
+繰り返し予約の規則
+毎日・毎週・隔週の予約は1行のシリーズとして保存し、各回はここのジェネレーターで必要な範囲だけ生成する。
+個別にキャンセルした回は除外する回として持つ
+"""
+import threading
+from datetime import date, datetime, time, timedelta
+from math import lcm
+from typing import Iterable, Iterator, Optional
+
+from epoch import from_epoch
+from reservation import Reservation
+
+# 繰り返しの種類 -> 間隔（日）
+FREQUENCIES = {"daily": 1, "weekly": 7, "biweekly": 14}
+
+
+def last_occurrence(
+    start_time: datetime, frequency: str, until: Optional[date] = None, count: Optional[int] = None
+) -> Optional[datetime]:
+    """終了日（その日までに始まる回まで）・回数から最後の回の開始時刻を求める（どちらもなければ無期限でNone）"""
+    step = timedelta(days=FREQUENCIES[frequency])
+    candidates = []
+    if count is not None:
+        candidates.append(start_time + (count - 1) * step)
+    if until is not None:
+        limit = datetime.combine(until, time.max)
+        candidates.append(start_time + ((limit - start_time) // step) * step)
+    return min(candidates) if candidates else None
+
+
+class Recurrence:
+    """初回の開始・終了から間隔ごとに繰り返す回（last_startの回まで、skipの回を除く）"""
+
+    def __init__(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        frequency: str,
+        last_start: Optional[datetime] = None,
+        skip: Iterable[datetime] = ()
+    ):
+        self.start = start_time
+        self.duration = end_time - start_time
+        self.step = timedelta(days=FREQUENCIES[frequency])
+        self.last = last_start
+        self.skip = set(skip)
+
+    def occurrences(
+        self,
+        after: Optional[datetime] = None,
+        before: Optional[datetime] = None,
+        include_skipped: bool = False
+    ) -> Iterator[tuple[datetime, datetime]]:
+        """各回の (開始, 終了) を順に生成（afterより後に終わり、beforeより前に始まる回のみ）
+
+        afterの直後の回は間隔から計算して飛ぶため、何年先から生成しても先頭までの回はたどらない。
+        """
+        n = 0
+        if after is not None and after >= self.start + self.duration:
+            n = (after - self.start - self.duration) // self.step + 1
+        start = self.start + n * self.step
+        while (self.last is None or start <= self.last) and (before is None or start < before):
+            if include_skipped or start not in self.skip:
+                yield start, start + self.duration
+            start += self.step
+
+    def first_overlap(
+        self, start_time: datetime, end_time: datetime, include_skipped: bool = False
+    ) -> Optional[tuple[datetime, datetime]]:
+        """start_time〜end_timeと重なる最初の回"""
+        return next(self.occurrences(start_time, end_time, include_skipped), None)
+
+    def next_start(self, after: datetime) -> Optional[datetime]:
+        """afterより後に始まる最初の回の開始時刻（残っていなければNone）"""
+        for start, _ in self.occurrences(after):
+            if start > after:
+                return start
+        return None
+
+    def includes(self, start_time: datetime) -> bool:
+        """start_timeに始まる回があるか（除外した回は含まない）"""
+        offset = start_time - self.start
+        return (
+            offset >= timedelta(0) and offset % self.step == timedelta(0)
+            and (self.last is None or start_time <= self.last)
+            and start_time not in self.skip
+        )
+
+    def overlap_with(self, other: "Recurrence") -> Optional[tuple[datetime, datetime]]:
+        """自分のいずれかの回と重なるotherの最初の回（除外した回も重なりとみなす）
+
+        2つの繰り返しの位置関係は間隔の最小公倍数ごとに同じになるため、両方が始まってから
+        1周期＋両方の長さの範囲だけ調べればよい。
+        """
+        period = timedelta(days=lcm(self.step.days, other.step.days))
+        horizon = max(self.start, other.start) + period + self.duration + other.duration
+        for start, end in self.occurrences(other.start, horizon, include_skipped=True):
+            found = other.first_overlap(start, end, include_skipped=True)
+            if found:
+                return found
+        return None
+
+
+def series_recurrence(series: dict, skip: Iterable[int] = ()) -> Recurrence:
+    """reservation_seriesの行と除外する回の開始時刻の一覧（日時はDBの整数の秒）から規則を作る"""
+    return Recurrence(
+        from_epoch(series["start_time"]),
+        from_epoch(series["end_time"]),
+        series["frequency"],
+        from_epoch(series["last_start"]) if series["last_start"] is not None else None,
+        (from_epoch(s) for s in skip),
+    )
+
+
+def occurrence(series: dict, start_time: datetime, end_time: datetime) -> Reservation:
+    """シリーズの1回を予約と同じ形のReservationにする（idはNone、series_idにシリーズのID）"""
+    return Reservation(
+        None, series["event_name"], start_time, end_time,
+        series["user_id"], series["user_name"], series["channel_id"], series["reminder_minutes"],
+        series_id=series["id"], frequency=series["frequency"],
+    )
+
+
+def order_key(reservation: Reservation) -> tuple[datetime, int]:
+    """予約・繰り返しの回を並べる (開始時刻, ID) のキー（繰り返しの回はIDの代わりに -シリーズID）"""
+    if reservation.series_id is not None:
+        return reservation.start_time, -reservation.series_id
+    return reservation.start_time, reservation.id
+
+
+class SeriesIndex:
+    """シリーズID -> (シリーズの行, 規則)
+
+    シリーズは予約1件ごとの行より桁違いに少ないため、全件をメモリに持って毎回なめる。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: dict[int, tuple[dict, Recurrence]] = {}
+        self.loaded = False
+
+    def load(self, entries: Iterable[tuple[dict, Recurrence]]):
+        """(シリーズの行, 規則) の一覧から構築"""
+        series = {row["id"]: (row, rule) for row, rule in entries}
+        with self._lock:
+            self._series = series
+            self.loaded = True
+
+    def clear(self):
+        """破棄（以降はSQLiteにフォールバック）"""
+        with self._lock:
+            self._series = {}
+            self.loaded = False
+
+    def put(self, series: dict, rule: Recurrence):
+        """シリーズを追加（登録済みなら置き換え）"""
+        with self._lock:
+            if self.loaded:
+                self._series[series["id"]] = (series, rule)
+
+    def remove(self, series_id: int):
+        """シリーズを削除"""
+        with self._lock:
+            self._series.pop(series_id, None)
+
+    def snapshot(self) -> list[tuple[dict, Recurrence]]:
+        """全シリーズの一覧（ID順）"""
+        with self._lock:
+            return [self._series[series_id] for series_id in sorted(self._series)]
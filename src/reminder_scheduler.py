@@ -0,0 +1,213 @@
+"""
+リマインダーのスケジューラ
+送信時刻の早い順に最小ヒープで保持し、次の送信時刻までスリープする。
+複数のプロセスで動かす場合は、リースを持つ1プロセスが変更履歴を追って全予約を見張る。
+繰り返し予約は -シリーズID をキーに、次の回の送信時刻だけを登録する
+"""
+import asyncio
+import heapq
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from epoch import from_epoch
+
+# 時計の補正などに追従するため、次の送信時刻が遠くても一定間隔で待機をやり直す（DBは読まない）
+_MAX_WAIT_SECONDS = 300
+
+# リマインダーの送信役（全予約を見張るプロセス）のリース名
+REMINDER_LEASE = "reminders"
+
+# 他のプロセスで作成・削除された予約をスケジューラに反映する間隔（秒）
+REMINDER_SYNC_SECONDS = 2
+
+# 送信に失敗した（DBのロックなど）リマインドを登録し直して再送するまでの秒数
+REMINDER_RETRY_SECONDS = 30
+
+# このプロセスの識別子（リースとリマインダーの確保の持ち主）
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def apply_reminder_changes(scheduler, changes: list[dict], seq: int) -> bool:
+    """予約の変更履歴（seqより後）をスケジューラに反映する
+
+    履歴が削除済みの範囲まで遅れていた場合は何もせずFalseを返す（呼び出し側で読み直す）。
+    """
+    if changes and changes[0]["seq"] != seq + 1:
+        return False
+    for change in changes:
+        if change["op"] == "insert" and change["remind_at"]:
+            scheduler.schedule(change["reservation_id"], from_epoch(change["remind_at"]))
+        elif change["op"] == "delete":
+            scheduler.cancel(change["reservation_id"])
+        elif change["op"] in ("series", "series_remind"):
+            if change["remind_at"]:
+                scheduler.schedule(-change["reservation_id"], from_epoch(change["remind_at"]))
+            else:
+                scheduler.cancel(-change["reservation_id"])
+    return True
+
+
+class _ReminderHeap:
+    """予約IDごとの送信時刻を保持する最小ヒープ（排他制御は呼び出し側で行う）
+
+    キャンセルされた予約はヒープから直接取り除かず、取り出した時点で読み飛ばす。
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[datetime, int]] = []
+        self._scheduled: dict[int, datetime] = {}
+
+    def _push(self, reservation_id: int, fire_at: datetime) -> bool:
+        """登録し、ヒープの先頭が変わったかを返す"""
+        self._scheduled[reservation_id] = fire_at
+        heapq.heappush(self._heap, (fire_at, reservation_id))
+        return self._heap[0] == (fire_at, reservation_id)
+
+    def _discard_cancelled(self):
+        """ヒープ先頭の取り消し済み・置き換え済みの要素を捨てる"""
+        while self._heap:
+            fire_at, reservation_id = self._heap[0]
+            if self._scheduled.get(reservation_id) == fire_at:
+                return
+            heapq.heappop(self._heap)
+
+    def _seconds_until_next(self) -> Optional[float]:
+        """次の送信時刻までの秒数（予定がなければNone）"""
+        self._discard_cancelled()
+        if not self._heap:
+            return None
+        return (self._heap[0][0] - datetime.now()).total_seconds()
+
+    def _pop_due(self) -> list[int]:
+        """送信時刻を過ぎた予約IDを取り出す"""
+        now = datetime.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, reservation_id = heapq.heappop(self._heap)
+            if self._scheduled.get(reservation_id) == fire_at:
+                del self._scheduled[reservation_id]
+                due.append(reservation_id)
+        return due
+
+    def _push_retry(self, due: list[int]) -> bool:
+        """取り出した予約IDを再送時刻で登録し直し、ヒープの先頭が変わったかを返す
+
+        待っている間に変更履歴から登録し直された予約はそちらを優先する。
+        """
+        retry_at = datetime.now() + timedelta(seconds=REMINDER_RETRY_SECONDS)
+        changed = False
+        for reservation_id in due:
+            if reservation_id not in self._scheduled:
+                changed = self._push(reservation_id, retry_at) or changed
+        return changed
+
+
+class ReminderScheduler(_ReminderHeap):
+    """送信時刻になったらコールバックを呼ぶスケジューラ（スレッド版）"""
+
+    def __init__(self, callback: Callable[[], None]):
+        super().__init__()
+        self._callback = callback
+        self._cond = threading.Condition()
+
+    def schedule(self, reservation_id: int, fire_at: datetime):
+        """予約のリマインド時刻を登録（登録済みなら置き換え）"""
+        with self._cond:
+            # 先頭が変わった場合に待機時間を計算し直させる
+            if self._push(reservation_id, fire_at):
+                self._cond.notify()
+
+    def cancel(self, reservation_id: int):
+        """予約のリマインドを取り消す"""
+        with self._cond:
+            self._scheduled.pop(reservation_id, None)
+
+    def clear(self):
+        """登録済みのリマインドをすべて取り消す"""
+        with self._cond:
+            self._heap.clear()
+            self._scheduled.clear()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._scheduled)
+
+    def _wait_until_due(self) -> list[int]:
+        """次の送信時刻まで待機し、時刻を過ぎた予約IDを取り出す"""
+        with self._cond:
+            while True:
+                delay = self._seconds_until_next()
+                if delay is not None and delay <= 0:
+                    return self._pop_due()
+                self._cond.wait(_MAX_WAIT_SECONDS if delay is None else min(delay, _MAX_WAIT_SECONDS))
+
+    def run(self):
+        """送信時刻ごとにコールバックを呼び続ける（専用スレッドで実行）"""
+        while True:
+            due = self._wait_until_due()
+            if not due:
+                continue
+            try:
+                self._callback()
+            except Exception as e:
+                print(f"Reminder scheduler error: {e}")
+                with self._cond:
+                    if self._push_retry(due):
+                        self._cond.notify()
+
+
+class AsyncReminderScheduler(_ReminderHeap):
+    """送信時刻になったらコルーチンを呼ぶスケジューラ（asyncio版、イベントループ内からのみ操作する）"""
+
+    def __init__(self, callback: Callable[[], Awaitable[None]]):
+        super().__init__()
+        self._callback = callback
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, reservation_id: int, fire_at: datetime):
+        """予約のリマインド時刻を登録（登録済みなら置き換え）"""
+        if self._push(reservation_id, fire_at):
+            self._wakeup.set()
+
+    def cancel(self, reservation_id: int):
+        """予約のリマインドを取り消す"""
+        self._scheduled.pop(reservation_id, None)
+
+    def clear(self):
+        """登録済みのリマインドをすべて取り消す"""
+        self._heap.clear()
+        self._scheduled.clear()
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+    async def _wait_until_due(self) -> list[int]:
+        """次の送信時刻まで待機し、時刻を過ぎた予約IDを取り出す"""
+        while True:
+            delay = self._seconds_until_next()
+            if delay is not None and delay <= 0:
+                return self._pop_due()
+
+            self._wakeup.clear()
+            timeout = _MAX_WAIT_SECONDS if delay is None else min(delay, _MAX_WAIT_SECONDS)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        """送信時刻ごとにコールバックを呼び続ける（タスクとして実行）"""
+        while True:
+            due = await self._wait_until_due()
+            if not due:
+                continue
+            try:
+                await self._callback()
+            except Exception as e:
+                print(f"Reminder scheduler error: {e}")
+                if self._push_retry(due):
+                    self._wakeup.set()
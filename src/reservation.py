@@ -0,0 +1,76 @@
+"""
+予約1件を表すレコード
+DBの行はrow_factory（reservation_factory）で直接Reservationにし、行ごとのdictを作らない。
+日時はdatetimeに変換済みで、呼び出し側で読み直さずに使える
+"""
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+from epoch import from_epoch
+
+# 一覧の選択肢に使う列（id・ミーティング名・開始時刻）
+SUMMARY_COLUMNS = "id, event_name, start_time"
+
+# 表示・通知に使う列（SUMMARY_COLUMNSを先頭に含む。reservation_factoryはこの並びで受け取る）
+COLUMNS = SUMMARY_COLUMNS + ", end_time, user_id, user_name, channel_id, reminder_minutes, remind_at"
+
+_SUMMARY_LENGTH = len(SUMMARY_COLUMNS.split(","))
+
+# 予約の時刻は30分刻みに集まるため、同じ秒のdatetimeは使い回す（datetimeは変更されない）
+_datetime = lru_cache(maxsize=1 << 16)(from_epoch)
+
+
+class Reservation:
+    """予約1件（繰り返しの回も同じ形で表し、idはNone・series_idにシリーズのID）
+
+    SUMMARY_COLUMNSだけを読んだ場合、残りの属性はNone。
+    next_remind_atはキャンセルした繰り返しの回に、シリーズの次のリマインドの時刻を入れる。
+    """
+
+    __slots__ = (
+        "id", "event_name", "start_time", "end_time", "user_id", "user_name", "channel_id",
+        "reminder_minutes", "remind_at", "series_id", "frequency", "next_remind_at",
+    )
+
+    def __init__(
+        self,
+        id: Optional[int],
+        event_name: str,
+        start_time: datetime,
+        end_time: Optional[datetime] = None,
+        user_id: Optional[str] = None,
+        user_name: Optional[str] = None,
+        channel_id: Optional[str] = None,
+        reminder_minutes: Optional[int] = None,
+        remind_at: Optional[datetime] = None,
+        series_id: Optional[int] = None,
+        frequency: Optional[str] = None,
+    ):
+        self.id = id
+        self.event_name = event_name
+        self.start_time = start_time
+        self.end_time = end_time
+        self.user_id = user_id
+        self.user_name = user_name
+        self.channel_id = channel_id
+        self.reminder_minutes = reminder_minutes
+        self.remind_at = remind_at
+        self.series_id = series_id
+        self.frequency = frequency
+        self.next_remind_at = None
+
+    def __repr__(self) -> str:
+        key = f"series_id={self.series_id}" if self.series_id is not None else f"id={self.id}"
+        return f"Reservation({key}, {self.event_name!r}, {self.start_time})"
+
+
+def reservation_factory(cursor, row: tuple) -> Reservation:
+    """row_factory: SUMMARY_COLUMNSまたはCOLUMNSの並びで読んだ行をReservationにする"""
+    if len(row) == _SUMMARY_LENGTH:
+        return Reservation(row[0], row[1], _datetime(row[2]))
+    remind_at = row[8]
+    return Reservation(
+        row[0], row[1], _datetime(row[2]), _datetime(row[3]), row[4], row[5], row[6], row[7],
+        _datetime(remind_at) if remind_at is not None else None,
+    )
@@ -0,0 +1,213 @@
+"""
+予約枠の空き状況のビットマップ
+予約できる時間帯を30分ごとの枠に区切り、日ごとに1枠1ビットの整数で埋まっている枠を持つ。
+予約の作成・削除時にその日の分だけ更新し、空き枠の一覧や「N時間空いている最初の枠」をビット演算で求める
+"""
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Optional
+
+from epoch import DAY_SECONDS, EPOCH, to_epoch
+
+# 予約できる時間帯（予約モーダルの時刻の選択肢と同じ07:00-21:30）を30分ごとに区切る
+SLOT_MINUTES = 30
+DAY_START = time(7, 0)
+SLOTS_PER_DAY = 29
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+_SLOT_SECONDS = SLOT_MINUTES * 60
+_DAY_START_SECONDS = DAY_START.hour * 3600 + DAY_START.minute * 60
+_EPOCH_ORDINAL = EPOCH.toordinal()
+
+
+def slot_start(day: date, slot: int) -> datetime:
+    """枠の開始時刻（slot == SLOTS_PER_DAYなら予約できる時間帯の終わり）"""
+    return datetime.combine(day, DAY_START) + timedelta(minutes=SLOT_MINUTES * slot)
+
+
+def day_masks(start_time: datetime, end_time: datetime) -> dict[int, int]:
+    """予約が重なる枠を {日付の序数: ビット} で返す（枠の一部でも重なれば埋まっているとみなす）"""
+    return epoch_day_masks(to_epoch(start_time), to_epoch(end_time))
+
+
+def epoch_day_masks(start: int, end: int) -> dict[int, int]:
+    """day_masksの開始・終了をDBの整数の秒で受け取る版（読み込み時にdatetimeを作らない）"""
+    masks = {}
+    for day in range(start // DAY_SECONDS, end // DAY_SECONDS + 1):
+        origin = day * DAY_SECONDS + _DAY_START_SECONDS
+        first = max(0, (start - origin) // _SLOT_SECONDS)
+        last = min(SLOTS_PER_DAY, -((origin - end) // _SLOT_SECONDS))
+        if first < last:
+            masks[day + _EPOCH_ORDINAL] = ((1 << last) - 1) & ~((1 << first) - 1)
+    return masks
+
+
+def past_mask(day: date, now: datetime) -> int:
+    """開始時刻を過ぎていて予約できない枠のビット"""
+    if day < now.date():
+        return FULL_DAY
+    if day > now.date():
+        return 0
+    minutes = (now - datetime.combine(day, DAY_START)).total_seconds() / 60
+    # 開始時刻ちょうどの枠はまだ予約できる
+    passed = min(SLOTS_PER_DAY, max(0, -int(-minutes // SLOT_MINUTES)))
+    return (1 << passed) - 1
+
+
+def _run_length(bits: int, first: int) -> int:
+    """first枠目から続けて立っているビットの数"""
+    shifted = bits >> first
+    # 下位から続く1の数 = 最下位の0の位置
+    return ((shifted + 1) & ~shifted).bit_length() - 1
+
+
+def free_runs(free: int) -> list[tuple[int, int]]:
+    """空き枠のビットから連続した空きを (最初の枠, 最後の枠+1) の一覧で返す"""
+    runs = []
+    while free:
+        first = (free & -free).bit_length() - 1
+        length = _run_length(free, first)
+        runs.append((first, first + length))
+        free &= ~(((1 << length) - 1) << first)
+    return runs
+
+
+def first_run(free: int, slots: int) -> Optional[int]:
+    """slots枠以上連続して空いている最初の枠（なければNone）
+
+    free & (free >> k) は「i枠目から k+1 枠続けて空いている」iのビットになるため、
+    幅を倍々に広げて O(log slots) 回のビット演算で求める。
+    """
+    run = free
+    width = 1
+    while width < slots and run:
+        step = min(width, slots - width)
+        run &= run >> step
+        width += step
+    if not run:
+        return None
+    return (run & -run).bit_length() - 1
+
+
+def free_slots(first_day: date, busy: list[int], now: datetime) -> list[int]:
+    """各日の埋まっている枠のビットから、予約できる空き枠のビットを求める"""
+    return [
+        FULL_DAY & ~bits & ~past_mask(first_day + timedelta(days=i), now)
+        for i, bits in enumerate(busy)
+    ]
+
+
+def find_free_gap(first_day: date, free: list[int], minutes: int) -> Optional[tuple[date, int, int]]:
+    """minutes分以上続けて空いている最初の枠を (日付, 最初の枠, 空きが続く最後の枠+1) で返す"""
+    slots = -(-minutes // SLOT_MINUTES)
+    for i, bits in enumerate(free):
+        first = first_run(bits, slots)
+        if first is None:
+            continue
+        return first_day + timedelta(days=i), first, first + _run_length(bits, first)
+    return None
+
+
+class SlotBitmap:
+    """日付の序数 -> 埋まっている枠のビット
+
+    枠の途中で終わる予約があると1つの枠に複数の予約が重なり得るため、
+    予約ごとのビットも持ち、削除時はその日の残りの予約から作り直す（1日あたり高々数十件）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days: dict[int, int] = {}
+        self._masks: dict[int, dict[int, int]] = {}
+        self._day_ids: dict[int, set[int]] = {}
+        self.loaded = False
+
+    def load(self, rows: Iterable[tuple[int, int, int]]):
+        """(id, start_time, end_time) の一覧（日時はDBの整数の秒）からビットマップを構築"""
+        masks = {rid: epoch_day_masks(start, end) for rid, start, end in rows}
+        days = {}
+        day_ids = {}
+        for rid, by_day in masks.items():
+            for ordinal, mask in by_day.items():
+                days[ordinal] = days.get(ordinal, 0) | mask
+                day_ids.setdefault(ordinal, set()).add(rid)
+
+        with self._lock:
+            self._days = days
+            self._masks = masks
+            self._day_ids = day_ids
+            self.loaded = True
+
+    def clear(self):
+        """ビットマップを破棄（以降はSQLiteにフォールバック）"""
+        with self._lock:
+            self._days = {}
+            self._masks = {}
+            self._day_ids = {}
+            self.loaded = False
+
+    def add(self, reservation_id: int, start_time: datetime, end_time: datetime):
+        """予約を追加（登録済みなら置き換え）"""
+        with self._lock:
+            if not self.loaded:
+                return
+            self._discard(reservation_id)
+            by_day = day_masks(start_time, end_time)
+            self._masks[reservation_id] = by_day
+            for ordinal, mask in by_day.items():
+                self._days[ordinal] = self._days.get(ordinal, 0) | mask
+                self._day_ids.setdefault(ordinal, set()).add(reservation_id)
+
+    def remove(self, reservation_id: int):
+        """予約を削除"""
+        with self._lock:
+            if not self.loaded:
+                return
+            self._discard(reservation_id)
+
+    def remove_many(self, reservation_ids: Iterable[int]):
+        """予約をまとめて削除（アーカイブへ移した予約用。影響した日のビットは1回ずつ作り直す）"""
+        with self._lock:
+            if not self.loaded:
+                return
+            touched = set()
+            for rid in reservation_ids:
+                by_day = self._masks.pop(rid, None)
+                if by_day is None:
+                    continue
+                for ordinal in by_day:
+                    self._day_ids[ordinal].discard(rid)
+                    touched.add(ordinal)
+            for ordinal in touched:
+                ids = self._day_ids[ordinal]
+                if not ids:
+                    del self._day_ids[ordinal]
+                    del self._days[ordinal]
+                    continue
+                bits = 0
+                for rid in ids:
+                    bits |= self._masks[rid][ordinal]
+                self._days[ordinal] = bits
+
+    def _discard(self, reservation_id: int):
+        """ロック取得済みの状態で予約を取り除き、その日のビットを作り直す"""
+        by_day = self._masks.pop(reservation_id, None)
+        if by_day is None:
+            return
+        for ordinal in by_day:
+            ids = self._day_ids[ordinal]
+            ids.discard(reservation_id)
+            if not ids:
+                del self._day_ids[ordinal]
+                del self._days[ordinal]
+                continue
+            bits = 0
+            for rid in ids:
+                bits |= self._masks[rid][ordinal]
+            self._days[ordinal] = bits
+
+    def busy(self, first_day: date, last_day: date) -> list[int]:
+        """first_day〜last_dayの各日の埋まっている枠のビット"""
+        with self._lock:
+            days = self._days
+            return [days.get(ordinal, 0) for ordinal in range(first_day.toordinal(), last_day.toordinal() + 1)]
@@ -0,0 +1,102 @@
+"""
+Slackユーザー情報のキャッシュ
+TTL付きLRUで保持し、同じユーザーへの同時ミスはAPI呼び出しを1回にまとめる
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable
+
+
+class UserCache:
+    """user_id -> ユーザー情報(dict) のTTL/LRUキャッシュ"""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self._async_inflight: dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def _store(self, user_id: str, user: dict):
+        """ロック取得済みの状態で保存し、上限を超えたら古いものから捨てる"""
+        self._entries[user_id] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, user_id: str, loader: Callable[[str], dict]) -> dict:
+        """キャッシュから取得（なければloaderで取得して保存）"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            future = self._inflight.get(user_id)
+            owner = future is None
+            if owner:
+                future = self._inflight[user_id] = Future()
+                self.loads += 1
+
+        # 他のスレッドが取得中ならその結果を待つ
+        if not owner:
+            return future.result()
+
+        try:
+            user = loader(user_id)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[user_id]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._store(user_id, user)
+            del self._inflight[user_id]
+        future.set_result(user)
+        return user
+
+    async def get_async(self, user_id: str, loader: Callable[[str], Awaitable[dict]]) -> dict:
+        """getのasyncio版（同じイベントループ内の同時ミスを1回のloader呼び出しにまとめる）"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+            task = self._async_inflight.get(user_id)
+            if task is None:
+                task = self._async_inflight[user_id] = asyncio.ensure_future(loader(user_id))
+                task.add_done_callback(lambda _: self._async_inflight.pop(user_id, None))
+                self.loads += 1
+
+        user = await task
+        with self._lock:
+            self._store(user_id, user)
+        return user
+
+    def put_many(self, users: list[dict]):
+        """users_listの結果などをまとめて保存"""
+        with self._lock:
+            for user in users:
+                self._store(user["id"], user)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+            }
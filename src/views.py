@@ -0,0 +1,861 @@
+"""
+モーダル・メッセージの組み立て
+スレッド版(bot.py)とasyncio版(async_bot.py)で共通に使う、Slack APIを呼ばない処理
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+from config import REMINDER_OPTIONS
+from epoch import from_epoch, to_epoch
+from recurrence import FREQUENCIES, order_key
+from reservation import Reservation
+from slot_bitmap import SLOT_MINUTES, SLOTS_PER_DAY, slot_start, free_runs, past_mask
+
+
+def format_reminder_text(minutes: int) -> str:
+    """リマインダー分数を表示用テキストに変換"""
+    for text, mins in REMINDER_OPTIONS.items():
+        if mins == minutes:
+            return text
+    return f"{minutes}分前"
+
+
+# キャッシュ用変数（起動時に一度だけ生成）
+_REMINDER_OPTIONS = None
+
+
+def generate_reminder_options():
+    """リマインダー選択用のオプションを生成 - キャッシュ"""
+    global _REMINDER_OPTIONS
+    if _REMINDER_OPTIONS is None:
+        _REMINDER_OPTIONS = []
+        for text, minutes in REMINDER_OPTIONS.items():
+            _REMINDER_OPTIONS.append({
+                "text": {"type": "plain_text", "text": text},
+                "value": str(minutes)
+            })
+    return _REMINDER_OPTIONS
+
+
+# 繰り返しの種類の表示名（recurrence.FREQUENCIESと同じキー）
+FREQUENCY_LABELS = {"daily": "毎日", "weekly": "毎週", "biweekly": "隔週"}
+
+
+def format_recurrence_text(frequency: str, until: Optional[date], count: Optional[int]) -> str:
+    """繰り返しの指定を表示用テキストに変換"""
+    limits = []
+    if until:
+        limits.append(f"{until.strftime('%Y/%m/%d')}まで")
+    if count:
+        limits.append(f"{count}回")
+    return f"{FREQUENCY_LABELS[frequency]}（{' / '.join(limits) or '終了日なし'}）"
+
+
+def reservation_id_text(r: Reservation) -> str:
+    """予約IDの表示（繰り返しの回はシリーズのIDにSを付ける）"""
+    if r.series_id is not None:
+        return f"S{r.series_id}"
+    return str(r.id)
+
+
+def strip_mention(text: str) -> str:
+    """Botへのメンション部分を除去（大文字小文字両対応）"""
+    return re.sub(r"<@[A-Za-z0-9]+>", "", text).strip()
+
+
+# ====================
+# ボタン付きメッセージ
+# ====================
+
+RESERVE_PROMPT_TEXT = "予約フォームを開くには下のボタンをクリックしてください"
+RESERVE_PROMPT_BLOCKS = [
+    {
+        "type": "section",
+        "text": {"type": "mrkdwn", "text": "会議室を予約するには、下のボタンをクリックしてください。"}
+    },
+    {
+        "type": "actions",
+        "elements": [
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "予約フォームを開く"},
+                "style": "primary",
+                "action_id": "open_reservation_modal"
+            }
+        ]
+    }
+]
+
+CANCEL_PROMPT_TEXT = "キャンセルする予約を選択してください"
+CANCEL_PROMPT_BLOCKS = [
+    {
+        "type": "section",
+        "text": {"type": "mrkdwn", "text": "キャンセルする予約を選択してください。"}
+    },
+    {
+        "type": "actions",
+        "elements": [
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "キャンセルフォームを開く"},
+                "style": "danger",
+                "action_id": "open_cancel_modal"
+            }
+        ]
+    }
+]
+
+NO_CANCELLABLE_TEXT = "キャンセルできる予約がありません。"
+
+
+# ====================
+# 予約モーダル
+# ====================
+
+# 繰り返しの選択肢（先頭は繰り返さない）
+_RECURRENCE_OPTIONS = [{"text": {"type": "plain_text", "text": "繰り返さない"}, "value": "none"}] + [
+    {"text": {"type": "plain_text", "text": FREQUENCY_LABELS[frequency]}, "value": frequency}
+    for frequency in FREQUENCIES
+]
+
+
+def build_reservation_modal(user_id: str) -> dict:
+    """予約モーダルを生成"""
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    return {
+        "type": "modal",
+        "callback_id": "reservation_modal",
+        "title": {"type": "plain_text", "text": "会議室予約"},
+        "submit": {"type": "plain_text", "text": "予約する"},
+        "close": {"type": "plain_text", "text": "キャンセル"},
+        "blocks": [
+            {
+                "type": "input",
+                "block_id": "channel_block",
+                "label": {"type": "plain_text", "text": "対象チャンネル"},
+                "element": {
+                    "type": "conversations_select",
+                    "action_id": "channel_select",
+                    "placeholder": {"type": "plain_text", "text": "チャンネルを選択"},
+                    "filter": {
+                        "include": ["public", "private"],
+                        "exclude_bot_users": True
+                    }
+                }
+            },
+            {
+                "type": "input",
+                "block_id": "date_block",
+                "label": {"type": "plain_text", "text": "予約日"},
+                "element": {
+                    "type": "datepicker",
+                    "action_id": "date_select",
+                    "initial_date": today,
+                    "placeholder": {"type": "plain_text", "text": "日付を選択"}
+                }
+            },
+            # 選択肢は開いた時点でapp.optionsのハンドラーから取得する（選択中の日付の空いている時間のみ）
+            {
+                "type": "input",
+                "block_id": "start_time_block",
+                "label": {"type": "plain_text", "text": "開始時間"},
+                "element": {
+                    "type": "external_select",
+                    "action_id": "start_time_select",
+                    "placeholder": {"type": "plain_text", "text": "開始時間を選択"},
+                    "min_query_length": 0
+                }
+            },
+            {
+                "type": "input",
+                "block_id": "end_time_block",
+                "label": {"type": "plain_text", "text": "終了時間"},
+                "element": {
+                    "type": "external_select",
+                    "action_id": "end_time_select",
+                    "placeholder": {"type": "plain_text", "text": "終了時間を選択"},
+                    "min_query_length": 0
+                }
+            },
+            {
+                "type": "input",
+                "block_id": "event_name_block",
+                "label": {"type": "plain_text", "text": "ミーティング名"},
+                "element": {
+                    "type": "plain_text_input",
+                    "action_id": "event_name_input",
+                    "placeholder": {"type": "plain_text", "text": "例: 週次定例会議"}
+                }
+            },
+            {
+                "type": "input",
+                "block_id": "reminder_block",
+                "label": {"type": "plain_text", "text": "リマインダー"},
+                "element": {
+                    "type": "static_select",
+                    "action_id": "reminder_select",
+                    "placeholder": {"type": "plain_text", "text": "通知タイミングを選択"},
+                    "options": generate_reminder_options(),
+                    "initial_option": {
+                        "text": {"type": "plain_text", "text": "15分前"},
+                        "value": "15"
+                    }
+                }
+            },
+            {
+                "type": "input",
+                "block_id": "recurrence_block",
+                "label": {"type": "plain_text", "text": "繰り返し"},
+                "element": {
+                    "type": "static_select",
+                    "action_id": "recurrence_select",
+                    "options": _RECURRENCE_OPTIONS,
+                    "initial_option": _RECURRENCE_OPTIONS[0]
+                }
+            },
+            {
+                "type": "input",
+                "block_id": "recurrence_until_block",
+                "optional": True,
+                "label": {"type": "plain_text", "text": "繰り返しの終了日"},
+                "element": {
+                    "type": "datepicker",
+                    "action_id": "recurrence_until_select",
+                    "placeholder": {"type": "plain_text", "text": "指定しなければ終了日なし"}
+                }
+            },
+            {
+                "type": "input",
+                "block_id": "recurrence_count_block",
+                "optional": True,
+                "label": {"type": "plain_text", "text": "繰り返しの回数"},
+                "element": {
+                    "type": "number_input",
+                    "action_id": "recurrence_count_input",
+                    "is_decimal_allowed": False,
+                    "min_value": "1",
+                    "placeholder": {"type": "plain_text", "text": "例: 10"}
+                }
+            }
+        ],
+        "private_metadata": user_id
+    }
+
+
+def parse_reservation_form(view: dict) -> dict:
+    """予約モーダルの入力値を取り出す"""
+    values = view["state"]["values"]
+
+    date_str = values["date_block"]["date_select"]["selected_date"]
+    start_time_str = values["start_time_block"]["start_time_select"]["selected_option"]["value"]
+    end_time_str = values["end_time_block"]["end_time_select"]["selected_option"]["value"]
+
+    # 繰り返しの指定（ない場合はfrequencyがNone）
+    recurrence = values.get("recurrence_block", {}).get("recurrence_select", {}).get("selected_option")
+    until = values.get("recurrence_until_block", {}).get("recurrence_until_select", {}).get("selected_date")
+    count = values.get("recurrence_count_block", {}).get("recurrence_count_input", {}).get("value")
+
+    return {
+        "channel_id": values["channel_block"]["channel_select"]["selected_conversation"],
+        "event_name": values["event_name_block"]["event_name_input"]["value"],
+        "reminder_minutes": int(values["reminder_block"]["reminder_select"]["selected_option"]["value"]),
+        # 日時のパース
+        "start_time": datetime.strptime(f"{date_str} {start_time_str}", "%Y-%m-%d %H:%M"),
+        "end_time": datetime.strptime(f"{date_str} {end_time_str}", "%Y-%m-%d %H:%M"),
+        "frequency": recurrence["value"] if recurrence and recurrence["value"] in FREQUENCIES else None,
+        "until": date.fromisoformat(until) if until else None,
+        "count": int(count) if count else None,
+    }
+
+
+def parse_time_options_request(body: dict, now: datetime) -> tuple[date, Optional[str], str]:
+    """時刻の選択肢の要求から (選択中の日付, 選択中の開始時刻, 入力中の文字列) を取り出す
+
+    日付を変更していなければモーダルの初期値と同じ今日とみなす。
+    """
+    values = body.get("view", {}).get("state", {}).get("values", {})
+    selected_date = values.get("date_block", {}).get("date_select", {}).get("selected_date")
+    start = values.get("start_time_block", {}).get("start_time_select", {}).get("selected_option")
+    day = date.fromisoformat(selected_date) if selected_date else now.date()
+    return day, start["value"] if start else None, body.get("value", "").strip()
+
+
+def _time_option(time_str: str) -> dict:
+    return {"text": {"type": "plain_text", "text": time_str}, "value": time_str}
+
+
+def build_start_time_options(day: date, busy: int) -> list[dict]:
+    """開始時刻の選択肢（埋まっている枠を除く、busyはその日の埋まっている枠のビット）"""
+    return [
+        _time_option(slot_start(day, slot).strftime("%H:%M"))
+        for slot in range(SLOTS_PER_DAY) if not busy >> slot & 1
+    ]
+
+
+def build_end_time_options(day: date, busy: int, start: Optional[str]) -> list[dict]:
+    """終了時刻の選択肢（開始時刻の指定があれば、そこから次の予約までの間のみ）"""
+    if start is None:
+        return [
+            _time_option(slot_start(day, slot + 1).strftime("%H:%M"))
+            for slot in range(SLOTS_PER_DAY) if not busy >> slot & 1
+        ]
+
+    starts = [slot_start(day, slot).strftime("%H:%M") for slot in range(SLOTS_PER_DAY)]
+    if start not in starts:
+        return []
+    first = last = starts.index(start)
+    while last < SLOTS_PER_DAY and not busy >> last & 1:
+        last += 1
+    return [_time_option(slot_start(day, end).strftime("%H:%M")) for end in range(first + 1, last + 1)]
+
+
+def filter_time_options(options: list[dict], day: date, now: datetime, query: str, end: bool = False) -> list[dict]:
+    """開始時刻を過ぎた枠（endなら過ぎた枠の終わり）と、入力中の文字列（「9」「13:3」など）に合わない時刻を除く"""
+    passed = past_mask(day, now).bit_length() + (1 if end else 0)
+    earliest = slot_start(day, passed).strftime("%H:%M")
+    query = query.replace("：", ":")
+    return [
+        o for o in options
+        if o["value"] >= earliest
+        and (not query or o["value"].startswith(query) or o["value"].lstrip("0").startswith(query))
+    ]
+
+
+def validate_reservation_times(start_dt: datetime, end_dt: datetime) -> dict:
+    """予約日時のバリデーション（エラーはblock_id -> メッセージ）"""
+    errors = {}
+
+    if end_dt <= start_dt:
+        errors["end_time_block"] = "終了時間は開始時間より後に設定してください"
+
+    if start_dt < datetime.now():
+        errors["date_block"] = "過去の日時は予約できません"
+
+    return errors
+
+
+def validate_recurrence(form: dict) -> dict:
+    """繰り返しの指定のバリデーション（エラーはblock_id -> メッセージ）"""
+    errors = {}
+
+    if not form["frequency"]:
+        if form["until"] or form["count"]:
+            errors["recurrence_block"] = "終了日・回数を指定する場合は繰り返しを選択してください"
+        return errors
+
+    if form["until"] and form["until"] < form["start_time"].date():
+        errors["recurrence_until_block"] = "終了日は予約日以降を指定してください"
+
+    if form["count"] is not None and form["count"] < 1:
+        errors["recurrence_count_block"] = "回数は1以上を指定してください"
+
+    return errors
+
+
+def conflict_error_text(conflict: Reservation) -> str:
+    """重複している予約のエラーメッセージを生成"""
+    return f"その時間帯は既に予約があります（{conflict.event_name} / {conflict.start_time:%H:%M}-{conflict.end_time:%H:%M}）"
+
+
+def reservation_created_message(
+    reservation_id: int,
+    user_name: str,
+    start_dt: datetime,
+    end_dt: datetime,
+    event_name: str,
+    reminder_minutes: int
+) -> str:
+    """予約完了メッセージを生成"""
+    return (
+        f"新しい予約が作成されました\n\n"
+        f"*予約ID:* {reservation_id}\n"
+        f"*予約者:* {user_name}\n"
+        f"*日時:* {start_dt.strftime('%Y/%m/%d %H:%M')} - {end_dt.strftime('%H:%M')}\n"
+        f"*ミーティング名:* {event_name}\n"
+        f"*リマインド:* {format_reminder_text(reminder_minutes)}"
+    )
+
+
+def series_conflict_error_text(conflict: Reservation) -> str:
+    """繰り返し予約のいずれかの回が重複している場合のエラーメッセージを生成"""
+    return f"{conflict.start_time.strftime('%Y/%m/%d')} の回が重なります: {conflict_error_text(conflict)}"
+
+
+def series_created_message(series: dict, until: Optional[date], count: Optional[int]) -> str:
+    """繰り返し予約の完了メッセージを生成"""
+    start = from_epoch(series["start_time"])
+    end = from_epoch(series["end_time"])
+    return (
+        f"新しい繰り返し予約が作成されました\n\n"
+        f"*予約ID:* S{series['id']}\n"
+        f"*予約者:* {series['user_name']}\n"
+        f"*初回:* {start.strftime('%Y/%m/%d %H:%M')} - {end.strftime('%H:%M')}\n"
+        f"*繰り返し:* {format_recurrence_text(series['frequency'], until, count)}\n"
+        f"*ミーティング名:* {series['event_name']}\n"
+        f"*リマインド:* {format_reminder_text(series['reminder_minutes'])}"
+    )
+
+
+# ====================
+# キャンセルモーダル
+# ====================
+
+# 選択肢の1ページの件数（Slackの上限100件のうち1件は「続きを表示」に使う）
+CANCEL_OPTIONS_PAGE = 99
+
+# 「続きを表示」の選択肢の値の接頭辞（後ろに前のページの最後の開始時刻|IDを付ける）
+_NEXT_PAGE_PREFIX = "next:"
+
+# 繰り返しの回の選択肢の値の接頭辞（後ろにシリーズID@回の開始時刻を付ける）
+_OCCURRENCE_PREFIX = "series:"
+
+
+def build_cancel_modal(user_id: str) -> dict:
+    """キャンセルモーダルを生成（予約の選択肢は開いた時点でapp.optionsのハンドラーから取得する）"""
+    return {
+        "type": "modal",
+        "callback_id": "cancel_modal",
+        "title": {"type": "plain_text", "text": "予約キャンセル"},
+        "submit": {"type": "plain_text", "text": "キャンセルする"},
+        "close": {"type": "plain_text", "text": "閉じる"},
+        "blocks": [
+            {
+                "type": "input",
+                "block_id": "reservation_block",
+                "label": {"type": "plain_text", "text": "キャンセルする予約を選択"},
+                "hint": {"type": "plain_text", "text": "日付（例: 1/15）やミーティング名を入力すると絞り込めます"},
+                "element": {
+                    "type": "external_select",
+                    "action_id": "reservation_select",
+                    "placeholder": {"type": "plain_text", "text": "予約を選択"},
+                    "min_query_length": 0
+                }
+            },
+            {
+                "type": "input",
+                "block_id": "cancel_scope_block",
+                "optional": True,
+                "label": {"type": "plain_text", "text": "繰り返し予約の場合"},
+                "element": {
+                    "type": "checkboxes",
+                    "action_id": "cancel_scope_select",
+                    "options": [
+                        {"text": {"type": "plain_text", "text": "この回以降もすべてキャンセルする"}, "value": "following"}
+                    ]
+                }
+            }
+        ],
+        "private_metadata": user_id
+    }
+
+
+def parse_cancel_options_request(body: dict) -> tuple[Optional[date], Optional[str], Optional[tuple[int, int]]]:
+    """予約の選択肢の要求から (開始日, ミーティング名, 続きを読む位置) を取り出す
+
+    入力中の文字列の先頭が日付ならその日の予約に絞り込み、残りはミーティング名の部分一致に使う。
+    「続きを表示」を選択中なら、そのページの最後の (start_time, id) から続きを読む。
+    """
+    text = body.get("value", "").strip()
+    match = re.match(rf"({_DATE_TEXT})\s*", text)
+    day = None
+    if match:
+        try:
+            day = _parse_date_text(match.group(1)).date()
+            text = text[match.end():]
+        except ValueError:
+            # 日付として正しくなければミーティング名として扱う
+            pass
+    name = text or None
+
+    after = None
+    values = body.get("view", {}).get("state", {}).get("values", {})
+    selected = values.get("reservation_block", {}).get("reservation_select", {}).get("selected_option")
+    if selected and selected["value"].startswith(_NEXT_PAGE_PREFIX):
+        start_time, reservation_id = selected["value"][len(_NEXT_PAGE_PREFIX):].rsplit("|", 1)
+        after = (from_epoch(int(start_time)), int(reservation_id))
+    return day, name, after
+
+
+def build_cancel_options(reservations: list[Reservation]) -> list[dict]:
+    """キャンセルする予約の選択肢（CANCEL_OPTIONS_PAGE件を超えていれば「続きを表示」を付ける）"""
+    options = []
+    for r in reservations[:CANCEL_OPTIONS_PAGE]:
+        label = f"{r.start_time.strftime('%m/%d %H:%M')} - {r.event_name}"
+        if r.series_id is not None:
+            label = f"{label}（{FREQUENCY_LABELS[r.frequency]}）"
+            value = f"{_OCCURRENCE_PREFIX}{r.series_id}@{to_epoch(r.start_time)}"
+        else:
+            value = str(r.id)
+        if len(label) > 75:
+            label = label[:72] + "..."
+        options.append({
+            "text": {"type": "plain_text", "text": label},
+            "value": value
+        })
+
+    if len(reservations) > CANCEL_OPTIONS_PAGE:
+        start_time, key = order_key(reservations[CANCEL_OPTIONS_PAGE - 1])
+        options.append({
+            "text": {"type": "plain_text", "text": "▼ 続きを表示（選択してからもう一度開いてください）"},
+            "value": f"{_NEXT_PAGE_PREFIX}{to_epoch(start_time)}|{key}"
+        })
+    return options
+
+
+def parse_cancel_form(view: dict) -> Optional[dict]:
+    """キャンセルモーダルの入力値を取り出す（「続きを表示」を選択したままならNone）
+
+    予約ならreservation_id、繰り返しの回ならseries_id・occurrence_start・following（その回以降もキャンセルするか）。
+    """
+    values = view["state"]["values"]
+    value = values["reservation_block"]["reservation_select"]["selected_option"]["value"]
+    if value.startswith(_NEXT_PAGE_PREFIX):
+        return None
+
+    if value.startswith(_OCCURRENCE_PREFIX):
+        series_id, start_time = value[len(_OCCURRENCE_PREFIX):].split("@", 1)
+        scope = values.get("cancel_scope_block", {}).get("cancel_scope_select", {}).get("selected_options") or []
+        return {
+            "reservation_id": None,
+            "series_id": int(series_id),
+            "occurrence_start": from_epoch(int(start_time)),
+            "following": any(o["value"] == "following" for o in scope),
+        }
+    return {"reservation_id": int(value), "series_id": None, "occurrence_start": None, "following": False}
+
+
+CANCEL_SELECT_TEXT = "キャンセルする予約を選択してください"
+CANCEL_NOT_ALLOWED_TEXT = "この予約はキャンセルできません"
+CANCEL_FAILED_TEXT = "予約のキャンセルに失敗しました。"
+
+
+def reservation_cancelled_message(deleted: Reservation, user_id: str, following: bool = False) -> str:
+    """キャンセル完了メッセージを生成（繰り返しの回ならその回のみか以降すべてかも表示）"""
+    message = (
+        f"予約がキャンセルされました\n\n"
+        f"*予約ID:* {reservation_id_text(deleted)}\n"
+        f"*キャンセル者:* <@{user_id}>\n"
+        f"*日時:* {deleted.start_time.strftime('%Y/%m/%d %H:%M')}\n"
+        f"*ミーティング名:* {deleted.event_name}"
+    )
+    if deleted.series_id is not None:
+        message += f"\n*対象:* {'この回以降の繰り返しすべて' if following else 'この回のみ'}"
+    return message
+
+
+# ====================
+# リマインダー
+# ====================
+
+def format_reminder_message(r: Reservation) -> str:
+    """リマインダーのメッセージを生成"""
+    return (
+        f"リマインダー: まもなく会議が始まります\n\n"
+        f"*ミーティング名:* {r.event_name}\n"
+        f"*時間:* {r.start_time.strftime('%Y/%m/%d %H:%M')}\n"
+        f"*予約者:* {r.user_name}"
+    )
+
+
+# ====================
+# 確認・ヘルプ
+# ====================
+
+# コマンドで指定する日付（2025/01/15・2025-01-15・1/15）
+_DATE_TEXT = r"\d{1,4}[/-]\d{1,2}[/-]\d{1,2}|\d{1,2}[/-]\d{1,2}"
+
+_WEEKDAYS = "月火水木金土日"
+
+
+def _parse_date_text(date_str: str) -> datetime:
+    """コマンドの日付を変換（年の省略時は今年）"""
+    date_str = date_str.replace("-", "/")
+    if date_str.count("/") == 1:
+        date_str = f"{datetime.now().year}/{date_str}"
+    date_parts = date_str.split("/")
+    return datetime(int(date_parts[0]), int(date_parts[1]), int(date_parts[2]))
+
+
+# 確認 [日付 | 日付-日付 | 今週]（続きの文字とは空白で区切る）
+_CHECK_PATTERN = re.compile(
+    rf"確認\s*(?:(?P<week>今週)|(?P<first>{_DATE_TEXT})(?:\s*[-~〜～]\s*(?P<last>{_DATE_TEXT}))?)?(?!\S)"
+)
+
+# 予約一覧を表示できる日数の上限
+CHECK_MAX_DAYS = 31
+
+CHECK_USAGE_TEXT = "使い方: `確認`（今日）、`確認 2025/01/15`、`確認 2025/01/13-2025/01/19`、`確認 今週`"
+
+# Slackの1メッセージのブロック数・sectionのテキストの文字数・メッセージ全体の文字数の上限
+_MAX_BLOCKS = 50
+_MAX_SECTION_TEXT = 3000
+_MAX_MESSAGE_TEXT = 40000
+
+
+def _parse_check_day(date_str: str) -> date:
+    """確認コマンドの日付を変換（存在しない日付なら使い方を添えたValueError）"""
+    try:
+        return _parse_date_text(date_str).date()
+    except ValueError:
+        raise ValueError(f"{date_str} は存在しない日付です。{CHECK_USAGE_TEXT}") from None
+
+
+def parse_check_command(text: str, now: datetime) -> tuple[date, date]:
+    """確認コマンドから (最初の日, 最後の日) を取り出す
+
+    指定がなければ今日、今週は月曜から日曜。日付として読めない続きの文字は無視する（従来どおり今日になる）。
+    """
+    match = _CHECK_PATTERN.match(text.strip())
+    today = now.date()
+    if match and match.group("week"):
+        first_day = today - timedelta(days=today.weekday())
+        last_day = first_day + timedelta(days=6)
+    elif match and match.group("first"):
+        first_day = _parse_check_day(match.group("first"))
+        last_day = _parse_check_day(match.group("last")) if match.group("last") else first_day
+    else:
+        first_day = last_day = today
+
+    if last_day < first_day:
+        raise ValueError("終了日は開始日以降を指定してください")
+    if (last_day - first_day).days + 1 > CHECK_MAX_DAYS:
+        raise ValueError(f"予約一覧は{CHECK_MAX_DAYS}日分まで表示できます")
+    return first_day, last_day
+
+
+def render_day_schedule(target_date: date, reservations: list[Reservation]) -> str:
+    """指定日の予約一覧メッセージを生成"""
+    if not reservations:
+        return f"{target_date.strftime('%Y/%m/%d')} の予約はありません。"
+
+    lines = [f"*{target_date.strftime('%Y/%m/%d')} の予約一覧*\n"]
+    for r in reservations:
+        lines.append(
+            f"*[ID: {reservation_id_text(r)}]* {r.start_time:%H:%M} - {r.end_time:%H:%M}\n"
+            f"  {r.event_name} / {r.user_name}"
+            f"{'（' + FREQUENCY_LABELS[r.frequency] + '）' if r.series_id is not None else ''}\n"
+            f"  対象: <#{r.channel_id}>"
+        )
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def _schedule_line(r: Reservation) -> str:
+    """期間の予約一覧の1行"""
+    frequency = f"（{FREQUENCY_LABELS[r.frequency]}）" if r.series_id is not None else ""
+    return (
+        f"`{r.start_time:%H:%M}-{r.end_time:%H:%M}` {r.event_name} / {r.user_name}{frequency}"
+        f"  <#{r.channel_id}>  ID: {reservation_id_text(r)}"
+    )
+
+
+def _day_texts(day: date, reservations: list[Reservation]) -> Iterator[str]:
+    """1日分のsectionのテキスト（sectionの文字数の上限を超える日は複数に分ける）"""
+    text = f"*{_format_day(day, year=False)}*"
+    if not reservations:
+        yield f"{text}  予約なし"
+        return
+    for r in reservations:
+        line = _schedule_line(r)
+        if len(text) + 1 + len(line) > _MAX_SECTION_TEXT:
+            yield text
+            text = line
+        else:
+            text += "\n" + line
+    yield text
+
+
+def render_range_schedule(
+    first_day: date, last_day: date, days: Iterable[tuple[date, list[Reservation]]]
+) -> Iterator[dict]:
+    """期間の予約一覧をBlock Kitのメッセージ（text・blocks）として日付順に生成
+
+    日ごとにsectionを作り、ブロック数・文字数がSlackの1メッセージの上限を超えるところで次のメッセージに分ける。
+    """
+    title = f"{_format_day(first_day)} 〜 {_format_day(last_day)} の予約一覧"
+    text = title
+    blocks = [{"type": "header", "text": {"type": "plain_text", "text": title}}]
+    size = len(title)
+    total = 0
+    for day, reservations in days:
+        total += len(reservations)
+        for section in _day_texts(day, reservations):
+            if len(blocks) >= _MAX_BLOCKS or size + len(section) > _MAX_MESSAGE_TEXT:
+                yield {"text": text, "blocks": blocks}
+                text = f"{title}（続き）"
+                blocks, size = [], 0
+            blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": section}})
+            size += len(section)
+
+    if len(blocks) >= _MAX_BLOCKS:
+        yield {"text": text, "blocks": blocks}
+        text, blocks = f"{title}（続き）", []
+    blocks.append({"type": "context", "elements": [{"type": "mrkdwn", "text": f"{total}件の予約"}]})
+    yield {"text": text, "blocks": blocks}
+
+
+def check_error_message(error: Exception) -> str:
+    if isinstance(error, ValueError):
+        return str(error)
+    return f"予約の確認中にエラーが発生しました: {str(error)}"
+
+
+# ====================
+# 空き枠
+# ====================
+
+# 空き枠の一覧を表示できる日数・N時間の空きを探せる日数の上限
+FREE_LIST_MAX_DAYS = 31
+FREE_SEARCH_MAX_DAYS = 366
+
+# 空き [日付 | 日付-日付 | 今週] [N時間 | N時間半 | N分]
+_FREE_PATTERN = re.compile(
+    rf"空き\s*(?:(?P<week>今週)|(?P<first>{_DATE_TEXT})(?:\s*[-~〜～]\s*(?P<last>{_DATE_TEXT}))?)?"
+    r"\s*(?:(?P<hours>\d+(?:\.\d+)?)時間(?P<half>半)?|(?P<minutes>\d+)分)?"
+)
+
+FREE_USAGE_TEXT = (
+    "使い方: `空き`（今日）、`空き 2025/01/15`、`空き 1/13-1/19`、`空き 今週`（今日から日曜まで）、"
+    "`空き 2時間`（今日から1週間で2時間空いている最初の枠）、`空き 1/13-1/31 90分`"
+)
+
+
+def _parse_free_day(date_str: str) -> date:
+    """空きコマンドの日付を変換（存在しない日付なら使い方を添えたValueError）"""
+    try:
+        return _parse_date_text(date_str).date()
+    except ValueError:
+        raise ValueError(f"{date_str} は存在しない日付です。{FREE_USAGE_TEXT}") from None
+
+
+def parse_free_command(text: str, now: datetime) -> tuple[date, date, Optional[int]]:
+    """空きコマンドから (最初の日, 最後の日, 探す空きの長さ(分)) を取り出す
+
+    日付の指定がなければ今日（長さを指定した場合は今日から1週間）。今週は確認と違い今日から日曜まで（過ぎた日は予約できないため）。
+    """
+    match = _FREE_PATTERN.fullmatch(text.strip())
+    if not match:
+        raise ValueError(FREE_USAGE_TEXT)
+
+    minutes = None
+    if match.group("hours"):
+        minutes = round(float(match.group("hours")) * 60) + (30 if match.group("half") else 0)
+    elif match.group("minutes"):
+        minutes = int(match.group("minutes"))
+    if minutes is not None and not 0 < minutes <= SLOT_MINUTES * SLOTS_PER_DAY:
+        raise ValueError(f"空きの長さは{SLOT_MINUTES}分から{SLOT_MINUTES * SLOTS_PER_DAY // 60}時間までで指定してください")
+
+    today = now.date()
+    if match.group("week"):
+        first_day, last_day = today, today + timedelta(days=6 - today.weekday())
+    elif match.group("first"):
+        first_day = _parse_free_day(match.group("first"))
+        last_day = _parse_free_day(match.group("last")) if match.group("last") else first_day
+    else:
+        first_day = today
+        last_day = today + timedelta(days=6) if minutes else today
+
+    if last_day < first_day:
+        raise ValueError("終了日は開始日以降を指定してください")
+    days = (last_day - first_day).days + 1
+    if minutes is None and days > FREE_LIST_MAX_DAYS:
+        raise ValueError(f"空き枠の一覧は{FREE_LIST_MAX_DAYS}日分まで表示できます（長さを指定すると{FREE_SEARCH_MAX_DAYS}日分まで探せます）")
+    if days > FREE_SEARCH_MAX_DAYS:
+        raise ValueError(f"空きを探せるのは{FREE_SEARCH_MAX_DAYS}日分までです")
+
+    return first_day, last_day, minutes
+
+
+def _format_day(day: date, year: bool = True) -> str:
+    return f"{day.strftime('%Y/%m/%d' if year else '%m/%d')} ({_WEEKDAYS[day.weekday()]})"
+
+
+def _format_minutes(minutes: int) -> str:
+    hours, rest = divmod(minutes, 60)
+    if not hours:
+        return f"{rest}分"
+    return f"{hours}時間{rest}分" if rest else f"{hours}時間"
+
+
+def _format_runs(day: date, free: int) -> str:
+    return ", ".join(
+        f"{slot_start(day, first).strftime('%H:%M')}-{slot_start(day, last).strftime('%H:%M')}"
+        for first, last in free_runs(free)
+    )
+
+
+def render_free_slots(first_day: date, free: list[int]) -> str:
+    """空き枠の一覧メッセージを生成（freeは各日の空き枠のビット）"""
+    if len(free) == 1:
+        header = f"*{_format_day(first_day)} の空き*"
+        if not free[0]:
+            return f"{header}\n空いている枠はありません。"
+        return f"{header}\n{_format_runs(first_day, free[0])}"
+
+    last_day = first_day + timedelta(days=len(free) - 1)
+    lines = [f"*{_format_day(first_day)} 〜 {_format_day(last_day)} の空き*"]
+    for i, bits in enumerate(free):
+        day = first_day + timedelta(days=i)
+        lines.append(f"{_format_day(day, year=False)}  {_format_runs(day, bits) if bits else '空きなし'}")
+    return "\n".join(lines)
+
+
+def render_free_gap(first_day: date, last_day: date, minutes: int, gap: Optional[tuple[date, int, int]]) -> str:
+    """N分以上空いている最初の枠のメッセージを生成（gapは (日付, 最初の枠, 空きが続く最後の枠+1)）"""
+    length = _format_minutes(minutes)
+    if gap is None:
+        return f"{_format_day(first_day)} 〜 {_format_day(last_day)} に{length}空いている枠はありません。"
+
+    day, first, last = gap
+    start = slot_start(day, first)
+    end = start + timedelta(minutes=minutes)
+    until = slot_start(day, last)
+    message = f"{length}空いている最初の枠: *{_format_day(day)} {start.strftime('%H:%M')}-{end.strftime('%H:%M')}*"
+    if until > end:
+        message += f"（{until.strftime('%H:%M')}まで空いています）"
+    return message
+
+
+def free_error_message(error: Exception) -> str:
+    if isinstance(error, ValueError):
+        return str(error)
+    return f"空き枠の確認中にエラーが発生しました: {str(error)}"
+
+
+HELP_TEXT = (
+    "*会議室予約Bot ヘルプ*\n\n"
+    "*予約する:*\n"
+    "`@reserve-bot 予約` → ボタンをクリックしてフォームを開く（毎日・毎週・隔週の繰り返しも指定可）\n\n"
+    "*予約をキャンセル:*\n"
+    "`@reserve-bot キャンセル` → 自分の予約一覧から選択（繰り返し予約は1回ずつ、またはその回以降をまとめて）\n\n"
+    "*予約を確認:*\n"
+    "`@reserve-bot 確認` (今日の予約)\n"
+    "`@reserve-bot 確認 2025/01/15` (指定日の予約)\n"
+    "`@reserve-bot 確認 1/13-1/19` (期間の予約を日ごとに)\n"
+    "`@reserve-bot 確認 今週` (今週の月曜から日曜の予約)\n\n"
+    "*空き枠を探す:*\n"
+    "`@reserve-bot 空き` (今日の空き枠)\n"
+    "`@reserve-bot 空き 1/13-1/19` (期間の空き枠)\n"
+    "`@reserve-bot 空き 今週` (今日から今週の日曜までの空き枠。確認と違い、過ぎた日は含めない)\n"
+    "`@reserve-bot 空き 2時間` (今日から1週間で2時間空いている最初の枠)\n\n"
+    "*ヘルプ:*\n"
+    "`@reserve-bot ヘルプ`"
+)
+
+
+# ====================
+# 混雑時
+# ====================
+
+BUSY_TEXT = "ただいま混み合っています。しばらくしてからもう一度お試しください。"
+
+
+def busy_view_errors(view: dict) -> Optional[dict]:
+    """モーダルの送信を断るときのエラー表示（最初の入力欄に出す。入力欄がなければNone）"""
+    for block in view.get("blocks", []):
+        if block.get("type") == "input":
+            return {block["block_id"]: BUSY_TEXT}
+    return None
@@ -0,0 +1,29 @@
+"""
+テスト共通の設定
+src/のモジュールをそのままimportし、DBはテストごとに一時ディレクトリのファイルを使う
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+# configはimport時に読むため、どのテストより先に一時ディレクトリを指しておく
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="reserve-bot-tests-"), "reservations.db")
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """空のDBファイルで初期化したdatabaseモジュール（spawnしたプロセスにも環境変数で同じファイルを渡す）"""
+    import database
+
+    path = str(tmp_path / "reservations.db")
+    monkeypatch.setenv("DATABASE_PATH", path)
+    monkeypatch.setattr(database, "DATABASE_PATH", path)
+    database.close_connections()
+    database.init_db()
+    yield database
+    database.close_connections()
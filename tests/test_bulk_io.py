@@ -0,0 +1,209 @@
+"""
+予約の一括読み込み・書き出し（bulk_io）で、ファイル内・既存の予約との重なりがあれば何も挿入しないこと、
+CSV・iCalendarに書き出して読み込むと同じ予約に戻ること、TRIGGER・DURATIONの解釈、
+内容行の折り返し（_ics_fold）、検証の後に作られた予約と重なる行で一括挿入が止まることを確かめる
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from bulk_io import (
+    _ics_fold,
+    _parse_duration,
+    _records,
+    export_file,
+    import_file,
+    validate_file,
+)
+from epoch import to_epoch
+
+DEFAULTS = {"user_id": "U1", "user_name": "user1", "channel_id": "C1", "reminder_minutes": 15}
+START = datetime(2030, 1, 15, 10, 0)
+
+
+def write_file(tmp_path, name: str, text: str) -> str:
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8", newline="")
+    return str(path)
+
+
+def reservation_count(db) -> int:
+    return db.get_connection().execute("SELECT COUNT(*) FROM reservations").fetchone()[0]
+
+
+def stored(db) -> list[tuple]:
+    return [
+        (r.user_id, r.user_name, r.channel_id, r.event_name, r.start_time, r.end_time, r.reminder_minutes)
+        for r in db.iter_reservations_for_export()
+    ]
+
+
+# ====================
+# 重なり
+# ====================
+
+def test_conflict_within_the_file_is_rejected(db, tmp_path):
+    path = write_file(tmp_path, "overlap.csv", (
+        "event_name,start_time,end_time\n"
+        "a,2030-01-15 10:00,2030-01-15 11:00\n"
+        "b,2030-01-15 11:00,2030-01-15 12:00\n"
+        "c,2030-01-15 11:30,2030-01-15 12:30\n"
+    ))
+    count, errors, error_count = validate_file(path, "csv", DEFAULTS)
+    assert (count, error_count) == (3, 1)
+    assert errors == ["4行目: 3行目と重なっています"]
+
+    with pytest.raises(ValueError, match="読み込めない行・重なりがあります"):
+        import_file(path, "csv", DEFAULTS)
+    assert reservation_count(db) == 0
+
+
+def test_conflict_with_the_database_is_rejected(db, tmp_path):
+    existing = db.create_reservation("U2", "user2", "C1", "existing", START, START + timedelta(hours=1), 15)
+    path = write_file(tmp_path, "overlap.csv", (
+        "event_name,start_time,end_time\n"
+        "before,2030-01-15 09:00,2030-01-15 10:00\n"
+        "during,2030-01-15 10:30,2030-01-15 11:30\n"
+    ))
+    _, errors, error_count = validate_file(path, "csv", DEFAULTS)
+    assert error_count == 1
+    assert errors[0].startswith(f"3行目: 予約 ID {existing}（2030/01/15 10:00-11:00 existing）")
+
+    with pytest.raises(ValueError):
+        import_file(path, "csv", DEFAULTS)
+    assert reservation_count(db) == 1
+
+
+def test_conflict_with_a_series_is_rejected(db, tmp_path):
+    series, _ = db.reserve_series_if_free("U2", "user2", "C1", "daily", START, START + timedelta(hours=1), "daily")
+    path = write_file(tmp_path, "overlap.csv", (
+        "event_name,start_time,end_time\n"
+        "a,2030-01-17 10:30,2030-01-17 11:30\n"
+    ))
+    _, errors, _ = validate_file(path, "csv", DEFAULTS)
+    assert errors == [f"2行目: 繰り返し予約 S{series['id']} の 2030/01/17 10:00 の回と重なっています"]
+
+
+# ====================
+# 書き出しと読み込み
+# ====================
+
+@pytest.mark.parametrize("fmt", ["csv", "ics"])
+def test_round_trip(db, tmp_path, fmt):
+    names = [
+        "定例",
+        "a, b; c\\d",
+        "1行目\n2行目",
+        "とても長いミーティング名" * 10,
+    ]
+    for i, name in enumerate(names):
+        start = START + timedelta(days=i)
+        db.create_reservation(f"U{i}", f"山田{i}", "C1", name, start, start + timedelta(minutes=45 + i), 5 * i)
+    before = stored(db)
+
+    path = str(tmp_path / f"reservations.{fmt}")
+    assert export_file(path, fmt) == len(names)
+    conn = db.get_connection()
+    with conn:
+        conn.execute("DELETE FROM reservations")
+
+    assert import_file(path, fmt, {"reminder_minutes": 15}, chunk_size=3) == len(names)
+    assert stored(db) == before
+
+
+# ====================
+# iCalendar
+# ====================
+
+@pytest.mark.parametrize("value, expected", [
+    ("PT15M", timedelta(minutes=15)),
+    ("-PT1H30M", -timedelta(hours=1, minutes=30)),
+    ("P1DT2H", timedelta(days=1, hours=2)),
+    ("P1W", timedelta(weeks=1)),
+    ("+PT45S", timedelta(seconds=45)),
+    ("-PT0M", timedelta(0)),
+])
+def test_parse_duration(value, expected):
+    assert _parse_duration(value) == expected
+
+
+@pytest.mark.parametrize("value", ["P", "PT", "1H", "PT1.5H", ""])
+def test_invalid_duration(value):
+    with pytest.raises(ValueError, match="期間を読み取れません"):
+        _parse_duration(value)
+
+
+def vevent(*lines: str) -> str:
+    return "\r\n".join((
+        "BEGIN:VEVENT", "SUMMARY:meeting", "DTSTART:20300115T100000", *lines, "END:VEVENT",
+    )) + "\r\n"
+
+
+def alarm(trigger: str) -> str:
+    return f"BEGIN:VALARM\r\nACTION:DISPLAY\r\n{trigger}\r\nEND:VALARM"
+
+
+def test_trigger_and_duration(tmp_path):
+    path = write_file(tmp_path, "events.ics", "BEGIN:VCALENDAR\r\n" + "".join((
+        vevent("DURATION:PT1H30M", alarm("TRIGGER:-PT1H")),
+        vevent("DURATION:P1D", alarm("TRIGGER;RELATED=START:-P1D")),
+        # 終了からのTRIGGERは使わず、次のVALARMか既定の分数
+        vevent("DTEND:20300115T110000", alarm("TRIGGER;RELATED=END:-PT5M"), alarm("TRIGGER:-PT10M")),
+        vevent("DTEND:20300115T110000", alarm("TRIGGER;RELATED=END:-PT5M")),
+        vevent("DTEND:20300115T110000"),
+        vevent("DURATION:PT30M", alarm("TRIGGER:PT5M")),
+        vevent("DURATION:-PT30M"),
+    )) + "END:VCALENDAR\r\n")
+
+    rows = [row for _, row in _records(path, "ics", DEFAULTS)]
+    start = to_epoch(START)
+    assert [row[5:7] for row in rows[:5]] == [
+        (start + 5400, 60),
+        (start + 86400, 1440),
+        (start + 3600, 10),
+        (start + 3600, 15),
+        (start + 3600, 15),
+    ]
+    assert str(rows[5]) == "リマインダーは開始前にしてください"
+    assert str(rows[6]) == "終了時刻は開始時刻より後にしてください"
+
+
+@pytest.mark.parametrize("content", [
+    "SUMMARY:" + "a" * 67,
+    "SUMMARY:" + "a" * 200,
+    "SUMMARY:" + "会議" * 40,
+    "SUMMARY:a" + "予約😀" * 30,
+])
+def test_ics_fold(content):
+    folded = _ics_fold(content)
+    assert folded.endswith("\r\n")
+    lines = folded[:-2].split("\r\n")
+    assert all(len(line.encode()) <= 75 for line in lines)
+    assert all(line.startswith(" ") for line in lines[1:])
+    # 各行は次の文字が入らないところまで詰める
+    assert all(len(line.encode()) + len(next_line[1].encode()) > 75 for line, next_line in zip(lines, lines[1:]))
+    assert lines[0] + "".join(line[1:] for line in lines[1:]) == content
+
+
+# ====================
+# 検証の後の書き込み
+# ====================
+
+def test_insert_stops_at_a_reservation_created_after_validation(db, tmp_path):
+    path = write_file(tmp_path, "reservations.csv", "event_name,start_time,end_time\n" + "".join(
+        f"meeting {i},{START + timedelta(days=i):%Y-%m-%d %H:%M},{START + timedelta(days=i, hours=1):%Y-%m-%d %H:%M}\n"
+        for i in range(5)
+    ))
+    after_seq = db.get_last_change_seq()
+    assert validate_file(path, "csv", DEFAULTS)[2] == 0
+
+    # 検証の後に他から4件目と重なる予約が作られる
+    other = db.create_reservation(
+        "U2", "user2", "C1", "other", START + timedelta(days=3), START + timedelta(days=3, minutes=30), 15
+    )
+    rows = (row for _, row in _records(path, "csv", DEFAULTS))
+    with pytest.raises(ValueError, match=f"5行目が読み込み中に作られた予約 ID {other} と重なっています（2件は読み込み済み）"):
+        db.bulk_insert_reservations(rows, 2, after_seq)
+
+    # 重なりのない最初のトランザクションの分だけ残る
+    assert [r[3] for r in stored(db)] == ["meeting 0", "meeting 1", "other"]
@@ -0,0 +1,127 @@
+"""
+確認コマンドの解釈（parse_check_command）と、期間の予約一覧（render_range_schedule）が
+Slackの1メッセージの上限（ブロック数・sectionの文字数・メッセージ全体の文字数）で分かれることを確かめる
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import views
+from reservation import Reservation
+from views import CHECK_USAGE_TEXT, check_error_message, parse_check_command, render_range_schedule
+
+# 水曜日
+NOW = datetime(2025, 1, 15, 10, 0)
+TODAY = NOW.date()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("確認", (TODAY, TODAY)),
+    ("確認 2025/02/03", (date(2025, 2, 3), date(2025, 2, 3))),
+    ("確認 2025/01/13-2025/01/19", (date(2025, 1, 13), date(2025, 1, 19))),
+    ("確認 2025/01/13 〜 2025/01/19", (date(2025, 1, 13), date(2025, 1, 19))),
+    ("確認 今週", (date(2025, 1, 13), date(2025, 1, 19))),
+    ("確認今週", (date(2025, 1, 13), date(2025, 1, 19))),
+    # 日付として読めない続きは無視して今日
+    ("確認 明日", (TODAY, TODAY)),
+    ("確認 予定を見せて", (TODAY, TODAY)),
+    ("確認 2025/01/15abc", (TODAY, TODAY)),
+    ("確認 今週末", (TODAY, TODAY)),
+    ("確認してください", (TODAY, TODAY)),
+])
+def test_parse_check_command(text, expected):
+    assert parse_check_command(text, NOW) == expected
+
+
+@pytest.mark.parametrize("text, fragment", [
+    ("確認 2025/02/30", "存在しない日付です"),
+    ("確認 2025/01/10-2025/13/01", "存在しない日付です"),
+    ("確認 2025/01/19-2025/01/13", "終了日は開始日以降"),
+    ("確認 2025/01/01-2025/02/15", "31日分まで"),
+])
+def test_invalid_command_is_explained(text, fragment):
+    with pytest.raises(ValueError) as error:
+        parse_check_command(text, NOW)
+    message = check_error_message(error.value)
+    assert fragment in message
+    if "存在しない" in fragment:
+        assert message.endswith(CHECK_USAGE_TEXT)
+
+
+def reservations_for(day: date, count: int, name_length: int = 10) -> list[Reservation]:
+    start = datetime.combine(day, datetime.min.time()).replace(hour=7)
+    return [
+        Reservation(
+            day.toordinal() * 1000 + i, f"{i:04d}" + "x" * (name_length - 4),
+            start + timedelta(minutes=i), start + timedelta(minutes=i + 30), "U1", "user1", "C1", 15
+        )
+        for i in range(count)
+    ]
+
+
+def render(days: list[tuple[date, list[Reservation]]]) -> list[dict]:
+    return list(render_range_schedule(days[0][0], days[-1][0], days))
+
+
+def sections(messages: list[dict]) -> list[str]:
+    return [b["text"]["text"] for m in messages for b in m["blocks"] if b["type"] == "section"]
+
+
+def assert_within_limits(messages: list[dict]):
+    for m in messages:
+        texts = [b["text"]["text"] for b in m["blocks"] if b["type"] == "section"]
+        assert len(m["blocks"]) <= views._MAX_BLOCKS
+        assert all(len(t) <= views._MAX_SECTION_TEXT for t in texts)
+        assert sum(len(t) for t in texts) <= views._MAX_MESSAGE_TEXT
+    assert messages[0]["blocks"][0]["type"] == "header"
+    assert all(m["text"].endswith("（続き）") for m in messages[1:])
+    # 件数の表示は最後のメッセージの末尾に1つだけ
+    contexts = [b for m in messages for b in m["blocks"] if b["type"] == "context"]
+    assert contexts == [messages[-1]["blocks"][-1]]
+
+
+def test_days_are_split_by_block_count():
+    first = date(2030, 1, 1)
+    days = [(first + timedelta(days=i), reservations_for(first + timedelta(days=i), 1)) for i in range(120)]
+    messages = render(days)
+
+    assert_within_limits(messages)
+    assert [len(m["blocks"]) for m in messages] == [50, 50, 22]
+    assert len(sections(messages)) == 120
+    assert messages[-1]["blocks"][-1]["elements"][0]["text"] == "120件の予約"
+
+
+def test_count_moves_to_a_new_message_when_the_last_one_is_full():
+    first = date(2030, 1, 1)
+    # 見出し + 49日で50ブロックちょうど
+    days = [(first + timedelta(days=i), []) for i in range(49)]
+    messages = render(days)
+
+    assert_within_limits(messages)
+    assert [len(m["blocks"]) for m in messages] == [50, 1]
+    assert messages[1]["blocks"][0]["elements"][0]["text"] == "0件の予約"
+
+
+def test_long_day_is_split_into_sections():
+    day = date(2030, 1, 1)
+    reservations = reservations_for(day, 100, name_length=80)
+    messages = render([(day, reservations)])
+
+    assert_within_limits(messages)
+    texts = sections(messages)
+    assert len(texts) > 1
+    lines = "\n".join(texts).split("\n")
+    assert lines[0] == "*01/01 (火)*"
+    assert [line.split("` ", 1)[1].split(" /")[0] for line in lines[1:]] == [r.event_name for r in reservations]
+
+
+def test_messages_are_split_by_total_text():
+    first = date(2030, 1, 1)
+    # 1日に約2900文字のsectionが1つ: 14日目で40000文字を超える
+    days = [(first + timedelta(days=i), reservations_for(first + timedelta(days=i), 20, name_length=100)) for i in range(30)]
+    messages = render(days)
+
+    assert_within_limits(messages)
+    assert len(messages) >= 3
+    assert all(len(m["blocks"]) < views._MAX_BLOCKS for m in messages)
+    assert sum(t.count("\n") for t in sections(messages)) == 30 * 20
@@ -0,0 +1,175 @@
+"""
+イベント・操作の重複排除（EventDeduplicator）のTTL・LRU、DBで共有する判定（claim_event）と、
+混雑で断ったリクエストが処理済みとして残らず、再送を処理できることを確かめる
+"""
+import threading
+
+import pytest
+
+import config
+import event_dedup
+from event_dedup import EventDeduplicator, event_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(event_dedup.time, "monotonic", fake)
+    return fake
+
+
+def test_key_expires_after_ttl(clock):
+    dedup = EventDeduplicator(ttl=60, maxsize=100)
+    assert dedup.claim("event:1")
+    assert not dedup.claim("event:1")
+
+    clock.now += 59
+    assert not dedup.claim("event:1")
+    clock.now += 1
+    assert dedup.claim("event:1")
+    assert dedup.stats() == {"size": 1, "claimed": 2, "dropped": 2}
+
+
+def test_expired_keys_are_dropped_from_the_front(clock):
+    dedup = EventDeduplicator(ttl=60, maxsize=100)
+    for i in range(10):
+        dedup.claim(f"event:{i}")
+        clock.now += 10
+
+    # 最初の5件（50秒より前に受け取ったもの）だけが期限切れ
+    assert dedup.claim("event:new")
+    assert dedup.stats()["size"] == 6
+    assert not dedup.claim("event:9")
+    assert dedup.claim("event:0")
+
+
+def test_oldest_key_is_evicted_when_full(clock):
+    dedup = EventDeduplicator(ttl=60, maxsize=3)
+    for key in ("a", "b", "c", "d"):
+        assert dedup.claim(key)
+
+    assert dedup.stats()["size"] == 3
+    assert not dedup.claim("d")
+    assert not dedup.claim("b")
+    # 溢れて忘れたキーは再び処理する
+    assert dedup.claim("a")
+
+
+def test_shared_claim_across_processes(db):
+    # 別々のプロセスのメモリを2つのインスタンスで表す
+    first, second = EventDeduplicator(60, 100), EventDeduplicator(60, 100)
+    assert first.claim("event:1", db.claim_event)
+    assert not second.claim("event:1", db.claim_event)
+    assert second.stats()["dropped"] == 1
+
+    # 期限の切れたキーは次の記録のときに消え、再び処理できる
+    assert first.claim("event:2", lambda key, ttl: db.claim_event(key, -1))
+    assert EventDeduplicator(60, 100).claim("event:2", db.claim_event)
+
+
+def test_shared_claim_failure_processes_the_event():
+    def broken(key, ttl):
+        raise RuntimeError("database is locked")
+
+    dedup = EventDeduplicator(60, 100)
+    assert dedup.claim("event:1", broken)
+    # メモリには覚えているため、同じプロセスへの再送は落とす
+    assert not dedup.claim("event:1", broken)
+
+
+def test_release_forgets_the_key(db):
+    dedup = EventDeduplicator(60, 100)
+    assert dedup.claim("event:1", db.claim_event)
+    dedup.release("event:1", db.release_event)
+
+    assert EventDeduplicator(60, 100).claim("event:1", db.claim_event)
+    dedup.release("event:1")
+    assert dedup.claim("event:1")
+
+
+def test_event_key():
+    assert event_key({"event_id": "Ev1", "trigger_id": "t"}) == "event:Ev1"
+    assert event_key({"type": "view_submission", "trigger_id": "t1"}) == "trigger:t1"
+    assert event_key({"type": "block_actions", "view": {"id": "V1"}}) == "view:V1"
+    assert event_key({"type": "block_suggestion", "trigger_id": "t1"}) is None
+    assert event_key({"type": "block_actions"}) is None
+
+
+# ====================
+# Botのミドルウェア
+# ====================
+
+@pytest.fixture
+def bot_app(db, monkeypatch):
+    """Slack APIを呼ばずに返す（auth.testとchat.postMessageを記録する）bot.py"""
+    from slack_sdk.web.client import WebClient
+    from slack_sdk.web.slack_response import SlackResponse
+
+    posted = []
+    posted_event = threading.Event()
+
+    def api_call(client, api_method, **kwargs):
+        if api_method == "chat.postMessage":
+            posted.append(kwargs.get("json") or kwargs.get("params"))
+            posted_event.set()
+        data = {"ok": True, "user_id": "UBOT", "bot_id": "BBOT", "team_id": "T1"}
+        return SlackResponse(
+            client=client, http_verb="POST", api_url=api_method, req_args={}, data=data, headers={}, status_code=200
+        )
+
+    monkeypatch.setattr(WebClient, "api_call", api_call)
+    monkeypatch.setattr(config, "SLACK_BOT_TOKEN", "xoxb-test")
+    monkeypatch.setattr(config, "SLACK_SIGNING_SECRET", "test")
+    import bot
+
+    monkeypatch.setattr(bot, "event_dedup", EventDeduplicator(60, 100))
+    return bot, posted, posted_event
+
+
+def mention(event_id: str) -> dict:
+    return {
+        "type": "event_callback", "team_id": "T1", "api_app_id": "A1", "event_id": event_id,
+        "event": {
+            "type": "app_mention", "user": "U1", "channel": "C1", "text": "<@UBOT> ヘルプ",
+            "ts": "1.0", "event_ts": "1.0",
+        },
+    }
+
+
+def dispatch(bot, body: dict):
+    from slack_bolt.request import BoltRequest
+
+    return bot.app.dispatch(BoltRequest(body=body, mode="socket_mode"))
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_shed_request_is_not_marked_processed(bot_app, db, monkeypatch, shared):
+    bot, posted, posted_event = bot_app
+    monkeypatch.setattr(bot, "EVENT_DEDUP_SHARED", shared)
+    body = mention(f"Ev-shed-{shared}")
+    key = event_key(body)
+
+    busy = True
+    accepts = bot.listener_executor.accepts
+    monkeypatch.setattr(bot.listener_executor, "accepts", lambda priority: not busy and accepts(priority))
+    assert dispatch(bot, body).status == 200
+    assert db.get_outbox_stats()["pending"] == 1  # 混雑中の通知
+    assert bot.event_dedup.stats()["size"] == 0
+    assert db.get_connection().execute("SELECT COUNT(*) FROM processed_events").fetchone()[0] == 0
+
+    # 空いてから届いた再送は処理する
+    busy = False
+    assert dispatch(bot, body).status == 200
+    assert posted_event.wait(10)
+    assert len(posted) == 1
+
+    # 処理した後の再送は落とす
+    assert not bot.event_dedup.claim(key)
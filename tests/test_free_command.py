@@ -0,0 +1,51 @@
+"""
+空きコマンドの解釈（parse_free_command）と、誤った指定のときに返すメッセージを確かめる
+"""
+from datetime import date, datetime
+
+import pytest
+
+from views import FREE_USAGE_TEXT, free_error_message, parse_free_command
+
+# 水曜日
+NOW = datetime(2025, 1, 15, 10, 0)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("空き", (date(2025, 1, 15), date(2025, 1, 15), None)),
+    ("空き 2025/02/03", (date(2025, 2, 3), date(2025, 2, 3), None)),
+    ("空き 2025-02-03", (date(2025, 2, 3), date(2025, 2, 3), None)),
+    ("空き 2025/01/13-2025/01/19", (date(2025, 1, 13), date(2025, 1, 19), None)),
+    ("空き 今週", (date(2025, 1, 15), date(2025, 1, 19), None)),
+    ("空き 2時間", (date(2025, 1, 15), date(2025, 1, 21), 120)),
+    ("空き 1.5時間", (date(2025, 1, 15), date(2025, 1, 21), 90)),
+    ("空き 1時間半", (date(2025, 1, 15), date(2025, 1, 21), 90)),
+    ("空き 2025/01/13-2025/01/31 90分", (date(2025, 1, 13), date(2025, 1, 31), 90)),
+])
+def test_parse_free_command(text, expected):
+    assert parse_free_command(text, NOW) == expected
+
+
+@pytest.mark.parametrize("text", ["空き 2025/02/30", "空き 2025/13/45", "空き 2025/01/10-2025/02/30"])
+def test_invalid_date_is_explained(text):
+    with pytest.raises(ValueError) as error:
+        parse_free_command(text, NOW)
+
+    message = free_error_message(error.value)
+    assert "存在しない日付です" in message
+    assert message.endswith(FREE_USAGE_TEXT)
+    assert "out of range" not in message and "must be in" not in message
+
+
+@pytest.mark.parametrize("text, fragment", [
+    ("空き 明日", FREE_USAGE_TEXT),
+    ("空き 0分", "空きの長さは"),
+    ("空き 20時間", "空きの長さは"),
+    ("空き 2025/01/19-2025/01/13", "終了日は開始日以降"),
+    ("空き 2025/01/01-2025/03/01", "31日分まで"),
+    ("空き 2025/01/01-2026/03/01 1時間", "366日分まで"),
+])
+def test_invalid_command_is_explained(text, fragment):
+    with pytest.raises(ValueError) as error:
+        parse_free_command(text, NOW)
+    assert fragment in free_error_message(error.value)
@@ -0,0 +1,60 @@
+"""
+区間インデックスの重複チェックが、インデックス未読み込み時のSQLと同じ予約を返すことを、ランダムな予約の集合で確かめる
+"""
+import random
+from datetime import datetime, timedelta
+
+BASE = datetime(2030, 1, 1, 7, 0)
+STEP = timedelta(minutes=15)
+
+
+def random_span(rng: random.Random) -> tuple[datetime, datetime]:
+    """15分刻みの区間（長さ0や終了が開始より前の区間もまれに混ぜる）"""
+    start = BASE + STEP * rng.randrange(0, 400)
+    length = rng.choice([0, -1] + [rng.randrange(1, 12)] * 18)
+    return start, start + STEP * length
+
+
+def mutate(db, rng: random.Random, ids: list[int]):
+    """予約をいくつか作成・削除する（重なりを気にせず作る）"""
+    for _ in range(rng.randrange(5, 20)):
+        if ids and rng.random() < 0.3:
+            reservation_id = ids.pop(rng.randrange(len(ids)))
+            assert db.delete_reservation(reservation_id, "U1") is not None
+        else:
+            start, end = random_span(rng)
+            ids.append(db.create_reservation("U1", "user1", "C1", "meeting", start, end, 15))
+
+
+def answer(conflict) -> int | None:
+    return conflict.id if conflict is not None else None
+
+
+def test_find_conflict_matches_sql(db):
+    rng = random.Random(20300101)
+    ids: list[int] = []
+    checked = 0
+
+    for _ in range(30):
+        mutate(db, rng, ids)
+        queries = []
+        for _ in range(100):
+            start, end = random_span(rng)
+            exclude_id = rng.choice(ids) if ids and rng.random() < 0.5 else None
+            queries.append((start, end, exclude_id))
+
+        assert db._interval_index.loaded
+        indexed = [answer(db.check_conflict(*q)) for q in queries]
+
+        # インデックスを捨て、SQLでの判定に切り替えて同じ問い合わせをする
+        db._interval_index.clear()
+        try:
+            expected = [answer(db.check_conflict(*q)) for q in queries]
+        finally:
+            db.load_interval_index()
+
+        for query, got, want in zip(queries, indexed, expected):
+            assert got == want, f"query={query} index={got} sql={want}"
+        checked += len(queries)
+
+    assert checked == 3000
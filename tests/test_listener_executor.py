@@ -0,0 +1,94 @@
+"""
+優先度付きのスレッドプール（PriorityExecutor）が、優先度ごとのキューの上限で受け付けを判定し、
+優先度順に実行し、ackの期限を過ぎたタスクを実行しないことを確かめる
+"""
+import threading
+import time
+
+import pytest
+
+from listener_executor import (
+    INTERACTIVE,
+    READ,
+    SUBMISSION,
+    PriorityExecutor,
+    use_priority,
+)
+from metrics import EXECUTOR_SHED
+
+
+@pytest.fixture
+def blocked():
+    """1スレッドのプール（キューの上限4）と、そのスレッドを塞いでいるタスクを解放するEvent"""
+    executor = PriorityExecutor("test", 1, 4)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(10)
+
+    executor.submit_priority(SUBMISSION, block)
+    assert started.wait(5)
+    yield executor, release
+    release.set()
+    use_priority(READ, None)
+    executor.shutdown()
+
+
+def test_admission_by_priority(blocked):
+    executor, _ = blocked
+    admitted = []
+    for _ in range(5):
+        admitted.append([executor.accepts(p) for p in (SUBMISSION, INTERACTIVE, READ)])
+        executor.submit_priority(SUBMISSION, lambda: None)
+
+    # 上限4に対して、読み取りは2件、ボタン・選択肢は3件、モーダルの送信は4件の待ちまで受け付ける
+    assert admitted == [
+        [True, True, True],
+        [True, True, True],
+        [True, True, False],
+        [True, False, False],
+        [False, False, False],
+    ]
+
+
+def test_shed_is_counted(blocked):
+    executor, _ = blocked
+    child = EXECUTOR_SHED.labels("test", "read", "busy")
+    before = child.value()
+    executor.shed(READ)
+    assert child.value() == before + 1
+
+
+def test_runs_in_priority_order(blocked):
+    executor, release = blocked
+    order = []
+    futures = [
+        executor.submit_priority(priority, order.append, name)
+        for priority, name in [(READ, "read 1"), (INTERACTIVE, "button"), (SUBMISSION, "submit 1"),
+                               (READ, "read 2"), (SUBMISSION, "submit 2")]
+    ]
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert order == ["submit 1", "submit 2", "button", "read 1", "read 2"]
+
+
+def test_task_past_deadline_is_skipped(blocked):
+    executor, release = blocked
+    calls = []
+    expired = EXECUTOR_SHED.labels("test", "interactive", "expired")
+    before = expired.value()
+
+    use_priority(INTERACTIVE, time.perf_counter() + 0.05)
+    late = executor.submit(calls.append, "late")
+    use_priority(INTERACTIVE, time.perf_counter() + 60)
+    in_time = executor.submit(calls.append, "in time")
+
+    time.sleep(0.1)
+    release.set()
+    assert in_time.result(timeout=5) is None
+    assert late.cancelled()
+    assert calls == ["in time"]
+    assert expired.value() == before + 1
@@ -0,0 +1,128 @@
+"""
+スキーマの移行（init_db・_MIGRATIONS）を、版の管理より前の日時を文字列で持つDBに対して行い、
+日時の列が整数の秒になり、日付の番号の列・インデックスがそろうこと、2回目のinit_dbでは何もしないことを確かめる
+"""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from epoch import DAY_SECONDS, to_epoch
+
+RESERVATIONS = 23
+
+
+@pytest.fixture
+def baseline_db(tmp_path, monkeypatch):
+    """版の管理より前のスキーマ（日時はISO形式の文字列）に予約を入れたDBファイルと、入れた予約の一覧"""
+    import database
+
+    path = str(tmp_path / "reservations.db")
+    monkeypatch.setenv("DATABASE_PATH", path)
+    monkeypatch.setattr(database, "DATABASE_PATH", path)
+    # 予約の表を複数のトランザクションに分けて変換する経路も通す
+    monkeypatch.setattr(database, "_MIGRATION_BATCH", 5)
+    database.close_connections()
+
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            user_name TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            event_name TEXT NOT NULL,
+            start_time DATETIME NOT NULL,
+            end_time DATETIME NOT NULL,
+            reminder_minutes INTEGER DEFAULT 15,
+            reminder_sent BOOLEAN DEFAULT FALSE,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX idx_start_time ON reservations(start_time);
+        CREATE INDEX idx_user_id ON reservations(user_id);
+    """)
+    rows = []
+    for i in range(RESERVATIONS):
+        start = datetime(2030, 1, 1, 9, 0) + timedelta(days=i // 3, hours=3 * (i % 3), minutes=15)
+        end = start + timedelta(minutes=45)
+        rows.append((f"U{i % 4}", f"user{i % 4}", "C1", f"meeting {i}", start, end, 5 * (i % 4)))
+    conn.executemany("""
+        INSERT INTO reservations (user_id, user_name, channel_id, event_name, start_time, end_time, reminder_minutes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(*r[:4], r[4].isoformat(), r[5].isoformat(), r[6]) for r in rows])
+    conn.commit()
+    conn.close()
+
+    yield database, rows
+    database.close_connections()
+
+
+def schema(conn) -> list[tuple]:
+    return conn.execute("SELECT type, name, tbl_name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+
+
+def test_baseline_schema_is_migrated(baseline_db, capsys):
+    database, rows = baseline_db
+
+    database.init_db()
+    assert capsys.readouterr().out.count("Migrating database schema") == 3
+
+    conn = database.get_connection()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 3
+
+    stored = conn.execute("""
+        SELECT start_time, end_time, remind_at, day, typeof(start_time), typeof(end_time), typeof(remind_at)
+        FROM reservations ORDER BY id
+    """).fetchall()
+    assert len(stored) == RESERVATIONS
+    for (_, _, _, _, start, end, minutes), row in zip(rows, stored):
+        assert tuple(row[4:]) == ("integer", "integer", "integer")
+        assert row["start_time"] == to_epoch(start)
+        assert row["end_time"] == to_epoch(end)
+        assert row["remind_at"] == to_epoch(start - timedelta(minutes=minutes))
+        assert row["day"] == to_epoch(start) // DAY_SECONDS
+
+    indexes = {
+        row["name"] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'reservations' AND sql IS NOT NULL"
+        )
+    }
+    assert indexes == {"idx_start_end", "idx_day", "idx_user_start", "idx_remind_at"}
+    plan = " ".join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM reservations WHERE day BETWEEN ? AND ? ORDER BY day, start_time", (0, 1)
+    ))
+    assert "idx_day" in plan
+
+    # 変換のUPDATEは変更履歴に残らない
+    assert conn.execute("SELECT COUNT(*) FROM reservation_changes").fetchone()[0] == 0
+
+    # 移行後の読み書き
+    first = database.get_reservation(1)
+    assert (first.start_time, first.end_time, first.event_name) == (rows[0][4], rows[0][5], "meeting 0")
+    assert [r.event_name for r in database.get_reservations_by_date("2030-01-02")] == [
+        "meeting 3", "meeting 4", "meeting 5"
+    ]
+    assert database.check_conflict(rows[0][4], rows[0][5]).id == 1
+    new_id = database.create_reservation("U9", "user9", "C1", "new", rows[0][5], rows[0][5] + timedelta(hours=1))
+    assert database.get_reservation(new_id).start_time == rows[0][5]
+
+
+def test_second_init_db_is_a_no_op(baseline_db, capsys):
+    database, _ = baseline_db
+
+    database.init_db()
+    conn = database.get_connection()
+    before = schema(conn)
+    data = conn.execute("SELECT * FROM reservations ORDER BY id").fetchall()
+    changes = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM reservation_changes").fetchone()[0]
+    capsys.readouterr()
+
+    database.close_connections()
+    database.init_db()
+
+    conn = database.get_connection()
+    assert "Migrating" not in capsys.readouterr().out
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 3
+    assert schema(conn) == before
+    assert [tuple(r) for r in conn.execute("SELECT * FROM reservations ORDER BY id")] == [tuple(r) for r in data]
+    assert conn.execute("SELECT COALESCE(MAX(seq), 0) FROM reservation_changes").fetchone()[0] == changes
@@ -0,0 +1,52 @@
+"""
+outboxのゲージが、メトリクスの出力1回につき1回のDB問い合わせで同じ時点の値を出すことを確かめる
+"""
+import math
+import time
+
+import metrics
+import outbox
+from outbox import outbox_message
+
+
+def gauge_lines(text: str) -> dict:
+    """出力から bot_outbox_pending などラベルなしのゲージの値を取り出す"""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("bot_outbox_") and " " in line and "{" not in line:
+            name, value = line.split(" ")
+            values[name] = float(value)
+    return values
+
+
+def test_one_stats_query_per_scrape(db, monkeypatch):
+    calls = []
+    get_outbox_stats = db.get_outbox_stats
+
+    def counted():
+        calls.append(1)
+        return get_outbox_stats()
+
+    monkeypatch.setattr(db, "get_outbox_stats", counted)
+
+    db.enqueue_messages([outbox_message("notice", "C1", f"message {i}", time.time() - 30) for i in range(3)])
+    values = gauge_lines(metrics.render())
+
+    assert len(calls) == 1
+    assert values["bot_outbox_pending"] == 3
+    assert values["bot_outbox_oldest_age_seconds"] >= 30
+    assert values["bot_outbox_dead"] == 0
+
+    metrics.render()
+    assert len(calls) == 2
+
+
+def test_stats_failure_reports_nan(db, monkeypatch):
+    def broken():
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(db, "get_outbox_stats", broken)
+    outbox.collect_outbox_stats()
+
+    for gauge in (metrics.OUTBOX_PENDING, metrics.OUTBOX_OLDEST_AGE, metrics.OUTBOX_DEAD):
+        assert math.isnan(gauge.value())
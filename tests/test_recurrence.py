@@ -0,0 +1,170 @@
+"""
+繰り返しの規則（Recurrence）の回の生成・重なりの判定を、各回を1つずつ並べる素朴な実装と比べ、
+繰り返し予約の作成（reserve_series_if_free）・回のキャンセル（cancel_occurrence）の結果を確かめる
+"""
+import random
+from datetime import date, datetime, timedelta
+
+from recurrence import FREQUENCIES, Recurrence
+
+BASE = datetime(2030, 1, 7, 9, 0)
+STEP = timedelta(minutes=30)
+
+# 素朴な実装で並べる範囲（どの規則も間隔の最小公倍数は14日なので十分に長い）
+HORIZON = timedelta(days=90)
+
+
+def random_rule(rng: random.Random) -> Recurrence:
+    """30分刻みの初回から、数時間〜2日の長さで繰り返す規則（回数の上限・除外する回もランダム）"""
+    frequency = rng.choice(list(FREQUENCIES))
+    start = BASE + STEP * rng.randrange(0, 48 * 20)
+    end = start + STEP * rng.choice([1, 2, 3, 8, 48, 96])
+    step = timedelta(days=FREQUENCIES[frequency])
+    last = start + step * rng.randrange(0, 12) if rng.random() < 0.7 else None
+    skip = [start + step * k for k in range(12) if rng.random() < 0.2]
+    return Recurrence(start, end, frequency, last, skip)
+
+
+def brute_occurrences(rule: Recurrence, include_skipped: bool = False) -> list[tuple[datetime, datetime]]:
+    """初回からHORIZONまでの回をすべて並べる"""
+    found = []
+    start = rule.start
+    while start < rule.start + HORIZON and (rule.last is None or start <= rule.last):
+        if include_skipped or start not in rule.skip:
+            found.append((start, start + rule.duration))
+        start += rule.step
+    return found
+
+
+def brute_first_overlap(rule: Recurrence, start: datetime, end: datetime, include_skipped: bool = False):
+    for s, e in brute_occurrences(rule, include_skipped):
+        if s < end and e > start:
+            return s, e
+    return None
+
+
+def test_occurrences_match_brute_force():
+    rng = random.Random(1)
+    for _ in range(500):
+        rule = random_rule(rng)
+        include_skipped = rng.random() < 0.5
+        after = BASE + STEP * rng.randrange(-48, 48 * 40)
+        before = after + STEP * rng.randrange(0, 48 * 30)
+
+        expected = [
+            (s, e) for s, e in brute_occurrences(rule, include_skipped)
+            if e > after and s < before
+        ]
+        assert list(rule.occurrences(after, before, include_skipped)) == expected
+
+
+def test_first_overlap_matches_brute_force():
+    rng = random.Random(2)
+    for _ in range(2000):
+        rule = random_rule(rng)
+        start = BASE + STEP * rng.randrange(-48, 48 * 40)
+        end = start + STEP * rng.randrange(1, 200)
+        assert rule.first_overlap(start, end) == brute_first_overlap(rule, start, end)
+        assert rule.first_overlap(start, end, True) == brute_first_overlap(rule, start, end, True)
+
+
+def test_overlap_with_matches_brute_force():
+    rng = random.Random(3)
+    overlapping = 0
+    for _ in range(1000):
+        rule, other = random_rule(rng), random_rule(rng)
+        expected = None
+        for s, e in brute_occurrences(rule, include_skipped=True):
+            expected = brute_first_overlap(other, s, e, include_skipped=True)
+            if expected:
+                break
+        assert rule.overlap_with(other) == expected
+        overlapping += expected is not None
+
+    # 重なる組・重ならない組の両方を十分に調べている
+    assert 100 < overlapping < 900
+
+
+def future_day() -> date:
+    return date.today() + timedelta(days=10)
+
+
+def series_days(db, series_id: int, first: date, last: date) -> list[date]:
+    """シリーズの残っている回の日付"""
+    return [
+        day for day, reservations in db.iter_reservations_between(first, last)
+        for r in reservations if r.series_id == series_id
+    ]
+
+
+def test_reserve_series_if_free(db):
+    day = future_day()
+    start = datetime.combine(day, datetime.min.time()).replace(hour=10)
+    end = start + timedelta(hours=1)
+
+    # 4回目に重なる単発の予約
+    single = db.create_reservation("U1", "user1", "C1", "single", start + timedelta(days=3, minutes=30), end + timedelta(days=3), 15)
+    series, conflict = db.reserve_series_if_free("U2", "user2", "C1", "daily", start, end, "daily", count=5)
+    assert series is None and conflict.id == single
+    series, conflict = db.reserve_series_if_free("U2", "user2", "C1", "daily", start, end, "daily", count=3)
+    assert conflict is None
+    assert series_days(db, series["id"], day, day + timedelta(days=10)) == [day + timedelta(days=i) for i in range(3)]
+
+    # 他のシリーズとの重なり（隔週の2回目が毎日の3回目と重なる）
+    weekly, conflict = db.reserve_series_if_free(
+        "U3", "user3", "C1", "weekly", start - timedelta(days=12, minutes=30), end - timedelta(days=12), "biweekly"
+    )
+    assert weekly is None
+    assert conflict.series_id == series["id"] and conflict.start_time == start + timedelta(days=2)
+
+    # 個別にキャンセルした回も、他のシリーズとの重なりとみなす
+    assert db.cancel_occurrence(series["id"], "U2", start + timedelta(days=2))
+    weekly, conflict = db.reserve_series_if_free(
+        "U3", "user3", "C1", "weekly", start - timedelta(days=12, minutes=30), end - timedelta(days=12), "biweekly"
+    )
+    assert weekly is None and conflict.series_id == series["id"]
+
+    # 単発の予約は重ならない時刻なら作成できる
+    assert db.reserve_if_free("U1", "user1", "C1", "after", end, end + timedelta(hours=1), 15)[1] is None
+    assert db.check_conflict(start + timedelta(days=1), end + timedelta(days=1)).series_id == series["id"]
+
+
+def test_cancel_following(db):
+    day = future_day()
+    start = datetime.combine(day, datetime.min.time()).replace(hour=14)
+    last_day = day + timedelta(days=10)
+
+    def create(name: str) -> dict:
+        series, conflict = db.reserve_series_if_free(
+            "U1", "user1", "C1", name, start, start + timedelta(hours=1), "daily", count=5, reminder_minutes=15
+        )
+        assert conflict is None
+        return series
+
+    # 初回からならシリーズごと削除
+    series = create("first")
+    cancelled = db.cancel_occurrence(series["id"], "U1", start, following=True)
+    assert cancelled.start_time == start and cancelled.next_remind_at is None
+    assert db.get_series(series["id"]) is None
+    assert series_days(db, series["id"], day, last_day) == []
+
+    # 途中の回からならその前の回まで残る
+    series = create("middle")
+    cancelled = db.cancel_occurrence(series["id"], "U1", start + timedelta(days=2), following=True)
+    assert cancelled.next_remind_at == start - timedelta(minutes=15)
+    assert db.get_series(series["id"])["last_start"] is not None
+    assert series_days(db, series["id"], day, last_day) == [day, day + timedelta(days=1)]
+    # キャンセルした回の枠は空く
+    assert db.check_conflict(start + timedelta(days=2), start + timedelta(days=2, hours=1)) is None
+    assert db.cancel_occurrence(series["id"], "U1", start + timedelta(days=3), following=True) is None
+    db.cancel_occurrence(series["id"], "U1", start, following=True)
+
+    # 最後の回だけなら残りの4回はそのまま
+    series = create("last")
+    cancelled = db.cancel_occurrence(series["id"], "U1", start + timedelta(days=4), following=True)
+    assert cancelled.start_time == start + timedelta(days=4)
+    assert series_days(db, series["id"], day, last_day) == [day + timedelta(days=i) for i in range(4)]
+
+    # 本人以外・存在しない回はキャンセルできない
+    assert db.cancel_occurrence(series["id"], "U2", start, following=True) is None
+    assert db.cancel_occurrence(series["id"], "U1", start + timedelta(minutes=30), following=True) is None
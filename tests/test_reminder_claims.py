@@ -0,0 +1,146 @@
+"""
+リマインダーのoutboxへの積み込み（queue_due_reminders）と送信の確保（claim_outbox_messages）を、
+spawnで起動した複数のプロセスから同じDBファイルに対して行い、各リマインダーがちょうど1回送られることを確かめる。
+確保したまま落ちたプロセスの分が、確保の期限の後に他のプロセスから送られることも確かめる
+"""
+import multiprocessing
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+PROCESSES = 4
+RESERVATIONS = 300
+SERIES = 3
+
+
+def reminder_text(r) -> str:
+    return r.event_name
+
+
+def open_database(path: str):
+    """spawnしたプロセスでpathのDBを使う"""
+    os.environ["DATABASE_PATH"] = path
+    import database
+
+    database.DATABASE_PATH = path
+    database.init_db()
+    return database
+
+
+def drain_worker(path: str, owner: str, log_path: str, timeout: float):
+    """リマインダーを積み、確保したメッセージを「送信」（ファイルに記録）して完了にする。積む・送るものがなくなったら終わる"""
+    database = open_database(path)
+    deadline = time.monotonic() + timeout
+    with open(log_path, "a", encoding="utf-8") as log:
+        while time.monotonic() < deadline:
+            queued = database.queue_due_reminders(reminder_text, 5)
+            messages = database.claim_outbox_messages(owner, 30, 5)
+            for m in messages:
+                log.write(m["text"] + "\n")
+            log.flush()
+            database.complete_outbox_messages([m["id"] for m in messages])
+            if not queued and not messages and not database.get_outbox_stats()["pending"]:
+                break
+    database.close_connections()
+
+
+def crash_worker(path: str, owner: str, ttl: float, claimed):
+    """メッセージを確保したまま送らずに止まる（親プロセスがkillする）"""
+    database = open_database(path)
+    claimed.put(len(database.claim_outbox_messages(owner, ttl, 1000)))
+    time.sleep(600)
+
+
+def seed_due_reminders(db, prefix: str) -> set[str]:
+    """リマインドの時刻を過ぎた予約と繰り返し予約を作り、送られるべきメッセージの一覧を返す"""
+    now = datetime.now().replace(microsecond=0)
+    expected = set()
+    for i in range(RESERVATIONS):
+        start = now + timedelta(minutes=5, seconds=i)
+        db.create_reservation("U1", "user1", "C1", f"{prefix} {i}", start, start + timedelta(seconds=1), 15)
+        expected.add(f"{prefix} {i}")
+    for k in range(SERIES):
+        start = now + timedelta(minutes=12, seconds=k)
+        series, conflict = db.reserve_series_if_free(
+            "U1", "user1", "C1", f"{prefix} series {k}", start, start + timedelta(seconds=1), "daily",
+            count=3, reminder_minutes=15,
+        )
+        assert conflict is None
+        expected.add(f"{prefix} series {k}")
+    return expected
+
+
+def posted_lines(paths) -> Counter:
+    lines = Counter()
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                lines.update(line.rstrip("\n") for line in f)
+    return lines
+
+
+def test_each_reminder_is_posted_exactly_once(db, tmp_path):
+    expected = seed_due_reminders(db, "meeting")
+    spawn = multiprocessing.get_context("spawn")
+    logs = [str(tmp_path / f"posted-{i}.log") for i in range(PROCESSES)]
+    workers = [
+        spawn.Process(target=drain_worker, args=(db.DATABASE_PATH, f"worker-{i}", logs[i], 60))
+        for i in range(PROCESSES)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=90)
+        assert worker.exitcode == 0
+
+    posted = posted_lines(logs)
+    assert set(posted) == expected
+    assert [text for text, count in posted.items() if count != 1] == []
+    assert db.get_pending_reminders() == []
+    assert db.get_outbox_stats()["pending"] == 0
+
+
+def test_claims_of_a_killed_worker_are_sent_after_ttl(db, tmp_path):
+    expected = seed_due_reminders(db, "orphan")
+    while db.queue_due_reminders(reminder_text, 100):
+        pass
+
+    ttl = 3.0
+    spawn = multiprocessing.get_context("spawn")
+    claimed = spawn.Queue()
+    crashed = spawn.Process(target=crash_worker, args=(db.DATABASE_PATH, "crashed", ttl, claimed))
+    crashed.start()
+    try:
+        assert claimed.get(timeout=60) == len(expected)
+    finally:
+        crashed.kill()
+        crashed.join()
+
+    # 確保の期限までは他のプロセスから確保できない
+    assert db.claim_outbox_messages("survivor", 30, 1000) == []
+
+    time.sleep(ttl + 0.2)
+    log = str(tmp_path / "survivor.log")
+    survivor = spawn.Process(target=drain_worker, args=(db.DATABASE_PATH, "survivor", log, 60))
+    survivor.start()
+    survivor.join(timeout=90)
+    assert survivor.exitcode == 0
+
+    posted = posted_lines([log])
+    assert set(posted) == expected
+    assert [text for text, count in posted.items() if count != 1] == []
+    assert db.get_outbox_stats()["pending"] == 0
+
+
+def test_reminder_marked_sent_is_not_queued(db):
+    now = datetime.now().replace(microsecond=0)
+    start = now + timedelta(minutes=5)
+    sent = db.create_reservation("U1", "user1", "C1", "sent", start, start + timedelta(minutes=30), 15)
+    db.create_reservation("U1", "user1", "C1", "due", start + timedelta(hours=1), start + timedelta(hours=2), 90)
+
+    db.mark_reminder_sent(sent)
+
+    assert [r.event_name for r in db.get_pending_reminders()] == ["due"]
+    assert db.queue_due_reminders(reminder_text, 100) == 1
+    assert [m["text"] for m in db.claim_outbox_messages("worker", 30, 10)] == ["due"]
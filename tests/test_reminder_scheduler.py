@@ -0,0 +1,80 @@
+"""
+リマインダーのスケジューラで、コールバックが失敗した送信時刻が失われずに再送されることを確かめる
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import reminder_scheduler
+from reminder_scheduler import AsyncReminderScheduler, ReminderScheduler
+
+RETRY_SECONDS = 0.2
+
+
+def test_failed_callback_is_retried(monkeypatch):
+    monkeypatch.setattr(reminder_scheduler, "REMINDER_RETRY_SECONDS", RETRY_SECONDS)
+    calls = []
+    sent = threading.Event()
+
+    def send():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        sent.set()
+
+    scheduler = ReminderScheduler(send)
+    scheduler.schedule(1, datetime.now())
+    threading.Thread(target=scheduler.run, daemon=True).start()
+
+    assert sent.wait(5)
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= RETRY_SECONDS * 0.9
+    assert len(scheduler) == 0
+
+
+def test_failed_callback_keeps_reminder_until_retry(monkeypatch):
+    monkeypatch.setattr(reminder_scheduler, "REMINDER_RETRY_SECONDS", 60)
+    failed = threading.Event()
+
+    def send():
+        failed.set()
+        raise RuntimeError("database is locked")
+
+    scheduler = ReminderScheduler(send)
+    scheduler.schedule(1, datetime.now())
+    scheduler.schedule(-2, datetime.now())
+    threading.Thread(target=scheduler.run, daemon=True).start()
+
+    assert failed.wait(5)
+    deadline = time.monotonic() + 5
+    while len(scheduler) != 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(scheduler) == 2
+
+
+def test_async_failed_callback_is_retried(monkeypatch):
+    monkeypatch.setattr(reminder_scheduler, "REMINDER_RETRY_SECONDS", RETRY_SECONDS)
+
+    async def main():
+        calls = []
+        sent = asyncio.Event()
+
+        async def send():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RuntimeError("database is locked")
+            sent.set()
+
+        scheduler = AsyncReminderScheduler(send)
+        scheduler.schedule(1, datetime.now())
+        task = asyncio.create_task(scheduler.run())
+        try:
+            await asyncio.wait_for(sent.wait(), 5)
+        finally:
+            task.cancel()
+        assert len(calls) == 2
+        assert calls[1] - calls[0] >= RETRY_SECONDS * 0.9
+        assert len(scheduler) == 0
+
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""
+同じ時間帯を狙った予約の同時送信で、重なる予約が保存されないことを確かめる
+このプロセスのスレッドプールと、spawnで起動した複数のプロセス（それぞれスレッドプール）から同じDBファイルに書き込む
+"""
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+BASE = datetime(2030, 1, 15, 9, 0)
+STEP = timedelta(minutes=15)
+
+PROCESSES = 4
+THREADS = 8
+CALLS = 100
+
+
+def attempt(database, rng: random.Random, user: str, window: int) -> bool:
+    """window日目の2時間の中の15分刻みの区間を1件予約する（作成できたらTrue）
+
+    どのスレッド・プロセスも同じ順に日を進めるため、同じ空いている時間帯を同時に取り合う。
+    """
+    start = BASE + timedelta(days=window) + STEP * rng.randrange(0, 8)
+    end = start + STEP * rng.randrange(1, 5)
+    reservation_id, conflict = database.reserve_if_free(user, user, "C1", "meeting", start, end, 15)
+    assert (reservation_id is None) != (conflict is None)
+    return reservation_id is not None
+
+
+def run_threads(database, seed: int, user: str) -> int:
+    """THREADS並列でCALLS回予約を試み、作成できた件数を返す"""
+    def call(i: int) -> bool:
+        return attempt(database, random.Random(seed * 100003 + i), user, i // THREADS)
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return sum(pool.map(call, range(CALLS)))
+
+
+def process_worker(path: str, seed: int) -> int:
+    """spawnしたプロセスで同じDBファイルに予約する"""
+    os.environ["DATABASE_PATH"] = path
+    import database
+
+    database.DATABASE_PATH = path
+    database.init_db()
+    try:
+        return run_threads(database, seed, f"P{seed}")
+    finally:
+        database.close_connections()
+
+
+def test_parallel_overlapping_reservations_never_overlap(db):
+    path = db.DATABASE_PATH
+    with ProcessPoolExecutor(max_workers=PROCESSES, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(process_worker, path, seed) for seed in range(1, PROCESSES + 1)]
+        created = run_threads(db, 0, "T0")
+        created += sum(f.result(timeout=120) for f in futures)
+
+    rows = db.get_connection().execute(
+        "SELECT id, start_time, end_time FROM reservations ORDER BY start_time, end_time"
+    ).fetchall()
+    assert created == len(rows) > 0
+
+    for previous, current in zip(rows, rows[1:]):
+        assert current["start_time"] >= previous["end_time"], (
+            f"reservations {previous['id']} and {current['id']} overlap"
+        )
@@ -0,0 +1,141 @@
+"""
+空き枠のビットマップのビット演算（free_runs・first_run・day_masks）を1枠ずつ調べる素朴な実装と比べ、
+予約の作成・削除のたびに更新したビットマップが、SQLで読み直した空き状況と一致することを確かめる
+"""
+import random
+from datetime import date, datetime, timedelta
+
+from epoch import to_epoch
+from slot_bitmap import (
+    FULL_DAY,
+    SLOTS_PER_DAY,
+    SlotBitmap,
+    day_masks,
+    first_run,
+    free_runs,
+    slot_start,
+)
+
+BASE = datetime(2030, 1, 1, 6, 0)
+STEP = timedelta(minutes=10)
+
+
+def random_bits(rng: random.Random) -> int:
+    """ほぼ空き・ほぼ埋まり・ランダムを混ぜた1日分のビット"""
+    density = rng.choice([0.1, 0.5, 0.9])
+    return sum(1 << i for i in range(SLOTS_PER_DAY) if rng.random() < density)
+
+
+def brute_runs(free: int) -> list[tuple[int, int]]:
+    runs = []
+    i = 0
+    while i < SLOTS_PER_DAY:
+        if free >> i & 1:
+            j = i
+            while j < SLOTS_PER_DAY and free >> j & 1:
+                j += 1
+            runs.append((i, j))
+            i = j
+        else:
+            i += 1
+    return runs
+
+
+def brute_first_run(free: int, slots: int):
+    for first, last in brute_runs(free):
+        if last - first >= slots:
+            return first
+    return None
+
+
+def brute_day_masks(start: datetime, end: datetime) -> dict[int, int]:
+    masks = {}
+    for ordinal in range(start.date().toordinal(), end.date().toordinal() + 1):
+        day = date.fromordinal(ordinal)
+        bits = 0
+        for slot in range(SLOTS_PER_DAY):
+            if start < slot_start(day, slot + 1) and end > slot_start(day, slot):
+                bits |= 1 << slot
+        if bits:
+            masks[ordinal] = bits
+    return masks
+
+
+def random_span(rng: random.Random) -> tuple[datetime, datetime]:
+    """10分刻みの区間（枠の途中で始まる・終わるもの、日をまたぐもの、長さ0のものを含む）"""
+    start = BASE + STEP * rng.randrange(0, 6 * 24 * 4)
+    return start, start + STEP * rng.choice([0, 1, 2, 3, 6, 9, 12, 30, 150])
+
+
+def test_free_runs_and_first_run_match_brute_force():
+    rng = random.Random(1)
+    samples = [0, FULL_DAY, 1, 1 << (SLOTS_PER_DAY - 1)] + [random_bits(rng) for _ in range(2000)]
+    for free in samples:
+        assert free_runs(free) == brute_runs(free), bin(free)
+        for slots in range(1, SLOTS_PER_DAY + 1):
+            assert first_run(free, slots) == brute_first_run(free, slots), (bin(free), slots)
+
+
+def test_day_masks_match_brute_force():
+    rng = random.Random(2)
+    for _ in range(2000):
+        start, end = random_span(rng)
+        assert day_masks(start, end) == brute_day_masks(start, end), (start, end)
+
+
+def test_incremental_bitmap_matches_rebuild():
+    rng = random.Random(3)
+    spans = {}
+    bitmap = SlotBitmap()
+    bitmap.load([])
+    next_id = 1
+    first_day, last_day = BASE.date(), BASE.date() + timedelta(days=5)
+
+    for _ in range(500):
+        action = rng.random()
+        if spans and action < 0.25:
+            rid = rng.choice(list(spans))
+            del spans[rid]
+            bitmap.remove(rid)
+        elif spans and action < 0.3:
+            removed = rng.sample(list(spans), min(len(spans), rng.randrange(1, 5)))
+            for rid in removed:
+                del spans[rid]
+            bitmap.remove_many(removed)
+        elif spans and action < 0.4:
+            # 登録済みの予約の置き換え
+            rid = rng.choice(list(spans))
+            spans[rid] = random_span(rng)
+            bitmap.add(rid, *spans[rid])
+        else:
+            spans[next_id] = random_span(rng)
+            bitmap.add(next_id, *spans[next_id])
+            next_id += 1
+
+        rebuilt = SlotBitmap()
+        rebuilt.load([(rid, to_epoch(s), to_epoch(e)) for rid, (s, e) in spans.items()])
+        assert bitmap.busy(first_day, last_day) == rebuilt.busy(first_day, last_day)
+
+
+def test_busy_slots_match_sql_after_changes(db):
+    rng = random.Random(4)
+    ids = []
+    first_day, last_day = BASE.date(), BASE.date() + timedelta(days=5)
+
+    for _ in range(20):
+        for _ in range(rng.randrange(5, 15)):
+            if ids and rng.random() < 0.3:
+                assert db.delete_reservation(ids.pop(rng.randrange(len(ids))), "U1") is not None
+            else:
+                ids.append(db.create_reservation("U1", "user1", "C1", "meeting", *random_span(rng), 15))
+
+        assert db._slot_bitmap.loaded
+        indexed = db.get_busy_slots(first_day, last_day)
+
+        # ビットマップを捨て、SQLで読み直した結果と比べる
+        db._slot_bitmap.clear()
+        try:
+            expected = db.get_busy_slots(first_day, last_day)
+        finally:
+            db.load_interval_index()
+        assert indexed == expected